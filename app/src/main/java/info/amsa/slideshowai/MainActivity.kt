@@ -74,6 +74,8 @@ class MainActivity : ComponentActivity() {
                                 photoDurationMillis = viewModel.getPhotoDurationMillis(),
                                 onBack = { navController.popBackStack() },
                                 onGetLocation = { file -> viewModel.getLocation(file) },
+                                onGetYear = { file -> viewModel.getPhotoYear(file) },
+                                thumbnailFor = { file -> viewModel.thumbnailFor(file) },
                                 onPhotoShown = { file -> viewModel.markPhotoAsShown(file) },
                                 onOrientationChanged = { isLandscape -> viewModel.updateOrientation(isLandscape) },
                                 currentIndex = viewModel.currentSlideshowIndex,
@@ -0,0 +1,76 @@
+package info.amsa.slideshowai.data
+
+import java.io.ByteArrayOutputStream
+import java.io.InputStream
+
+/**
+ * Buffered stream for the command protocol: JSON command lines, some followed by a raw
+ * binary payload. Lines and payload bytes are served from the same buffer, so command
+ * handlers must read payloads through this stream rather than the socket's own.
+ */
+class CommandInputStream(private val input: InputStream, bufferSize: Int = 64 * 1024) : InputStream() {
+
+    private val buffer = ByteArray(bufferSize)
+    private var pos = 0
+    private var count = 0
+
+    private fun fill(): Int {
+        pos = 0
+        count = 0
+        val n = input.read(buffer, 0, buffer.size)
+        if (n > 0) count = n
+        return n
+    }
+
+    // Reads a UTF-8 line ending with \n (not included). Returns null at end of stream.
+    fun readLine(): String? {
+        var line: ByteArrayOutputStream? = null
+        while (true) {
+            if (pos >= count && fill() == -1) {
+                return line?.takeIf { it.size() > 0 }?.toString(Charsets.UTF_8.name())
+            }
+            var i = pos
+            while (i < count && buffer[i] != '\n'.code.toByte()) i++
+            if (i < count) {
+                val result = if (line == null) {
+                    String(buffer, pos, i - pos, Charsets.UTF_8)
+                } else {
+                    line.write(buffer, pos, i - pos)
+                    line.toString(Charsets.UTF_8.name())
+                }
+                pos = i + 1
+                return result
+            }
+            // No newline in what's buffered yet; keep it and read more
+            if (line == null) line = ByteArrayOutputStream()
+            line.write(buffer, pos, count - pos)
+            pos = count
+        }
+    }
+
+    override fun read(): Int {
+        if (pos >= count && fill() == -1) return -1
+        return buffer[pos++].toInt() and 0xFF
+    }
+
+    override fun read(b: ByteArray, off: Int, len: Int): Int {
+        if (len == 0) return 0
+        val buffered = count - pos
+        if (buffered > 0) {
+            val n = minOf(buffered, len)
+            System.arraycopy(buffer, pos, b, off, n)
+            pos += n
+            return n
+        }
+        // Nothing buffered: large reads go straight to the socket, small ones refill the buffer
+        if (len >= buffer.size) return input.read(b, off, len)
+        if (fill() == -1) return -1
+        return read(b, off, len)
+    }
+
+    override fun available(): Int = (count - pos) + input.available()
+
+    override fun close() {
+        input.close()
+    }
+}
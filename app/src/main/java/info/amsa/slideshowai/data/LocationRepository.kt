@@ -13,6 +13,7 @@ import java.util.Locale
 
 class LocationRepository(private val context: Context) {
     private val dao = AppDatabase.getDatabase(context).photoLocationDao()
+    private val metadataDao = AppDatabase.getDatabase(context).photoMetadataDao()
 
     suspend fun getLocation(file: File): String? {
         return withContext(Dispatchers.IO) {
@@ -24,8 +25,17 @@ class LocationRepository(private val context: Context) {
                 return@withContext cachedLocation
             }
 
-            // Fetch from EXIF
-            val location = fetchLocationFromExif(file)
+            // Sync already read the EXIF: no position means no location, and a place
+            // another photo was named for needs no geocoding
+            val metadata = metadataDao.getMetadata(fileName)
+            val location = if (metadata != null) {
+                val latitude = metadata.latitude
+                val longitude = metadata.longitude
+                if (latitude == null || longitude == null) null
+                else metadata.placeKey?.let { metadataDao.getLocationForPlace(it) } ?: geocode(latitude, longitude)
+            } else {
+                fetchLocationFromExif(file)
+            }
             if (location != null) {
                 dao.insertLocation(PhotoLocation(fileName, location))
             }
@@ -60,9 +70,15 @@ class LocationRepository(private val context: Context) {
             }
 
             val validLatLong = latLong ?: return null
-            
-            val latitude = validLatLong[0]
-            val longitude = validLatLong[1]
+            return geocode(validLatLong[0], validLatLong[1])
+        } catch (e: Exception) {
+            e.printStackTrace()
+            return null
+        }
+    }
+
+    private fun geocode(latitude: Double, longitude: Double): String? {
+        try {
             val latLongStr = String.format("%.4f, %.4f", latitude, longitude)
 
             val geocoder = Geocoder(context, Locale.getDefault())
@@ -105,6 +121,10 @@ class LocationRepository(private val context: Context) {
         return dao.getAllLocations()
     }
 
+    suspend fun queryPage(query: TableQuery, after: TableQuery.Cursor?, limit: Int): List<PhotoLocation> {
+        return dao.queryLocations(query.page(after, limit))
+    }
+
     suspend fun clearAllLocations() {
         dao.deleteAllLocations()
     }
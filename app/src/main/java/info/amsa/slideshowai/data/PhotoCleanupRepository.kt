@@ -0,0 +1,18 @@
+package info.amsa.slideshowai.data
+
+import android.content.Context
+import info.amsa.slideshowai.data.database.AppDatabase
+import kotlinx.coroutines.Dispatchers
+import kotlinx.coroutines.withContext
+
+class PhotoCleanupRepository(context: Context) {
+    private val dao = AppDatabase.getDatabase(context).photoCleanupDao()
+
+    // Drops location, history, metadata and manifest records for many files in a single transaction
+    suspend fun deletePhotoRecords(fileNames: List<String>) {
+        if (fileNames.isEmpty()) return
+        withContext(Dispatchers.IO) {
+            dao.deletePhotoRecords(fileNames)
+        }
+    }
+}
@@ -25,6 +25,12 @@ class PhotoHistoryRepository(context: Context) {
         }
     }
 
+    suspend fun queryPage(query: TableQuery, after: TableQuery.Cursor?, limit: Int): List<PhotoHistory> {
+        return withContext(Dispatchers.IO) {
+            dao.queryHistory(query.page(after, limit))
+        }
+    }
+
     suspend fun updateLastShown(file: File) {
         withContext(Dispatchers.IO) {
             dao.insertHistory(PhotoHistory(file.name, System.currentTimeMillis()))
@@ -0,0 +1,89 @@
+package info.amsa.slideshowai.data
+
+import android.content.Context
+import info.amsa.slideshowai.data.database.AppDatabase
+import info.amsa.slideshowai.data.database.PhotoManifestEntry
+import kotlinx.coroutines.Dispatchers
+import kotlinx.coroutines.sync.Mutex
+import kotlinx.coroutines.sync.withLock
+import kotlinx.coroutines.withContext
+import java.io.File
+import java.security.MessageDigest
+
+// Tracks name, size and content hash of every photo, with a generation counter so
+// clients can ask for only what changed since their last sync.
+class PhotoManifestRepository(context: Context) {
+    private val dao = AppDatabase.getDatabase(context).photoManifestDao()
+    private val mutex = Mutex()
+
+    data class Changes(val generation: Long, val entries: List<PhotoManifestEntry>)
+
+    suspend fun recordFile(file: File, sha1: String) {
+        mutex.withLock {
+            val generation = dao.getMaxGeneration() + 1
+            dao.insertEntry(PhotoManifestEntry(file.name, file.length(), file.lastModified(), sha1, generation, false))
+        }
+    }
+
+    suspend fun recordDeleted(fileName: String) {
+        mutex.withLock {
+            val entry = dao.getEntry(fileName)
+            if (entry != null && !entry.deleted) {
+                dao.insertEntry(entry.copy(deleted = true, generation = dao.getMaxGeneration() + 1))
+            }
+        }
+    }
+
+    // Bring the manifest in line with the directory, for files that changed without going
+    // through the TCP commands (first run after upgrade, delete_all_files, etc.).
+    // Only files whose size or mtime differ are re-hashed.
+    suspend fun reconcile(dir: File, isImageFile: (String) -> Boolean) {
+        withContext(Dispatchers.IO) {
+            mutex.withLock {
+                val entries = dao.getAllEntries().associateBy { it.fileName }
+                val files = dir.listFiles()?.filter { isImageFile(it.name) } ?: emptyList()
+                var generation = dao.getMaxGeneration()
+
+                files.forEach { file ->
+                    val entry = entries[file.name]
+                    if (entry == null || entry.deleted || entry.size != file.length() || entry.lastModified != file.lastModified()) {
+                        generation++
+                        dao.insertEntry(PhotoManifestEntry(file.name, file.length(), file.lastModified(), sha1Of(file), generation, false))
+                    }
+                }
+
+                val present = files.map { it.name }.toSet()
+                entries.values.filter { !it.deleted && it.fileName !in present }.forEach { entry ->
+                    generation++
+                    dao.insertEntry(entry.copy(deleted = true, generation = generation))
+                }
+            }
+        }
+    }
+
+    // since <= 0 returns every live file; otherwise every entry (including tombstones) changed after it
+    suspend fun getChanges(since: Long): Changes {
+        return mutex.withLock {
+            val generation = dao.getMaxGeneration()
+            val entries = if (since <= 0) dao.getLiveEntries() else dao.getChangesSince(since)
+            Changes(generation, entries)
+        }
+    }
+
+    companion object {
+        fun sha1Of(file: File): String {
+            val digest = MessageDigest.getInstance("SHA-1")
+            file.inputStream().use { input ->
+                val buffer = ByteArray(64 * 1024)
+                while (true) {
+                    val count = input.read(buffer)
+                    if (count == -1) break
+                    digest.update(buffer, 0, count)
+                }
+            }
+            return toHex(digest.digest())
+        }
+
+        fun toHex(bytes: ByteArray): String = bytes.joinToString("") { "%02x".format(it) }
+    }
+}
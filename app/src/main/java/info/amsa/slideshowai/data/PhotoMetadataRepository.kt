@@ -0,0 +1,64 @@
+package info.amsa.slideshowai.data
+
+import android.content.Context
+import androidx.exifinterface.media.ExifInterface
+import info.amsa.slideshowai.data.database.AppDatabase
+import info.amsa.slideshowai.data.database.PhotoLocation
+import info.amsa.slideshowai.data.database.PhotoMetadata
+import kotlinx.coroutines.Dispatchers
+import kotlinx.coroutines.runBlocking
+import kotlinx.coroutines.withContext
+import java.io.File
+
+class PhotoMetadataRepository(context: Context) {
+    private val dao = AppDatabase.getDatabase(context).photoMetadataDao()
+
+    suspend fun storeMetadata(metadata: List<PhotoMetadata>, locations: List<PhotoLocation>) {
+        withContext(Dispatchers.IO) {
+            dao.storeMetadata(metadata, locations)
+        }
+    }
+
+    suspend fun getFileNames(): List<String> {
+        return withContext(Dispatchers.IO) {
+            dao.getFileNames()
+        }
+    }
+
+    // Synchronous version for filtering, like PhotoHistoryRepository.getAllHistorySync
+    fun getAllMetadataSync(): Map<String, PhotoMetadata> {
+        return runBlocking {
+            dao.getAllMetadata().associateBy { it.fileName }
+        }
+    }
+
+    // Year the photo was taken: from the synced metadata, else from the file's EXIF
+    suspend fun getYear(file: File): String? {
+        return withContext(Dispatchers.IO) {
+            val metadata = dao.getMetadata(file.name)
+            if (metadata != null) {
+                // ISO "yyyy-MM-ddTHH:mm:ss"
+                return@withContext metadata.dateTaken?.substringBefore('-')
+            }
+            try {
+                val exif = ExifInterface(file)
+                val dateString = exif.getAttribute(ExifInterface.TAG_DATETIME_ORIGINAL)
+                    ?: exif.getAttribute(ExifInterface.TAG_DATETIME)
+                // Format is usually "yyyy:MM:dd HH:mm:ss"
+                dateString?.split(":", " ")?.firstOrNull()
+            } catch (e: Exception) {
+                null
+            }
+        }
+    }
+
+    fun deleteMetadata(fileName: String) {
+        dao.deleteMetadata(fileName)
+    }
+
+    suspend fun clearAllMetadata() {
+        withContext(Dispatchers.IO) {
+            dao.deleteAllMetadata()
+        }
+    }
+}
@@ -8,6 +8,7 @@ import androidx.datastore.preferences.core.stringPreferencesKey
 import androidx.datastore.preferences.core.intPreferencesKey
 import androidx.datastore.preferences.preferencesDataStore
 import kotlinx.coroutines.flow.Flow
+import kotlinx.coroutines.flow.first
 import kotlinx.coroutines.flow.map
 
 val Context.dataStore: DataStore<Preferences> by preferencesDataStore(name = "settings")
@@ -19,6 +20,7 @@ class PreferencesRepository(private val context: Context) {
         val QUIET_HOURS_END_KEY = stringPreferencesKey("quiet_hours_end")
         val SMART_SHUFFLE_DAYS_KEY = intPreferencesKey("smart_shuffle_days")
         val PHOTO_DURATION_KEY = stringPreferencesKey("photo_duration")
+        val MANIFEST_EPOCH_KEY = stringPreferencesKey("manifest_epoch")
     }
 
     val quietHoursStart: Flow<String> = context.dataStore.data.map { it[QUIET_HOURS_START_KEY] ?: "22:00" }
@@ -26,6 +28,15 @@ class PreferencesRepository(private val context: Context) {
     val smartShuffleDays: Flow<Int> = context.dataStore.data.map { it[SMART_SHUFFLE_DAYS_KEY] ?: 30 }
     val photoDuration: Flow<String> = context.dataStore.data.map { it[PHOTO_DURATION_KEY] ?: "00:00:05" }
 
+    // Random id for this install's photo manifest. Change tokens from another epoch
+    // (e.g. before the app data was cleared) are not comparable and get a full listing.
+    suspend fun getManifestEpoch(): String {
+        context.dataStore.data.first()[MANIFEST_EPOCH_KEY]?.let { return it }
+        val epoch = java.util.UUID.randomUUID().toString().substring(0, 8)
+        context.dataStore.edit { preferences -> preferences[MANIFEST_EPOCH_KEY] = epoch }
+        return epoch
+    }
+
     suspend fun saveServerConfig(quietStart: String, quietEnd: String, shuffleDays: Int, duration: String) {
         context.dataStore.edit { preferences ->
             preferences[QUIET_HOURS_START_KEY] = quietStart
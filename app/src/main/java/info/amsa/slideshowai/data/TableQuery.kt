@@ -0,0 +1,60 @@
+package info.amsa.slideshowai.data
+
+import androidx.sqlite.db.SimpleSQLiteQuery
+import org.json.JSONArray
+
+/**
+ * A filtered, sorted SELECT over one table that is read a page at a time (get_db paging and streaming).
+ * Rows are ordered by (sortColumn, fileName) and each page resumes after the last row of the previous
+ * one (keyset pagination), so later pages cost the same as the first and don't shift when rows change.
+ */
+class TableQuery(
+    private val table: String,
+    private val sortColumn: String,
+    private val descending: Boolean = false
+) {
+    private val conditions = mutableListOf<String>()
+    private val args = mutableListOf<Any>()
+
+    // Where to resume: the (sortColumn, fileName) values of the last row already returned
+    data class Cursor(val sortValue: Any, val fileName: String) {
+        fun toJson(): JSONArray = JSONArray().put(sortValue).put(fileName)
+
+        companion object {
+            fun fromJson(array: JSONArray?): Cursor? =
+                if (array == null || array.length() != 2) null else Cursor(array.get(0), array.getString(1))
+        }
+    }
+
+    fun where(condition: String, vararg values: Any): TableQuery {
+        conditions.add(condition)
+        args.addAll(values)
+        return this
+    }
+
+    // Case-insensitive substring match on a text column
+    fun whereContains(column: String, text: String): TableQuery {
+        val escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return where("$column LIKE ? ESCAPE '\\'", "%$escaped%")
+    }
+
+    fun page(after: Cursor?, limit: Int): SimpleSQLiteQuery {
+        val where = conditions.toMutableList()
+        val pageArgs = args.toMutableList()
+        if (after != null) {
+            val op = if (descending) "<" else ">"
+            if (sortColumn == "fileName") {
+                where.add("fileName $op ?")
+                pageArgs.add(after.fileName)
+            } else {
+                where.add("($sortColumn $op ? OR ($sortColumn = ? AND fileName $op ?))")
+                pageArgs.addAll(listOf(after.sortValue, after.sortValue, after.fileName))
+            }
+        }
+        val direction = if (descending) "DESC" else "ASC"
+        val sql = StringBuilder("SELECT * FROM $table")
+        if (where.isNotEmpty()) sql.append(" WHERE ").append(where.joinToString(" AND "))
+        sql.append(" ORDER BY $sortColumn $direction, fileName $direction LIMIT $limit")
+        return SimpleSQLiteQuery(sql.toString(), pageArgs.toTypedArray())
+    }
+}
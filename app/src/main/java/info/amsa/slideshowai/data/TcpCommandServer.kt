@@ -4,16 +4,25 @@ import android.util.Log
 import kotlinx.coroutines.Dispatchers
 import kotlinx.coroutines.withContext
 import org.json.JSONObject
+import java.io.InputStream
 import java.io.PrintWriter
 import java.net.ServerSocket
 import java.net.Socket
+import java.net.SocketTimeoutException
 
 class TcpCommandServer {
 
+    companion object {
+        // Clients are served one at a time and may keep their connection open between
+        // commands (manage_app.py sessions); one that goes quiet is dropped after this
+        // long so it can't hold the server from everyone else
+        private const val CLIENT_IDLE_TIMEOUT_MS = 120_000
+    }
+
     private var serverSocket: ServerSocket? = null
     private var isRunning = false
 
-    suspend fun start(port: Int, handler: suspend (String, JSONObject, Socket) -> Unit) {
+    suspend fun start(port: Int, handler: suspend (String, JSONObject, Socket, InputStream) -> Unit) {
         withContext(Dispatchers.IO) {
             try {
                 serverSocket = ServerSocket(port)
@@ -24,6 +33,8 @@ class TcpCommandServer {
                     try {
                         val clientSocket = serverSocket?.accept()
                         clientSocket?.let { socket ->
+                            socket.soTimeout = CLIENT_IDLE_TIMEOUT_MS
+                            socket.keepAlive = true
                             handleClient(socket, handler)
                         }
                     } catch (e: Exception) {
@@ -38,16 +49,16 @@ class TcpCommandServer {
         }
     }
 
-    private suspend fun handleClient(socket: Socket, handler: suspend (String, JSONObject, Socket) -> Unit) {
+    private suspend fun handleClient(socket: Socket, handler: suspend (String, JSONObject, Socket, InputStream) -> Unit) {
         withContext(Dispatchers.IO) {
             try {
-                // We don't use a buffered reader because we might need to read raw bytes
-                val inputStream = socket.getInputStream()
+                // Commands and binary payloads share one buffer, so the handler gets this stream
+                // rather than socket.getInputStream()
+                val inputStream = CommandInputStream(socket.getInputStream())
                 
                 // Read line by line (for JSON commands)
-                // We implement a simple robust line reader that doesn't over-buffer
                 while (true) {
-                    val line = readLineFromStream(inputStream)
+                    val line = inputStream.readLine()
                     if (line.isNullOrBlank()) break
                     
                     Log.d("TcpCommandServer", "Received: $line")
@@ -56,7 +67,7 @@ class TcpCommandServer {
                         val cmd = json.optString("cmd")
                         
                         // Pass the socket/stream to the handler so it can read binary data if needed
-                        handler(cmd, json, socket)
+                        handler(cmd, json, socket, inputStream)
                         
                         // Handler is responsible for writing response
                     } catch (e: Exception) {
@@ -69,27 +80,20 @@ class TcpCommandServer {
                         writer.println(errorResponse.toString())
                     }
                 }
-                socket.close()
+            } catch (e: SocketTimeoutException) {
+                Log.d("TcpCommandServer", "Client idle for ${CLIENT_IDLE_TIMEOUT_MS / 1000}s, closing")
             } catch (e: Exception) {
                 Log.e("TcpCommandServer", "Error handling client", e)
+            } finally {
+                try {
+                    socket.close()
+                } catch (e: Exception) {
+                    Log.e("TcpCommandServer", "Error closing client", e)
+                }
             }
         }
     }
     
-    // Reads a line ending with \n, byte by byte to avoid buffering future binary data
-    private fun readLineFromStream(inputStream: java.io.InputStream): String? {
-        val stringBuilder = StringBuilder()
-        var char = inputStream.read()
-        while (char != -1) {
-            if (char == '\n'.code) {
-                return stringBuilder.toString()
-            }
-            stringBuilder.append(char.toChar())
-            char = inputStream.read()
-        }
-        return if (stringBuilder.isNotEmpty()) stringBuilder.toString() else null
-    }
-
     fun stop() {
         isRunning = false
         try {
@@ -4,23 +4,42 @@ import android.content.Context
 import androidx.room.Database
 import androidx.room.Room
 import androidx.room.RoomDatabase
+import androidx.room.migration.Migration
+import androidx.sqlite.db.SupportSQLiteDatabase
 
-@Database(entities = [PhotoLocation::class, PhotoHistory::class], version = 1)
+@Database(entities = [PhotoLocation::class, PhotoHistory::class, PhotoManifestEntry::class, PhotoMetadata::class], version = 3)
 abstract class AppDatabase : RoomDatabase() {
     abstract fun photoLocationDao(): PhotoLocationDao
     abstract fun photoHistoryDao(): PhotoHistoryDao
+    abstract fun photoManifestDao(): PhotoManifestDao
+    abstract fun photoCleanupDao(): PhotoCleanupDao
+    abstract fun photoMetadataDao(): PhotoMetadataDao
 
     companion object {
         @Volatile
         private var INSTANCE: AppDatabase? = null
 
+        private val MIGRATION_1_2 = object : Migration(1, 2) {
+            override fun migrate(db: SupportSQLiteDatabase) {
+                db.execSQL("CREATE TABLE IF NOT EXISTS `photo_manifest` (`fileName` TEXT NOT NULL, `size` INTEGER NOT NULL, `lastModified` INTEGER NOT NULL, `sha1` TEXT NOT NULL, `generation` INTEGER NOT NULL, `deleted` INTEGER NOT NULL, PRIMARY KEY(`fileName`))")
+                db.execSQL("CREATE INDEX IF NOT EXISTS `index_photo_manifest_generation` ON `photo_manifest` (`generation`)")
+            }
+        }
+
+        private val MIGRATION_2_3 = object : Migration(2, 3) {
+            override fun migrate(db: SupportSQLiteDatabase) {
+                db.execSQL("CREATE TABLE IF NOT EXISTS `photo_metadata` (`fileName` TEXT NOT NULL, `dateTaken` TEXT, `latitude` REAL, `longitude` REAL, `placeKey` TEXT, `width` INTEGER NOT NULL, `height` INTEGER NOT NULL, `orientation` INTEGER NOT NULL, PRIMARY KEY(`fileName`))")
+                db.execSQL("CREATE INDEX IF NOT EXISTS `index_photo_metadata_placeKey` ON `photo_metadata` (`placeKey`)")
+            }
+        }
+
         fun getDatabase(context: Context): AppDatabase {
             return INSTANCE ?: synchronized(this) {
                 val instance = Room.databaseBuilder(
                     context.applicationContext,
                     AppDatabase::class.java,
                     "slideshow_database"
-                ).build()
+                ).addMigrations(MIGRATION_1_2, MIGRATION_2_3).build()
                 INSTANCE = instance
                 instance
             }
@@ -0,0 +1,36 @@
+package info.amsa.slideshowai.data.database
+
+import androidx.room.Dao
+import androidx.room.Query
+import androidx.room.Transaction
+
+// Removes the database records of deleted photos from every table at once
+@Dao
+abstract class PhotoCleanupDao {
+    @Query("DELETE FROM photo_locations WHERE fileName IN (:fileNames)")
+    abstract fun deleteLocations(fileNames: List<String>)
+
+    @Query("DELETE FROM photo_history WHERE fileName IN (:fileNames)")
+    abstract fun deleteHistory(fileNames: List<String>)
+
+    @Query("DELETE FROM photo_metadata WHERE fileName IN (:fileNames)")
+    abstract fun deleteMetadata(fileNames: List<String>)
+
+    @Query("SELECT COALESCE(MAX(generation), 0) FROM photo_manifest")
+    abstract fun getMaxGeneration(): Long
+
+    @Query("UPDATE photo_manifest SET deleted = 1, generation = :generation WHERE fileName IN (:fileNames) AND deleted = 0")
+    abstract fun markDeleted(fileNames: List<String>, generation: Long)
+
+    @Transaction
+    open fun deletePhotoRecords(fileNames: List<String>) {
+        val generation = getMaxGeneration() + 1
+        // Stay well under SQLite's bound-parameter limit
+        fileNames.chunked(500).forEach { chunk ->
+            deleteLocations(chunk)
+            deleteHistory(chunk)
+            deleteMetadata(chunk)
+            markDeleted(chunk, generation)
+        }
+    }
+}
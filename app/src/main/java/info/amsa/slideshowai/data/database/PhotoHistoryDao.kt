@@ -4,6 +4,8 @@ import androidx.room.Dao
 import androidx.room.Insert
 import androidx.room.OnConflictStrategy
 import androidx.room.Query
+import androidx.room.RawQuery
+import androidx.sqlite.db.SupportSQLiteQuery
 
 @Dao
 interface PhotoHistoryDao {
@@ -15,6 +17,10 @@ interface PhotoHistoryDao {
     @Query("SELECT * FROM photo_history")
     suspend fun getAllHistory(): List<PhotoHistory>
 
+    // One page of a TableQuery over photo_history (get_db paging/streaming)
+    @RawQuery
+    suspend fun queryHistory(query: SupportSQLiteQuery): List<PhotoHistory>
+
     @Insert(onConflict = OnConflictStrategy.REPLACE)
     suspend fun insertHistory(photoHistory: PhotoHistory)
 
@@ -4,6 +4,8 @@ import androidx.room.Dao
 import androidx.room.Insert
 import androidx.room.OnConflictStrategy
 import androidx.room.Query
+import androidx.room.RawQuery
+import androidx.sqlite.db.SupportSQLiteQuery
 
 @Dao
 interface PhotoLocationDao {
@@ -19,6 +21,10 @@ interface PhotoLocationDao {
     @Query("SELECT * FROM photo_locations")
     suspend fun getAllLocations(): List<PhotoLocation>
 
+    // One page of a TableQuery over photo_locations (get_db paging/streaming)
+    @RawQuery
+    suspend fun queryLocations(query: SupportSQLiteQuery): List<PhotoLocation>
+
     @Query("DELETE FROM photo_locations")
     suspend fun deleteAllLocations()
 }
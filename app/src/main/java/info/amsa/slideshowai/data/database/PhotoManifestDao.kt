@@ -0,0 +1,27 @@
+package info.amsa.slideshowai.data.database
+
+import androidx.room.Dao
+import androidx.room.Insert
+import androidx.room.OnConflictStrategy
+import androidx.room.Query
+
+@Dao
+interface PhotoManifestDao {
+    @Query("SELECT * FROM photo_manifest")
+    suspend fun getAllEntries(): List<PhotoManifestEntry>
+
+    @Query("SELECT * FROM photo_manifest WHERE deleted = 0")
+    suspend fun getLiveEntries(): List<PhotoManifestEntry>
+
+    @Query("SELECT * FROM photo_manifest WHERE generation > :since")
+    suspend fun getChangesSince(since: Long): List<PhotoManifestEntry>
+
+    @Query("SELECT * FROM photo_manifest WHERE fileName = :fileName")
+    suspend fun getEntry(fileName: String): PhotoManifestEntry?
+
+    @Query("SELECT COALESCE(MAX(generation), 0) FROM photo_manifest")
+    suspend fun getMaxGeneration(): Long
+
+    @Insert(onConflict = OnConflictStrategy.REPLACE)
+    suspend fun insertEntry(entry: PhotoManifestEntry)
+}
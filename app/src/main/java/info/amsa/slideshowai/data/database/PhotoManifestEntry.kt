@@ -0,0 +1,17 @@
+package info.amsa.slideshowai.data.database
+
+import androidx.room.Entity
+import androidx.room.Index
+import androidx.room.PrimaryKey
+
+// One row per file ever seen in slideshow_photos. Deleted files stay as tombstones
+// so that change queries can report them. generation increases on every change.
+@Entity(tableName = "photo_manifest", indices = [Index("generation")])
+data class PhotoManifestEntry(
+    @PrimaryKey val fileName: String,
+    val size: Long,
+    val lastModified: Long,
+    val sha1: String,
+    val generation: Long,
+    val deleted: Boolean
+)
@@ -0,0 +1,20 @@
+package info.amsa.slideshowai.data.database
+
+import androidx.room.Entity
+import androidx.room.Index
+import androidx.room.PrimaryKey
+
+// Metadata sync read from the source photo (put_metadata): EXIF date taken as ISO text,
+// GPS position, and the rounded position place names are shared by. width/height are
+// the source's displayed size, so only their ratio matters here.
+@Entity(tableName = "photo_metadata", indices = [Index("placeKey")])
+data class PhotoMetadata(
+    @PrimaryKey val fileName: String,
+    val dateTaken: String?,
+    val latitude: Double?,
+    val longitude: Double?,
+    val placeKey: String?,
+    val width: Int,
+    val height: Int,
+    val orientation: Int
+)
@@ -0,0 +1,42 @@
+package info.amsa.slideshowai.data.database
+
+import androidx.room.Dao
+import androidx.room.Insert
+import androidx.room.OnConflictStrategy
+import androidx.room.Query
+import androidx.room.Transaction
+
+@Dao
+abstract class PhotoMetadataDao {
+    @Query("SELECT * FROM photo_metadata WHERE fileName = :fileName")
+    abstract suspend fun getMetadata(fileName: String): PhotoMetadata?
+
+    @Query("SELECT * FROM photo_metadata")
+    abstract suspend fun getAllMetadata(): List<PhotoMetadata>
+
+    @Query("SELECT fileName FROM photo_metadata")
+    abstract suspend fun getFileNames(): List<String>
+
+    // A location already stored for another photo taken at the same place
+    @Query("SELECT l.location FROM photo_locations l JOIN photo_metadata m ON m.fileName = l.fileName WHERE m.placeKey = :placeKey LIMIT 1")
+    abstract suspend fun getLocationForPlace(placeKey: String): String?
+
+    @Insert(onConflict = OnConflictStrategy.REPLACE)
+    abstract fun insertMetadata(metadata: List<PhotoMetadata>)
+
+    @Insert(onConflict = OnConflictStrategy.REPLACE)
+    abstract fun insertLocations(locations: List<PhotoLocation>)
+
+    // One put_metadata batch, with the place names sync resolved, in a single transaction
+    @Transaction
+    open fun storeMetadata(metadata: List<PhotoMetadata>, locations: List<PhotoLocation>) {
+        insertMetadata(metadata)
+        insertLocations(locations)
+    }
+
+    @Query("DELETE FROM photo_metadata WHERE fileName = :fileName")
+    abstract fun deleteMetadata(fileName: String)
+
+    @Query("DELETE FROM photo_metadata")
+    abstract suspend fun deleteAllMetadata()
+}
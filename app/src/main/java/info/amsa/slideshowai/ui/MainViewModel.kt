@@ -11,16 +11,28 @@ import info.amsa.slideshowai.data.PreferencesRepository
 import info.amsa.slideshowai.data.LocationRepository
 import kotlinx.coroutines.launch
 import kotlinx.coroutines.flow.first
+import info.amsa.slideshowai.data.PhotoCleanupRepository
 import info.amsa.slideshowai.data.PhotoHistoryRepository
+import info.amsa.slideshowai.data.PhotoManifestRepository
+import info.amsa.slideshowai.data.PhotoMetadataRepository
+import info.amsa.slideshowai.data.database.PhotoLocation
+import info.amsa.slideshowai.data.database.PhotoMetadata
+import info.amsa.slideshowai.data.TableQuery
 import info.amsa.slideshowai.data.TcpCommandServer
 import org.json.JSONObject
 import java.io.File
 
+// Rows per Room query when paging or streaming get_db, and the largest page a client may ask for
+private const val DB_PAGE_MAX = 500
+
 class MainViewModel(application: Application) : AndroidViewModel(application) {
     
     private val preferencesRepository = PreferencesRepository(application)
     private val locationRepository = LocationRepository(application)
     private val photoHistoryRepository = PhotoHistoryRepository(application)
+    private val photoManifestRepository = PhotoManifestRepository(application)
+    private val photoCleanupRepository = PhotoCleanupRepository(application)
+    private val photoMetadataRepository = PhotoMetadataRepository(application)
 
 
     var statusMessage by mutableStateOf("Ready")
@@ -56,8 +68,8 @@ class MainViewModel(application: Application) : AndroidViewModel(application) {
     init {
         // Start TCP Server
         viewModelScope.launch {
-            tcpServer.start(4000) { cmd, json, socket ->
-                handleTcpCommand(cmd, json, socket)
+            tcpServer.start(4000) { cmd, json, socket, input ->
+                handleTcpCommand(cmd, json, socket, input)
             }
         }
 
@@ -83,7 +95,7 @@ class MainViewModel(application: Application) : AndroidViewModel(application) {
         }
     }
     
-    private suspend fun handleTcpCommand(cmd: String, json: JSONObject, socket: java.net.Socket) {
+    private suspend fun handleTcpCommand(cmd: String, json: JSONObject, socket: java.net.Socket, input: java.io.InputStream) {
         val writer = java.io.PrintWriter(socket.getOutputStream(), true)
         
         try {
@@ -96,16 +108,48 @@ class MainViewModel(application: Application) : AndroidViewModel(application) {
                     }
                     writer.println(response.toString())
                 }
+                "list_changes" -> {
+                    // Incremental listing. The token is "<epoch>:<generation>"; anything we can't
+                    // compare against (missing, other epoch, from the future) gets a full listing.
+                    val epoch = preferencesRepository.getManifestEpoch()
+                    val parts = json.optString("since").split(":")
+                    val since = if (parts.size == 2 && parts[0] == epoch) parts[1].toLongOrNull() ?: 0L else 0L
+                    
+                    photoManifestRepository.reconcile(photosDir()) { isImageFile(it) }
+                    var changes = photoManifestRepository.getChanges(since)
+                    val full = since <= 0 || since > changes.generation
+                    if (full && since > 0) changes = photoManifestRepository.getChanges(0)
+                    
+                    val files = org.json.JSONArray()
+                    val deleted = org.json.JSONArray()
+                    changes.entries.forEach {
+                        if (it.deleted) {
+                            deleted.put(it.fileName)
+                        } else {
+                            files.put(JSONObject().put("name", it.fileName).put("size", it.size).put("sha1", it.sha1))
+                        }
+                    }
+                    val response = JSONObject()
+                        .put("status", "ok")
+                        .put("token", "$epoch:${changes.generation}")
+                        .put("full", full)
+                        .put("files", files)
+                        .put("deleted", deleted)
+                    writer.println(response.toString())
+                }
                 "delete_file" -> {
                     val filename = json.getString("name")
                     val file = File(getApplication<Application>().filesDir, "slideshow_photos/$filename")
                     
                     if (file.exists()) {
                         if (file.delete()) {
+                            File(thumbnailsDir(), filename).delete()
                             // Clean up DB
                             try {
                                 locationRepository.deleteLocation(filename)
                                 photoHistoryRepository.deleteHistory(filename)
+                                photoMetadataRepository.deleteMetadata(filename)
+                                photoManifestRepository.recordDeleted(filename)
                             } catch (e: Exception) {
                                 e.printStackTrace()
                             }
@@ -118,6 +162,39 @@ class MainViewModel(application: Application) : AndroidViewModel(application) {
                          writer.println(JSONObject().put("status", "ok").put("message", "File not found (already deleted)").toString())
                     }
                 }
+                "delete_files" -> {
+                    // Batch version of delete_file: all DB cleanup happens in one transaction and the
+                    // photo list is refreshed once. Missing files count as deleted, like delete_file.
+                    val names = json.getJSONArray("names")
+                    val dir = photosDir()
+                    val deleted = mutableListOf<String>()
+                    val failed = org.json.JSONArray()
+                    
+                    for (i in 0 until names.length()) {
+                        val filename = names.getString(i)
+                        val file = File(dir, filename)
+                        if (!file.exists() || file.delete()) {
+                            File(thumbnailsDir(), filename).delete()
+                            deleted.add(filename)
+                        } else {
+                            failed.put(JSONObject().put("name", filename).put("message", "Failed to delete $filename"))
+                        }
+                    }
+                    
+                    try {
+                        photoCleanupRepository.deletePhotoRecords(deleted)
+                    } catch (e: Exception) {
+                        e.printStackTrace()
+                    }
+                    if (deleted.isNotEmpty()) refreshPhotos()
+                    
+                    val response = JSONObject()
+                        .put("status", "ok")
+                        .put("message", "Deleted ${deleted.size} of ${names.length()} files")
+                        .put("deleted", deleted.size)
+                        .put("failed", failed)
+                    writer.println(response.toString())
+                }
                 "receive_file" -> {
                     val filename = json.getString("name")
                     val size = json.getLong("size")
@@ -125,35 +202,183 @@ class MainViewModel(application: Application) : AndroidViewModel(application) {
                     writer.println(JSONObject().put("status", "ready").toString())
                     
                     // Read binary data
-                    val dir = File(getApplication<Application>().filesDir, "slideshow_photos")
-                    if (!dir.exists()) dir.mkdirs()
-                    val file = File(dir, filename)
-                    
-                    val inputStream = socket.getInputStream()
-                    val outputStream = java.io.FileOutputStream(file)
-                    val buffer = ByteArray(4096)
-                    var bytesRead: Long = 0
-                    
-                    while (bytesRead < size) {
-                        val remaining = size - bytesRead
-                        val readSize = if (remaining < buffer.size) remaining.toInt() else buffer.size
-                        val count = inputStream.read(buffer, 0, readSize)
-                        if (count == -1) break
-                        outputStream.write(buffer, 0, count)
-                        bytesRead += count
-                    }
-                    outputStream.close()
+                    val digest = java.security.MessageDigest.getInstance("SHA-1")
+                    val bytesRead = receiveFileData(input, File(photosDir(), filename), size, digest)
                     
                     if (bytesRead == size) {
+                         photoManifestRepository.recordFile(File(photosDir(), filename), PhotoManifestRepository.toHex(digest.digest()))
                          refreshPhotos()
                          writer.println(JSONObject().put("status", "ok").put("message", "File received").toString())
                     } else {
                          writer.println(JSONObject().put("status", "error").put("message", "Incomplete transfer").toString())
                     }
                 }
+                "put_file" -> {
+                    // Pipelined upload: the payload follows the header immediately, with no "ready" handshake.
+                    // The ack carries the name so the client can match it up, and the photo list is only
+                    // refreshed once the client sends refresh_photos at the end of the batch.
+                    val filename = json.getString("name")
+                    val size = json.getLong("size")
+                    val response = JSONObject().put("name", filename)
+                    val digest = java.security.MessageDigest.getInstance("SHA-1")
+                    
+                    val bytesRead = try {
+                        receiveFileData(input, File(photosDir(), filename), size, digest)
+                    } catch (e: java.io.IOException) {
+                        // Keep the stream in sync with the next header even if the file couldn't be written
+                        e.printStackTrace()
+                        response.put("status", "error").put("message", "Write failed: ${e.message}")
+                        null
+                    }
+                    
+                    if (bytesRead != null) {
+                        if (bytesRead == size) {
+                            photoManifestRepository.recordFile(File(photosDir(), filename), PhotoManifestRepository.toHex(digest.digest()))
+                            response.put("status", "ok").put("message", "File received")
+                        } else {
+                            response.put("status", "error").put("message", "Incomplete transfer")
+                        }
+                    }
+                    writer.println(response.toString())
+                }
+                "put_thumbnail" -> {
+                    // Small preview of a photo, shown until the photo itself is decoded. Framed like put_file;
+                    // stored under the photo's name in slideshow_thumbs, replaced in one rename so it is never half-written.
+                    val filename = json.getString("name")
+                    val size = json.getLong("size")
+                    val response = JSONObject().put("name", filename)
+                    val target = File(thumbnailsDir(), filename)
+                    val temp = File(thumbnailsDir(), "$filename.part")
+                    
+                    val bytesRead = try {
+                        receiveFileData(input, temp, size)
+                    } catch (e: java.io.IOException) {
+                        e.printStackTrace()
+                        response.put("status", "error").put("message", "Write failed: ${e.message}")
+                        null
+                    }
+                    
+                    if (bytesRead != null) {
+                        if (bytesRead == size && temp.renameTo(target)) {
+                            response.put("status", "ok").put("message", "Thumbnail received")
+                        } else {
+                            temp.delete()
+                            response.put("status", "error").put("message", "Incomplete transfer")
+                        }
+                    }
+                    writer.println(response.toString())
+                }
+                "list_thumbnails" -> {
+                    val names = thumbnailsDir().listFiles()?.map { it.name }?.filter { !it.endsWith(".part") } ?: emptyList()
+                    writer.println(JSONObject().put("status", "ok").put("files", org.json.JSONArray(names)).toString())
+                }
+                "put_metadata" -> {
+                    // Bulk metadata sync read from the source photos: date taken, GPS position, place key,
+                    // displayed size and orientation, plus the place name when sync resolved one. Stored with
+                    // those locations in one transaction, so no EXIF parsing or geocoding is left for display time.
+                    val photos = json.getJSONArray("photos")
+                    val metadata = mutableListOf<PhotoMetadata>()
+                    val locations = mutableListOf<PhotoLocation>()
+                    for (i in 0 until photos.length()) {
+                        val photo = photos.getJSONObject(i)
+                        val filename = photo.getString("name")
+                        metadata.add(PhotoMetadata(
+                            fileName = filename,
+                            dateTaken = photo.optString("taken").ifEmpty { null },
+                            latitude = if (photo.has("lat")) photo.getDouble("lat") else null,
+                            longitude = if (photo.has("lon")) photo.getDouble("lon") else null,
+                            placeKey = photo.optString("place").ifEmpty { null },
+                            width = photo.optInt("width"),
+                            height = photo.optInt("height"),
+                            orientation = photo.optInt("orientation", 1)
+                        ))
+                        val location = photo.optString("location")
+                        if (location.isNotEmpty()) locations.add(PhotoLocation(filename, location))
+                    }
+                    
+                    try {
+                        photoMetadataRepository.storeMetadata(metadata, locations)
+                        writer.println(JSONObject().put("status", "ok").put("stored", metadata.size)
+                            .put("message", "Stored metadata for ${metadata.size} photos").toString())
+                    } catch (e: Exception) {
+                        e.printStackTrace()
+                        writer.println(JSONObject().put("status", "error").put("message", "Failed to store metadata: ${e.message}").toString())
+                    }
+                }
+                "list_metadata" -> {
+                    val names = photoMetadataRepository.getFileNames()
+                    writer.println(JSONObject().put("status", "ok").put("files", org.json.JSONArray(names)).toString())
+                }
+                "upload_status" -> {
+                    // Resumable uploads: how much of `name` a previous put_chunk sequence already delivered.
+                    // A partial that is longer than the announced size belongs to a different upload and is dropped.
+                    val filename = json.getString("name")
+                    val size = json.getLong("size")
+                    val partial = File(partialsDir(), filename)
+                    if (partial.exists() && partial.length() > size) partial.delete()
+                    val offset = if (partial.exists()) partial.length() else 0L
+                    writer.println(JSONObject().put("status", "ok").put("name", filename).put("offset", offset).toString())
+                }
+                "put_chunk" -> {
+                    // Appends the payload to slideshow_partial/name at `offset`. The chunk that reaches `total`
+                    // bytes triggers a SHA-1 check of the whole file and an atomic rename into slideshow_photos.
+                    // Whatever arrived before a dropped connection stays in the partial file for the next attempt.
+                    val filename = json.getString("name")
+                    val offset = json.getLong("offset")
+                    val size = json.getLong("size")
+                    val total = json.getLong("total")
+                    val partial = File(partialsDir(), filename)
+                    val current = if (partial.exists()) partial.length() else 0L
+                    val response = JSONObject().put("name", filename)
+                    
+                    if (current != offset) {
+                        // Out of step with the client; skip the payload and tell it where to resume
+                        discardBytes(input, size)
+                        response.put("status", "error").put("message", "Offset mismatch").put("offset", current)
+                    } else {
+                        val written = try {
+                            receiveFileData(input, partial, size, append = true)
+                        } catch (e: java.io.IOException) {
+                            e.printStackTrace()
+                            response.put("status", "error").put("message", "Write failed: ${e.message}")
+                            null
+                        }
+                        val received = offset + (written ?: 0L)
+                        response.put("offset", if (partial.exists()) partial.length() else 0L)
+                        
+                        if (written != null && received == total) {
+                            val sha1 = PhotoManifestRepository.sha1Of(partial)
+                            if (sha1 != json.getString("sha1")) {
+                                partial.delete()
+                                response.put("status", "error").put("message", "Checksum mismatch").put("offset", 0L)
+                            } else {
+                                val dir = photosDir()
+                                if (!dir.exists()) dir.mkdirs()
+                                val target = File(dir, filename)
+                                java.nio.file.Files.move(partial.toPath(), target.toPath(),
+                                    java.nio.file.StandardCopyOption.REPLACE_EXISTING, java.nio.file.StandardCopyOption.ATOMIC_MOVE)
+                                photoManifestRepository.recordFile(target, sha1)
+                                response.put("status", "ok").put("message", "File received").put("complete", true)
+                            }
+                        } else if (written != null) {
+                            if (written == size) {
+                                response.put("status", "ok").put("complete", false)
+                            } else {
+                                response.put("status", "error").put("message", "Incomplete chunk")
+                            }
+                        }
+                    }
+                    writer.println(response.toString())
+                }
+                "refresh_photos" -> {
+                    refreshPhotos()
+                    writer.println(JSONObject().put("status", "ok").put("message", "Photos refreshed").toString())
+                }
                 "get_db" -> {
                     val dbType = json.getString("db")
-                    if (dbType == "location") {
+                    if (json.optBoolean("stream") || json.has("page_size")) {
+                        queryDb(dbType, json, socket, writer)
+                    } else if (dbType == "location") {
                         val locations = locationRepository.getAllLocations()
                         val jsonArray = org.json.JSONArray()
                         locations.forEach { 
@@ -189,10 +414,13 @@ class MainViewModel(application: Application) : AndroidViewModel(application) {
                     if (dir.exists()) {
                         dir.listFiles()?.forEach { it.delete() }
                     }
+                    thumbnailsDir().listFiles()?.forEach { it.delete() }
                     
                     // Clear DBs as well
                     locationRepository.clearAllLocations()
                     photoHistoryRepository.clearAllHistory()
+                    photoMetadataRepository.clearAllMetadata()
+                    photoManifestRepository.reconcile(dir) { isImageFile(it) }
                     refreshPhotos()
                     
                     writer.println(JSONObject().put("status", "ok").put("message", "All photos and data deleted").toString())
@@ -201,7 +429,14 @@ class MainViewModel(application: Application) : AndroidViewModel(application) {
                     val displayMetrics = android.content.res.Resources.getSystem().displayMetrics
                     val width = displayMetrics.widthPixels
                     val height = displayMetrics.heightPixels
-                    writer.println(JSONObject().put("status", "ok").put("width", width).put("height", height).toString())
+                    // Optional protocol features, so clients can fall back to the basic commands on older builds
+                    val features = org.json.JSONArray(listOf("put_file", "list_changes", "delete_files", "put_chunk", "db_query", "put_thumbnail", "put_metadata"))
+                    // Image formats the slideshow can decode, so clients can push something smaller than JPEG
+                    val decoders = mutableListOf("jpeg", "png", "webp")
+                    if (android.os.Build.VERSION.SDK_INT >= android.os.Build.VERSION_CODES.P) decoders.add("heif")
+                    if (android.os.Build.VERSION.SDK_INT >= android.os.Build.VERSION_CODES.S) decoders.add("avif")
+                    writer.println(JSONObject().put("status", "ok").put("width", width).put("height", height)
+                        .put("features", features).put("decoders", org.json.JSONArray(decoders)).toString())
                 }
                 else -> {
                     writer.println(JSONObject().put("status", "error").put("message", "Unknown command: $cmd").toString())
@@ -213,6 +448,140 @@ class MainViewModel(application: Application) : AndroidViewModel(application) {
         }
     }
 
+    // get_db with filtering, sorting and either one page per request ("page_size" + "cursor", replies with
+    // "next") or every matching row streamed as NDJSON ("stream": header line, one line per row, then
+    // {"end": true}). Rows are read from Room a page at a time, so neither end holds the whole table.
+    private suspend fun queryDb(dbType: String, json: JSONObject, socket: java.net.Socket, writer: java.io.PrintWriter) {
+        val descending = json.optString("order") == "desc"
+        val query = when (dbType) {
+            "history" -> {
+                val sort = if (json.optString("sort") == "lastShown") "lastShownTimestamp" else "fileName"
+                TableQuery("photo_history", sort, descending).also { q ->
+                    if (json.has("shown_before")) q.where("lastShownTimestamp < ?", json.getLong("shown_before"))
+                    if (json.has("shown_after")) q.where("lastShownTimestamp >= ?", json.getLong("shown_after"))
+                }
+            }
+            "location" -> {
+                val sort = if (json.optString("sort") == "location") "location" else "fileName"
+                TableQuery("photo_locations", sort, descending).also { q ->
+                    if (json.has("location")) q.whereContains("location", json.getString("location"))
+                }
+            }
+            else -> {
+                writer.println(JSONObject().put("status", "error").put("message", "Unknown db: $dbType").toString())
+                return
+            }
+        }
+        if (json.has("name")) query.whereContains("fileName", json.getString("name"))
+
+        // Rows as get_db has always sent them, plus the cursor that resumes after each one
+        suspend fun fetch(after: TableQuery.Cursor?, limit: Int): List<Pair<JSONObject, TableQuery.Cursor>> =
+            if (dbType == "history") {
+                photoHistoryRepository.queryPage(query, after, limit).map {
+                    val sortValue: Any = if (json.optString("sort") == "lastShown") it.lastShownTimestamp else it.fileName
+                    JSONObject().put("fileName", it.fileName).put("lastShown", it.lastShownTimestamp) to TableQuery.Cursor(sortValue, it.fileName)
+                }
+            } else {
+                locationRepository.queryPage(query, after, limit).map {
+                    val sortValue: Any = if (json.optString("sort") == "location") it.location else it.fileName
+                    JSONObject().put("fileName", it.fileName).put("location", it.location) to TableQuery.Cursor(sortValue, it.fileName)
+                }
+            }
+
+        if (!json.optBoolean("stream")) {
+            val pageSize = json.getInt("page_size").coerceIn(1, DB_PAGE_MAX)
+            val rows = fetch(TableQuery.Cursor.fromJson(json.optJSONArray("cursor")), pageSize)
+            val data = org.json.JSONArray()
+            rows.forEach { data.put(it.first) }
+            val next = if (rows.size == pageSize) rows.last().second.toJson() else JSONObject.NULL
+            writer.println(JSONObject().put("status", "ok").put("data", data).put("next", next).toString())
+            return
+        }
+
+        val limit = if (json.has("limit")) json.getLong("limit") else Long.MAX_VALUE
+        writer.println(JSONObject().put("status", "ok").put("stream", true).toString())
+        // Buffered rather than the auto-flushing writer, so rows don't cost a socket write each
+        val out = java.io.BufferedWriter(java.io.OutputStreamWriter(socket.getOutputStream(), Charsets.UTF_8), 64 * 1024)
+        var count = 0L
+        var after: TableQuery.Cursor? = null
+        while (count < limit) {
+            val rows = fetch(after, minOf(DB_PAGE_MAX.toLong(), limit - count).toInt())
+            for ((row, _) in rows) {
+                out.write(row.toString())
+                out.newLine()
+            }
+            out.flush()
+            count += rows.size
+            if (rows.size < DB_PAGE_MAX) break
+            after = rows.last().second
+        }
+        out.write(JSONObject().put("end", true).put("count", count).toString())
+        out.newLine()
+        out.flush()
+    }
+
+    private fun photosDir(): File = File(getApplication<Application>().filesDir, "slideshow_photos")
+
+    // Thumbnails from put_thumbnail, named like the photo they belong to
+    private fun thumbnailsDir(): File = File(getApplication<Application>().filesDir, "slideshow_thumbs")
+
+    // The photo's thumbnail, if sync sent one
+    fun thumbnailFor(photo: File): File? = File(thumbnailsDir(), photo.name).takeIf { it.exists() }
+
+    // Partial uploads from put_chunk, kept out of slideshow_photos until they are complete and verified
+    private fun partialsDir(): File = File(getApplication<Application>().filesDir, "slideshow_partial")
+
+    // Reads exactly `size` bytes from the stream into `file` (appending if `append`), feeding them to `digest` if given.
+    // If the file can't be written the remaining bytes are still consumed before rethrowing.
+    private fun receiveFileData(inputStream: java.io.InputStream, file: File, size: Long, digest: java.security.MessageDigest? = null, append: Boolean = false): Long {
+        val dir = file.parentFile
+        if (dir != null && !dir.exists()) dir.mkdirs()
+        
+        val buffer = ByteArray(64 * 1024)
+        var bytesRead: Long = 0
+        var outputStream: java.io.FileOutputStream? = null
+        var writeError: java.io.IOException? = null
+        
+        try {
+            outputStream = java.io.FileOutputStream(file, append)
+        } catch (e: java.io.IOException) {
+            writeError = e
+        }
+        
+        while (bytesRead < size) {
+            val remaining = size - bytesRead
+            val readSize = if (remaining < buffer.size) remaining.toInt() else buffer.size
+            val count = inputStream.read(buffer, 0, readSize)
+            if (count == -1) break
+            if (writeError == null) {
+                try {
+                    outputStream?.write(buffer, 0, count)
+                    digest?.update(buffer, 0, count)
+                } catch (e: java.io.IOException) {
+                    writeError = e
+                }
+            }
+            bytesRead += count
+        }
+        outputStream?.close()
+        
+        writeError?.let {
+            if (!append) file.delete()
+            throw it
+        }
+        return bytesRead
+    }
+
+    private fun discardBytes(inputStream: java.io.InputStream, size: Long) {
+        val buffer = ByteArray(64 * 1024)
+        var remaining = size
+        while (remaining > 0) {
+            val count = inputStream.read(buffer, 0, minOf(remaining, buffer.size.toLong()).toInt())
+            if (count == -1) break
+            remaining -= count
+        }
+    }
+
     override fun onCleared() {
         super.onCleared()
         tcpServer.stop()
@@ -232,9 +601,15 @@ class MainViewModel(application: Application) : AndroidViewModel(application) {
         val allPhotos = dir.listFiles()?.filter { isImageFile(it.name) }?.toList() ?: emptyList()
         localPhotos = allPhotos
         
-        // Filter by Orientation
+        // Filter by Orientation; photos with synced metadata need no EXIF read
+        val metadataMap = photoMetadataRepository.getAllMetadataSync()
         val orientedPhotos = allPhotos.filter { file ->
-            isPhotoMatchingOrientation(file, isLandscape)
+            val metadata = metadataMap[file.name]
+            if (metadata != null && metadata.width > 0 && metadata.height > 0) {
+                (metadata.width >= metadata.height) == isLandscape
+            } else {
+                isPhotoMatchingOrientation(file, isLandscape)
+            }
         }
 
         // Smart Shuffle Logic
@@ -296,7 +671,7 @@ class MainViewModel(application: Application) : AndroidViewModel(application) {
     }
 
     private fun isImageFile(name: String): Boolean {
-        val extensions = listOf(".jpg", ".jpeg", ".png", ".webp", ".heic")
+        val extensions = listOf(".jpg", ".jpeg", ".png", ".webp", ".heic", ".avif")
         return extensions.any { name.lowercase().endsWith(it) }
     }
 
@@ -338,6 +713,10 @@ class MainViewModel(application: Application) : AndroidViewModel(application) {
     suspend fun getLocation(file: File): String? {
         return locationRepository.getLocation(file)
     }
+
+    suspend fun getPhotoYear(file: File): String? {
+        return photoMetadataRepository.getYear(file)
+    }
     
     fun markPhotoAsShown(file: File) {
         viewModelScope.launch {
@@ -7,6 +7,8 @@ import androidx.compose.foundation.clickable
 import androidx.compose.foundation.gestures.detectHorizontalDragGestures
 import androidx.compose.foundation.layout.Box
 import androidx.compose.foundation.layout.fillMaxSize
+import androidx.compose.foundation.layout.fillMaxWidth
+import androidx.compose.foundation.layout.height
 import androidx.compose.material3.Text
 import androidx.compose.runtime.*
 import androidx.compose.ui.Alignment
@@ -19,7 +21,10 @@ import androidx.compose.foundation.layout.windowInsetsPadding
 import androidx.compose.ui.input.pointer.pointerInput
 import androidx.compose.ui.layout.ContentScale
 import androidx.compose.ui.unit.dp
+import coil.compose.AsyncImagePainter
 import coil.compose.rememberAsyncImagePainter
+import coil.imageLoader
+import coil.request.ImageRequest
 import java.io.File
 import kotlinx.coroutines.delay
 
@@ -31,6 +36,8 @@ fun SlideshowScreen(
     photoDurationMillis: Long,
     onBack: () -> Unit,
     onGetLocation: suspend (File) -> String?,
+    onGetYear: suspend (File) -> String?,
+    thumbnailFor: (File) -> File?,
     onPhotoShown: (File) -> Unit,
     onOrientationChanged: (Boolean) -> Unit,
     currentIndex: Int,
@@ -188,20 +195,41 @@ fun SlideshowScreen(
             val currentFile = mediaItems[safeIndex]
             Log.d("SlideshowScreen", "Displaying file: ${currentFile.name}")
 
+            // The thumbnail sync sent along (if any) decodes in a few ms; it is shown, scaled up,
+            // until the full photo is ready
+            val thumbnail = remember(currentFile) { thumbnailFor(currentFile) }
+            val painter = rememberAsyncImagePainter(currentFile)
+            if (thumbnail != null && painter.state !is AsyncImagePainter.State.Success) {
+                Image(
+                    painter = rememberAsyncImagePainter(thumbnail),
+                    contentDescription = null,
+                    contentScale = ContentScale.Fit,
+                    modifier = Modifier.fillMaxSize()
+                )
+            }
             Image(
-                painter = rememberAsyncImagePainter(currentFile),
+                painter = painter,
                 contentDescription = null,
                 contentScale = ContentScale.Fit,
                 modifier = Modifier.fillMaxSize()
             )
             
+            // Decode the next photo (and its thumbnail) into Coil's memory cache while this one is shown
+            LaunchedEffect(mediaItems, safeIndex) {
+                if (mediaItems.size > 1) {
+                    val next = mediaItems[(safeIndex + 1) % mediaItems.size]
+                    thumbnailFor(next)?.let { context.imageLoader.enqueue(ImageRequest.Builder(context).data(it).build()) }
+                    context.imageLoader.enqueue(ImageRequest.Builder(context).data(next).build())
+                }
+            }
+            
             // Display Metadata (Year & Location)
-            val context = androidx.compose.ui.platform.LocalContext.current
             var location by remember { mutableStateOf<String?>(null) }
-            val year = remember(currentFile) { getPhotoYear(currentFile) }
+            var year by remember(currentFile) { mutableStateOf<String?>(null) }
             var showDetailsDialog by remember { mutableStateOf(false) }
             
             LaunchedEffect(currentFile) {
+                year = onGetYear(currentFile)
                 location = onGetLocation(currentFile)
                 onPhotoShown(currentFile)
             }
@@ -238,7 +266,23 @@ fun SlideshowScreen(
                 androidx.compose.material3.AlertDialog(
                     onDismissRequest = { showDetailsDialog = false },
                     title = { Text("Photo Details") },
-                    text = { Text("Filename: ${currentFile.name}") },
+                    text = {
+                        androidx.compose.foundation.layout.Column {
+                            // A preview from the thumbnail; the details never need the full photo decoded again
+                            if (thumbnail != null) {
+                                Image(
+                                    painter = rememberAsyncImagePainter(thumbnail),
+                                    contentDescription = null,
+                                    contentScale = ContentScale.Fit,
+                                    modifier = Modifier
+                                        .fillMaxWidth()
+                                        .height(160.dp)
+                                        .padding(bottom = 8.dp)
+                                )
+                            }
+                            Text("Filename: ${currentFile.name}")
+                        }
+                    },
                     confirmButton = {
                         androidx.compose.material3.TextButton(
                             onClick = { showDetailsDialog = false }
@@ -259,16 +303,3 @@ fun SlideshowScreen(
         }
     }
 }
-
-private fun getPhotoYear(file: File): String? {
-    return try {
-        val exif = androidx.exifinterface.media.ExifInterface(file)
-        val date = exif.getAttribute(androidx.exifinterface.media.ExifInterface.TAG_DATETIME_ORIGINAL)
-            ?: exif.getAttribute(androidx.exifinterface.media.ExifInterface.TAG_DATETIME)
-        
-        // Format is usually "yyyy:MM:dd HH:mm:ss"
-        date?.split(":", " ")?.firstOrNull()
-    } catch (e: Exception) {
-        null
-    }
-}
@@ -0,0 +1,87 @@
+import argparse
+import json
+import socket
+import threading
+import time
+
+from device_connection import DeviceConnection
+
+
+def read_line_bytewise(sock):
+    """The original reader: one recv() per byte. Kept here as the baseline."""
+    buf = b""
+    while True:
+        c = sock.recv(1)
+        if not c:
+            break
+        if c == b'\n':
+            break
+        buf += c
+    return buf.decode('utf-8')
+
+
+def make_response(entries):
+    files = [f"IMG_{i:06d}_{i * 2654435761 % 2**32:08x}.jpg" for i in range(entries)]
+    return json.dumps({"status": "ok", "files": files}).encode('utf-8') + b'\n'
+
+
+def time_reader(payload, repeat, reader):
+    """Serve `payload` `repeat` times over a socketpair and time reading it back line by line."""
+    server, client = socket.socketpair()
+
+    def serve():
+        for _ in range(repeat):
+            server.sendall(payload)
+        server.close()
+
+    t = threading.Thread(target=serve, daemon=True)
+    t.start()
+    start = time.perf_counter()
+    read_one = reader(client)
+    for _ in range(repeat):
+        read_one()
+    elapsed = time.perf_counter() - start
+    t.join()
+    client.close()
+    return elapsed
+
+
+def bench_local(entries, repeat, skip_bytewise):
+    payload = make_response(entries)
+    mb = len(payload) * repeat / 1e6
+    print(f"Response: {entries} entries, {len(payload) / 1e6:.2f} MB per line, {repeat} lines")
+
+    elapsed = time_reader(payload, repeat, lambda sock: DeviceConnection.from_socket(sock).read_line)
+    print(f"  DeviceConnection.read_line: {elapsed:8.3f}s  {mb / elapsed:8.2f} MB/s")
+
+    if not skip_bytewise:
+        elapsed = time_reader(payload, repeat, lambda sock: lambda: read_line_bytewise(sock))
+        print(f"  byte-at-a-time read_line:   {elapsed:8.3f}s  {mb / elapsed:8.2f} MB/s")
+
+
+def bench_device(app_host, port, repeat):
+    """Time real list_files / get_db responses from a device."""
+    with DeviceConnection(app_host, port) as conn:
+        for cmd in ({"cmd": "list_files"}, {"cmd": "get_db", "db": "history"}, {"cmd": "get_db", "db": "location"}):
+            total_bytes = 0
+            start = time.perf_counter()
+            for _ in range(repeat):
+                conn.send_json(cmd)
+                total_bytes += len(conn.read_line().encode('utf-8'))
+            elapsed = time.perf_counter() - start
+            print(f"  {json.dumps(cmd):45} {total_bytes / repeat / 1e6:8.2f} MB  {elapsed / repeat:8.3f}s/request")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Line-read throughput for large protocol responses')
+    parser.add_argument('--entries', type=int, default=40000, help='File names in the synthetic list_files response (default 40000)')
+    parser.add_argument('--repeat', type=int, default=1, help='Responses to read (default 1)')
+    parser.add_argument('--skip-bytewise', action='store_true', help='Skip the slow byte-at-a-time baseline')
+    parser.add_argument('--device', metavar='APP_HOST', help='Also time real responses from this device')
+    parser.add_argument('--port', type=int, default=4000, help='App TCP Port (default 4000)')
+    args = parser.parse_args()
+
+    bench_local(args.entries, args.repeat, args.skip_bytewise)
+    if args.device:
+        print(f"Device {args.device}:{args.port}")
+        bench_device(args.device, args.port, args.repeat)
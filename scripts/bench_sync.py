@@ -0,0 +1,239 @@
+import argparse
+import contextlib
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+import manage_app
+from device_connection import DeviceClient, DeviceConnection
+from source_index import MetadataIndex
+from sync_cache import DEFAULT_CACHE_DIR, ProcessingCache
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATES = 16
+# Small commands per run of the session benchmarks
+SESSION_COMMANDS = 500
+
+
+def make_corpus(corpus_dir, count, width=1600, height=1200, seed=0):
+    """
+    Write `count` synthetic JPEGs to corpus_dir (reused if it is already complete).
+    A few noisy templates are stamped with a random block per file, so every file is
+    distinct but the corpus is quick to build; every fourth photo is portrait and every
+    eighth is stored landscape with an EXIF rotation to portrait.
+    """
+    marker = os.path.join(corpus_dir, f".complete-{count}-{width}x{height}-{seed}")
+    if os.path.exists(marker):
+        return corpus_dir
+    shutil.rmtree(corpus_dir, ignore_errors=True)
+    rng = random.Random(seed)
+
+    templates = []
+    for i in range(TEMPLATES):
+        noise = Image.effect_noise((width // 4, height // 4), 40 + i * 4).convert('RGB')
+        tint = Image.new('RGB', noise.size, (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        templates.append(Image.blend(noise, tint, 0.5).resize((width, height), Image.Resampling.BILINEAR))
+
+    rotate_exif = Image.Exif()
+    rotate_exif[0x0112] = 6  # Orientation: rotate 90 CW
+
+    for i in range(count):
+        subdir = os.path.join(corpus_dir, f"{i // 1000:03d}")
+        if i % 1000 == 0:
+            os.makedirs(subdir, exist_ok=True)
+        img = templates[i % TEMPLATES].copy()
+        x, y = rng.randrange(width - 64), rng.randrange(height - 64)
+        img.paste((rng.randrange(256), rng.randrange(256), rng.randrange(256)), (x, y, x + 64, y + 64))
+        if i % 4 == 3:
+            img = img.transpose(Image.Transpose.ROTATE_90)
+        kwargs = {"exif": rotate_exif} if i % 8 == 5 else {}
+        img.save(os.path.join(subdir, f"IMG_{i:06d}.jpg"), quality=90, **kwargs)
+
+    open(marker, 'w').close()
+    return corpus_dir
+
+
+@contextlib.contextmanager
+def fake_device(args, history=0, locations=0):
+    """Run fake_device.py in its own process, so its CPU and memory don't count against sync."""
+    cmd = [sys.executable, os.path.join(SCRIPTS_DIR, 'fake_device.py'), '--port', '0',
+           '--resolution', args.resolution, '--latency-ms', str(args.latency_ms),
+           '--bandwidth-mbps', str(args.bandwidth_mbps), '--drop-rate', str(args.drop_rate),
+           '--seed', '0', '--history', str(history), '--locations', str(locations)]
+    if args.features is not None:
+        cmd += ['--features', args.features]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    try:
+        host, port = proc.stdout.readline().split()[-1].rsplit(':', 1)
+        yield host, int(port)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def device_stats(host, port):
+    with DeviceConnection(host, port) as conn:
+        return conn.request({"cmd": "fake_stats"})
+
+
+def run_commands(host, port, count, session):
+    """Send `count` small commands, over one DeviceClient session or a fresh connection each."""
+    if session:
+        with DeviceClient(host, port) as client:
+            for _ in range(count):
+                client.request({"cmd": "refresh_photos"})
+    else:
+        for _ in range(count):
+            with DeviceClient(host, port) as client:
+                client.request({"cmd": "refresh_photos"})
+
+
+def reset_peak_rss():
+    """Reset this process's peak RSS (Linux only). Returns False where that isn't possible."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in KB on Linux and bytes on macOS, and can't be reset
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+
+def measure(name, fn, count_fn=None, verbose=False):
+    """
+    Run fn() and return its wall time, CPU time (including reaped worker processes)
+    and peak RSS. count_fn() -> (files, bytes) after the run, for the rates.
+    """
+    reset_peak_rss()
+    self_before = resource.getrusage(resource.RUSAGE_SELF)
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(sys.stdout if verbose else devnull):
+        fn()
+    elapsed = time.perf_counter() - start
+    self_after = resource.getrusage(resource.RUSAGE_SELF)
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    cpu = (self_after.ru_utime - self_before.ru_utime + self_after.ru_stime - self_before.ru_stime
+           + children_after.ru_utime - children_before.ru_utime + children_after.ru_stime - children_before.ru_stime)
+    files, nbytes = count_fn() if count_fn else (0, 0)
+    result = {
+        "name": name,
+        "seconds": round(elapsed, 3),
+        "cpu_seconds": round(cpu, 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "files": files,
+        "files_per_s": round(files / elapsed, 1) if elapsed else 0,
+        "mb_per_s": round(nbytes / 1e6 / elapsed, 2) if elapsed else 0,
+    }
+    print(f"  {name:<28} {elapsed:8.2f}s  cpu {cpu:8.2f}s  {result['files_per_s']:9.1f} files/s"
+          f"  {result['mb_per_s']:8.2f} MB/s  peak {result['peak_rss_mb']:7.1f} MB", flush=True)
+    return result
+
+
+def bench_corpus(args, count, corpus_dir):
+    print(f"\n{count} images ({corpus_dir})")
+    work_dir = tempfile.mkdtemp(prefix='slideshowai-bench-')
+    results = []
+    try:
+        with fake_device(args, history=count, locations=count) as (host, port):
+            cache = ProcessingCache(os.path.join(work_dir, 'cache'))
+            index = MetadataIndex(os.path.join(work_dir, 'cache'))
+
+            def sync():
+                with DeviceClient(host, port) as client:
+                    manage_app.sync_direct_push(client, [corpus_dir], cache=cache, jobs=args.jobs, decode_mode=args.decode,
+                                                window=args.window, resume=args.resume, index=index)
+
+            def show_db():
+                with DeviceClient(host, port) as client:
+                    manage_app.show_db(client, "history")
+
+            last = {"files_received": 0, "bytes_received": 0}
+
+            def uploaded():
+                stats = device_stats(host, port)
+                delta = (stats["files_received"] - last["files_received"], stats["bytes_received"] - last["bytes_received"])
+                last.update(stats)
+                return delta
+
+            try:
+                results.append(measure("sync (cold)", sync, uploaded, args.verbose))
+                results.append(measure("sync (no changes)", sync, lambda: (count, 0), args.verbose))
+            finally:
+                cache.close()
+                index.close()
+
+            results.append(measure("show-db history", show_db, lambda: (count, 0)))
+            for session in (False, True):
+                results.append(measure(f"{SESSION_COMMANDS} cmds, {'one session' if session else 'connection each'}",
+                                       lambda: run_commands(host, port, SESSION_COMMANDS, session),
+                                       lambda: (SESSION_COMMANDS, 0)))
+
+        results.append(measure("report-orientation", lambda: manage_app.analyze_orientation([corpus_dir], args.threads),
+                               lambda: (count, 0)))
+        with MetadataIndex(os.path.join(work_dir, 'cache')) as index:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                manage_app.analyze_orientation([corpus_dir], args.threads, index)  # warm the index
+            results.append(measure("report-orientation (index)",
+                                   lambda: manage_app.analyze_orientation([corpus_dir], args.threads, index),
+                                   lambda: (count, 0)))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    for result in results:
+        result["corpus"] = count
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sync, show-db and report-orientation benchmarks against a local fake device')
+    parser.add_argument('--sizes', default='100,1000', help='Comma-separated corpus sizes (default 100,1000)')
+    parser.add_argument('--corpus-dir', default=os.path.join(DEFAULT_CACHE_DIR, 'bench'), help='Where synthetic corpora are kept between runs')
+    parser.add_argument('--image-size', default='1600x1200', help='Size of the synthetic photos (default 1600x1200)')
+    parser.add_argument('--resolution', default='1920x1200', help='Screen size of the fake device (default 1920x1200)')
+    parser.add_argument('--features', help="Optional protocol features the fake device advertises (default all; '' for the oldest builds)")
+    parser.add_argument('--latency-ms', type=float, default=0, help='Fake device reply latency (default 0)')
+    parser.add_argument('--bandwidth-mbps', type=float, default=0, help='Fake device receive cap in megabits/s (default unlimited)')
+    parser.add_argument('--drop-rate', type=float, default=0, help='Chance per MB that the fake device drops the connection (use with --resume)')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='sync --jobs (default 1)')
+    parser.add_argument('--decode', choices=['fast', 'exact'], default='fast', help='sync --decode (default fast)')
+    parser.add_argument('--window', type=int, default=16, help='sync --window (default 16)')
+    parser.add_argument('--resume', action='store_true', help='sync --resume')
+    parser.add_argument('--threads', type=int, default=16, help='report-orientation --threads (default 16)')
+    parser.add_argument('--json', dest='json_path', help='Also write the results as JSON, e.g. for CI')
+    parser.add_argument('--verbose', action='store_true', help="Show sync's own output")
+    args = parser.parse_args()
+
+    image_w, image_h = (int(x) for x in args.image_size.lower().split('x'))
+    all_results = []
+    for count in (int(n) for n in args.sizes.split(',')):
+        corpus_dir = os.path.join(args.corpus_dir, f"corpus-{count}")
+        print(f"Preparing {count} images...", flush=True)
+        make_corpus(corpus_dir, count, image_w, image_h)
+        all_results += bench_corpus(args, count, corpus_dir)
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({"settings": vars(args), "results": all_results}, f, indent=2)
+        print(f"\nWrote {args.json_path}")
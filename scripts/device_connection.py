@@ -0,0 +1,282 @@
+import json
+import socket
+import threading
+import time
+
+RECV_SIZE = 64 * 1024
+# Reconnect attempts per operation for resumable uploads and long-running syncs
+RECONNECT_RETRIES = 8
+# Reconnect attempts per command in a DeviceClient session; commands are small, so fail fast
+SESSION_RETRIES = 2
+# Commands DeviceClient may send again after a drop: they only read, or repeating them leaves
+# the same state (deleting a file that is already gone succeeds, metadata rows are replaced).
+# Anything else, e.g. delete_all_files or clear_db, may already have run and is not retried.
+IDEMPOTENT_COMMANDS = frozenset({
+    "get_device_info", "list_files", "list_changes", "list_thumbnails", "list_metadata", "get_db",
+    "upload_status", "refresh_photos", "delete_file", "delete_files", "put_metadata",
+})
+CONNECT_TIMEOUT = 10
+# An idle connection is probed after this many seconds, so a frame that went away is noticed
+KEEPALIVE_IDLE = 60
+
+
+def open_socket(host, port, timeout=None, connect_timeout=None):
+    """
+    Connect to the app. connect_timeout bounds the connect (default: timeout), timeout
+    every later send and recv (None: block). TCP keepalive is on, so long-lived idle
+    connections don't sit on a dead peer.
+    """
+    sock = socket.create_connection((host, port), timeout=connect_timeout if connect_timeout is not None else timeout)
+    sock.settimeout(timeout)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    if hasattr(socket, 'TCP_KEEPIDLE'):  # Linux; macOS only has TCP_KEEPALIVE
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, KEEPALIVE_IDLE)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+    return sock
+
+
+class DeviceConnection:
+    """
+    A TCP connection to the app that speaks its line-framed protocol.
+
+    Commands and replies are single JSON lines; file payloads are raw bytes that
+    follow a header line. Reads go through one buffer, so a line and the binary
+    data after it can arrive in the same recv() without either getting lost.
+    """
+
+    def __init__(self, host, port, timeout=None, sock=None, connect_timeout=None):
+        if sock is None:
+            sock = open_socket(host, port, timeout, connect_timeout)
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.sock = sock
+        self._buf = bytearray()
+        self._pos = 0
+        self._scanned = 0
+
+    @classmethod
+    def from_socket(cls, sock):
+        return cls(None, None, sock=sock)
+
+    def close(self):
+        self.sock.close()
+
+    def reconnect(self):
+        """Replace a broken socket with a fresh one to the same address, keeping its timeout."""
+        timeout = self.sock.gettimeout()
+        self.sock.close()
+        self.sock = open_socket(self.host, self.port, timeout, self.connect_timeout)
+        self._buf = bytearray()
+        self._pos = 0
+        self._scanned = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def settimeout(self, timeout):
+        self.sock.settimeout(timeout)
+
+    def is_stale(self):
+        """
+        True if this connection can't take a new command: the app closed it (e.g. after
+        its idle timeout), or bytes of an earlier reply are still unread.
+        """
+        if self._pos < len(self._buf):
+            return True
+        timeout = self.sock.gettimeout()
+        try:
+            self.sock.setblocking(False)
+            self.sock.recv(1, socket.MSG_PEEK)
+            return True  # EOF, or data nobody asked for
+        except BlockingIOError:
+            return False
+        except OSError:
+            return True
+        finally:
+            self.sock.settimeout(timeout)
+
+    # --- Writing ---
+
+    def sendall(self, data):
+        self.sock.sendall(data)
+
+    def send_json(self, obj, payload=None):
+        """Send one command line, optionally followed directly by a binary payload."""
+        line = json.dumps(obj).encode('utf-8') + b'\n'
+        if not payload or len(payload) <= RECV_SIZE:
+            self.sock.sendall(line + payload if payload else line)
+            return
+        # Large (possibly file-backed) payloads are sent from where they are, not copied after the header
+        with memoryview(payload) as view:
+            self.sock.sendall(line + view[:RECV_SIZE])
+            self.sock.sendall(view[RECV_SIZE:])
+
+    # --- Reading ---
+
+    def _fill(self):
+        # Drop consumed bytes once they make up most of the buffer, so lines are never copied twice.
+        if self._pos and self._pos * 2 >= len(self._buf):
+            del self._buf[:self._pos]
+            self._scanned -= self._pos
+            self._pos = 0
+        chunk = self.sock.recv(RECV_SIZE)
+        self._buf += chunk
+        return len(chunk)
+
+    def read_line(self):
+        """Read a line ending with \\n. At EOF, returns whatever was left ('' if nothing)."""
+        while True:
+            idx = self._buf.find(b'\n', max(self._scanned, self._pos))
+            if idx != -1:
+                line = bytes(self._buf[self._pos:idx])
+                self._pos = idx + 1
+                self._scanned = self._pos
+                return line.decode('utf-8')
+            self._scanned = len(self._buf)
+            if not self._fill():
+                line = bytes(self._buf[self._pos:])
+                self._pos = self._scanned = len(self._buf)
+                return line.decode('utf-8')
+
+    def read_json(self):
+        """Read one reply line and parse it. Returns None if the connection closed."""
+        line = self.read_line()
+        return json.loads(line) if line else None
+
+    def read_exact(self, size):
+        """Read exactly size bytes of binary payload."""
+        while len(self._buf) - self._pos < size:
+            if not self._fill():
+                raise ConnectionError(f"Connection closed with {size - (len(self._buf) - self._pos)} bytes outstanding")
+        data = bytes(self._buf[self._pos:self._pos + size])
+        self._pos += size
+        self._scanned = max(self._scanned, self._pos)
+        return data
+
+    def request(self, obj):
+        """Send a command and wait for its single-line JSON reply."""
+        self.send_json(obj)
+        return self.read_json()
+
+
+def with_reconnect(s, fn, retries=RECONNECT_RETRIES, what="request"):
+    """
+    Run fn(); if the connection drops, reconnect s with exponential backoff and run it again.
+    Gives up and re-raises after `retries` reconnects (retries=0 just runs fn).
+    """
+    delay = 0.5
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except (OSError, ValueError) as e:  # ValueError: a reply line cut short by the drop
+            if attempt == retries:
+                raise
+            print(f"    Connection lost during {what} ({e}); reconnecting in {delay:.1f}s...")
+            time.sleep(delay)
+            delay = min(delay * 2, 30)
+            try:
+                s.reconnect()
+            except OSError as e:
+                print(f"    Reconnect failed: {e}")
+
+
+class DeviceClient:
+    """
+    A session with one device, for running many commands over one connection.
+    Connects on first use and keeps the connection open between commands; a command
+    whose connection turns out to have dropped (the app restarted, Wi-Fi blipped)
+    is retried on a fresh one. Replies to get_device_info are kept in `info`.
+    """
+
+    def __init__(self, host, port, timeout=None, connect_timeout=CONNECT_TIMEOUT, retries=SESSION_RETRIES):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.info = None
+        self._conn = None
+
+    @property
+    def key(self):
+        return f"{self.host}:{self.port}"
+
+    @property
+    def conn(self):
+        """The DeviceConnection, for streaming replies and uploads. (Re)connects if needed."""
+        if self._conn is None:
+            self._connect()
+        elif self._conn.is_stale():
+            self._conn.reconnect()
+        return self._conn
+
+    def _connect(self):
+        self._conn = DeviceConnection(self.host, self.port, self.timeout, connect_timeout=self.connect_timeout)
+
+    def reconnect(self):
+        if self._conn is None:
+            self._connect()
+        else:
+            self._conn.reconnect()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def request(self, obj):
+        """
+        Send a command and return its parsed reply. If the connection is gone, idempotent
+        commands (IDEMPOTENT_COMMANDS) are retried on a new one; others raise, since the
+        app may already have run them.
+        """
+        def attempt():
+            reply = self.conn.request(obj)
+            if reply is None:
+                raise ConnectionError("Connection closed by the app")
+            return reply
+        cmd = obj.get("cmd", "request")
+        return with_reconnect(self, attempt, self.retries if cmd in IDEMPOTENT_COMMANDS else 0, cmd)
+
+
+class DeviceSessions:
+    """
+    DeviceClients by address, so every command for the same device reuses one
+    connection. Safe to use from several threads (e.g. a fleet sync).
+    """
+
+    def __init__(self, timeout=None, connect_timeout=CONNECT_TIMEOUT, retries=SESSION_RETRIES):
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def get(self, host, port):
+        with self.lock:
+            client = self.clients.get((host, port))
+            if client is None:
+                client = self.clients[(host, port)] = DeviceClient(host, port, self.timeout, self.connect_timeout, self.retries)
+            return client
+
+    def close(self):
+        for client in self.clients.values():
+            client.close()
+        self.clients.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,378 @@
+import argparse
+import hashlib
+import json
+import random
+import socket
+import threading
+import time
+
+from device_connection import DeviceConnection
+
+ALL_FEATURES = ("put_file", "list_changes", "delete_files", "put_chunk", "db_query", "put_thumbnail", "put_metadata")
+RECV_CHUNK = 64 * 1024
+
+
+class LinkShaper:
+    """
+    Emulates a slow, lossy link on the device side: a fixed delay before every reply,
+    a receive rate cap shared by all connections, and a chance of the connection
+    dropping while a payload is being received.
+    """
+
+    def __init__(self, latency=0.0, bandwidth=0.0, drop_rate=0.0, seed=None):
+        self.latency = latency
+        self.bandwidth = bandwidth  # bytes per second, 0 = unlimited
+        self.drop_rate = drop_rate  # per MB received
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.next_free = time.monotonic()
+
+    def reply_delay(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def throttle(self, nbytes):
+        if not self.bandwidth:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.next_free = max(self.next_free, now) + nbytes / self.bandwidth
+            wait = self.next_free - now
+        if wait > 0:
+            time.sleep(wait)
+
+    def should_drop(self, nbytes):
+        if not self.drop_rate:
+            return False
+        with self.lock:
+            return self.random.random() < self.drop_rate * nbytes / 1e6
+
+
+class DroppedConnection(Exception):
+    pass
+
+
+class FakeDevice:
+    """
+    In-process stand-in for the app's TCP command server (MainViewModel.handleTcpCommand).
+    Photos are kept as (size, sha1) only, so large corpora fit in memory. The manifest
+    generation counter, tombstones and partial uploads behave like the app's.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, width=1920, height=1200, features=ALL_FEATURES,
+                 decoders=None, shaper=None, history=0, locations=0):
+        self.width = width
+        self.height = height
+        self.features = list(features)
+        # Builds that predate optional features also predate the decoders field
+        if decoders is None:
+            decoders = ("jpeg", "png", "webp") if self.features else ()
+        self.decoders = list(decoders)
+        self.shaper = shaper or LinkShaper()
+        self.lock = threading.Lock()
+        self.epoch = f"{random.getrandbits(32):08x}"
+        self.generation = 0
+        self.manifest = {}  # name -> [size, sha1, generation, deleted]
+        self.partials = {}  # name -> (hashlib object, size)
+        self.thumbnails = {}  # photo name -> thumbnail size
+        self.metadata = {}  # photo name -> put_metadata row
+        now = int(time.time() * 1000)
+        self.history = {f"IMG_{i:06d}.jpg": now - i * 60000 for i in range(history)}
+        self.locations = {f"IMG_{i:06d}.jpg": f"City {i % 500}, Country {i % 40}" for i in range(locations)}
+        self.stats = {"connections": 0, "commands": 0, "bytes_received": 0, "files_received": 0, "files_deleted": 0,
+                      "thumbnails_received": 0, "metadata_received": 0, "drops": 0}
+
+        self.server = socket.create_server((host, port))
+        self.address = self.server.getsockname()[:2]
+        self.thread = None
+        self.running = False
+
+    # --- Lifecycle ---
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        self.server.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                sock, _ = self.server.accept()
+            except OSError:
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.stats["connections"] += 1
+            threading.Thread(target=self._serve, args=(sock,), daemon=True).start()
+
+    def _serve(self, sock):
+        conn = DeviceConnection.from_socket(sock)
+        try:
+            while True:
+                line = conn.read_line()
+                if not line:
+                    break
+                replies = self.handle(json.loads(line), conn)
+                self.shaper.reply_delay()
+                for reply in replies:
+                    conn.send_json(reply)
+        except DroppedConnection:
+            self.stats["drops"] += 1
+        except (OSError, ValueError):
+            pass
+        finally:
+            conn.close()
+
+    # --- Protocol ---
+
+    def _receive(self, conn, size, digest):
+        """Read a payload through the shaper, feeding it to digest. Returns the bytes that arrived."""
+        received = 0
+        while received < size:
+            n = min(RECV_CHUNK, size - received)
+            self.shaper.throttle(n)
+            if self.shaper.should_drop(n):
+                # Keep what arrived before the drop, like a partial file on the device
+                data = conn.read_exact(n // 2)
+                digest.update(data)
+                received += len(data)
+                self.stats["bytes_received"] += len(data)
+                raise DroppedConnection(received)
+            data = conn.read_exact(n)
+            digest.update(data)
+            received += n
+            self.stats["bytes_received"] += n
+        return received
+
+    def _record_file(self, name, size, sha1):
+        with self.lock:
+            self.generation += 1
+            self.manifest[name] = [size, sha1, self.generation, False]
+            self.stats["files_received"] += 1
+
+    def _record_deleted(self, name):
+        with self.lock:
+            entry = self.manifest.get(name)
+            if entry is None or entry[3]:
+                return False
+            self.generation += 1
+            entry[2:] = [self.generation, True]
+            self.thumbnails.pop(name, None)
+            self.metadata.pop(name, None)
+            self.history.pop(name, None)
+            self.locations.pop(name, None)
+            self.stats["files_deleted"] += 1
+            return True
+
+    def _files(self):
+        return [name for name, entry in self.manifest.items() if not entry[3]]
+
+    def handle(self, cmd, conn):
+        """Handle one command; returns the reply lines to send."""
+        self.stats["commands"] += 1
+        name = cmd.get("cmd")
+
+        if name == "get_device_info":
+            info = {"status": "ok", "width": self.width, "height": self.height, "features": self.features}
+            if self.decoders:
+                info["decoders"] = self.decoders
+            return [info]
+
+        if name == "list_files":
+            return [{"status": "ok", "files": self._files()}]
+
+        if name == "list_changes" and "list_changes" in self.features:
+            epoch, _, gen = cmd.get("since", "").partition(":")
+            since = int(gen) if epoch == self.epoch and gen.isdigit() else 0
+            with self.lock:
+                full = since <= 0 or since > self.generation
+                changed = [(n, e) for n, e in self.manifest.items() if (not e[3] if full else e[2] > since)]
+                token = f"{self.epoch}:{self.generation}"
+            return [{"status": "ok", "token": token, "full": full,
+                     "files": [{"name": n, "size": e[0], "sha1": e[1]} for n, e in changed if not e[3]],
+                     "deleted": [n for n, e in changed if e[3]]}]
+
+        if name == "receive_file":
+            conn.send_json({"status": "ready"})
+            digest = hashlib.sha1()
+            self._receive(conn, cmd["size"], digest)
+            self._record_file(cmd["name"], cmd["size"], digest.hexdigest())
+            return [{"status": "ok", "message": "File received"}]
+
+        if name == "put_file" and "put_file" in self.features:
+            digest = hashlib.sha1()
+            self._receive(conn, cmd["size"], digest)
+            self._record_file(cmd["name"], cmd["size"], digest.hexdigest())
+            return [{"status": "ok", "name": cmd["name"], "message": "File received"}]
+
+        if name == "put_thumbnail" and "put_thumbnail" in self.features:
+            self._receive(conn, cmd["size"], hashlib.sha1())
+            with self.lock:
+                self.thumbnails[cmd["name"]] = cmd["size"]
+                self.stats["thumbnails_received"] += 1
+            return [{"status": "ok", "name": cmd["name"], "message": "Thumbnail received"}]
+
+        if name == "list_thumbnails" and "put_thumbnail" in self.features:
+            return [{"status": "ok", "files": list(self.thumbnails)}]
+
+        if name == "put_metadata" and "put_metadata" in self.features:
+            with self.lock:
+                for row in cmd["photos"]:
+                    self.metadata[row["name"]] = row
+                    if row.get("location"):
+                        self.locations[row["name"]] = row["location"]
+                self.stats["metadata_received"] += len(cmd["photos"])
+            return [{"status": "ok", "stored": len(cmd["photos"]),
+                     "message": f"Stored metadata for {len(cmd['photos'])} photos"}]
+
+        if name == "list_metadata" and "put_metadata" in self.features:
+            return [{"status": "ok", "files": list(self.metadata)}]
+
+        if name == "upload_status" and "put_chunk" in self.features:
+            digest, size = self.partials.get(cmd["name"], (None, 0))
+            if size > cmd["size"]:
+                self.partials.pop(cmd["name"], None)
+                size = 0
+            return [{"status": "ok", "name": cmd["name"], "offset": size}]
+
+        if name == "put_chunk" and "put_chunk" in self.features:
+            return self._put_chunk(cmd, conn)
+
+        if name == "refresh_photos":
+            return [{"status": "ok", "message": "Photos refreshed"}]
+
+        if name == "delete_file":
+            if self._record_deleted(cmd["name"]):
+                return [{"status": "ok", "message": f"Deleted {cmd['name']}"}]
+            return [{"status": "ok", "message": "File not found (already deleted)"}]
+
+        if name == "delete_files" and "delete_files" in self.features:
+            names = cmd["names"]
+            for n in names:
+                self._record_deleted(n)
+            return [{"status": "ok", "message": f"Deleted {len(names)} of {len(names)} files",
+                     "deleted": len(names), "failed": []}]
+
+        if name == "delete_all_files":
+            for n in self._files():
+                self._record_deleted(n)
+            self.thumbnails.clear()
+            self.metadata.clear()
+            self.history.clear()
+            self.locations.clear()
+            return [{"status": "ok", "message": "All photos and data deleted"}]
+
+        if name == "get_db":
+            if cmd["db"] == "location":
+                data = [{"fileName": n, "location": loc} for n, loc in self.locations.items()]
+            elif cmd["db"] == "history":
+                data = [{"fileName": n, "lastShown": t} for n, t in self.history.items()]
+            else:
+                return [{"status": "error", "message": f"Unknown db: {cmd['db']}"}]
+            if "db_query" in self.features and (cmd.get("stream") or "page_size" in cmd):
+                return self._query_db(cmd, cmd["db"], data)
+            return [{"status": "ok", "data": data}]
+
+        if name == "clear_db":
+            if cmd["db"] == "location":
+                self.locations.clear()
+                return [{"status": "ok", "message": "Location DB cleared"}]
+            if cmd["db"] == "history":
+                self.history.clear()
+                return [{"status": "ok", "message": "History DB cleared"}]
+            return [{"status": "error", "message": f"Unknown db: {cmd['db']}"}]
+
+        if name == "fake_stats":
+            # Not part of the app's protocol; lets benchmarks read the server-side counters
+            return [dict(self.stats, status="ok", files=len(self._files()))]
+
+        return [{"status": "error", "message": f"Unknown command: {name}"}]
+
+    @staticmethod
+    def _query_db(cmd, db, data):
+        """Filtering, (sort, fileName) keyset paging and NDJSON streaming, as in MainViewModel.queryDb."""
+        name = cmd.get("name", "").lower()
+        rows = [r for r in data if name in r["fileName"].lower()]
+        # Each table has its own sort column and filters; anything else sorts by fileName
+        if db == "history":
+            sort = "lastShown" if cmd.get("sort") == "lastShown" else "fileName"
+            rows = [r for r in rows
+                    if ("shown_before" not in cmd or r["lastShown"] < cmd["shown_before"])
+                    and ("shown_after" not in cmd or r["lastShown"] >= cmd["shown_after"])]
+        else:
+            sort = "location" if cmd.get("sort") == "location" else "fileName"
+            location = cmd.get("location", "").lower()
+            rows = [r for r in rows if location in r["location"].lower()]
+        desc = cmd.get("order") == "desc"
+        rows.sort(key=lambda r: (r[sort], r["fileName"]), reverse=desc)
+
+        if cmd.get("stream"):
+            rows = rows[:cmd["limit"]] if "limit" in cmd else rows
+            return [{"status": "ok", "stream": True}] + rows + [{"end": True, "count": len(rows)}]
+
+        if cmd.get("cursor"):
+            after = tuple(cmd["cursor"])
+            rows = [r for r in rows if ((r[sort], r["fileName"]) < after if desc else (r[sort], r["fileName"]) > after)]
+        page = rows[:max(1, min(cmd["page_size"], 500))]
+        more = len(rows) > len(page)
+        return [{"status": "ok", "data": page, "next": [page[-1][sort], page[-1]["fileName"]] if more else None}]
+
+    def _put_chunk(self, cmd, conn):
+        name = cmd["name"]
+        digest, size = self.partials.get(name, (hashlib.sha1(), 0))
+        if size != cmd["offset"]:
+            conn.read_exact(cmd["size"])
+            return [{"status": "error", "name": name, "message": "Offset mismatch", "offset": size}]
+        try:
+            size += self._receive(conn, cmd["size"], digest)
+        except DroppedConnection as e:
+            self.partials[name] = (digest, size + e.args[0])
+            raise
+        if size < cmd["total"]:
+            self.partials[name] = (digest, size)
+            return [{"status": "ok", "name": name, "offset": size, "complete": False}]
+        self.partials.pop(name, None)
+        if digest.hexdigest() != cmd["sha1"]:
+            return [{"status": "error", "name": name, "message": "Checksum mismatch", "offset": 0}]
+        self._record_file(name, size, cmd["sha1"])
+        return [{"status": "ok", "name": name, "message": "File received", "offset": size, "complete": True}]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stand-in for the app\'s TCP command server, for testing and benchmarking sync')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=4000, help='TCP port, 0 for any free port (default 4000)')
+    parser.add_argument('--resolution', default='1920x1200', help='Screen size reported by get_device_info (default 1920x1200)')
+    parser.add_argument('--features', default=','.join(ALL_FEATURES), help="Comma-separated optional features to advertise; '' emulates the oldest builds")
+    parser.add_argument('--decoders', help="Comma-separated decoders to advertise (default jpeg,png,webp; none with --features '')")
+    parser.add_argument('--latency-ms', type=float, default=0, help='Delay before every reply (default 0)')
+    parser.add_argument('--bandwidth-mbps', type=float, default=0, help='Cap on received payload rate in megabits/s (default unlimited)')
+    parser.add_argument('--drop-rate', type=float, default=0, help='Chance per MB received that the connection drops mid-payload (default 0)')
+    parser.add_argument('--seed', type=int, help='Random seed for drops')
+    parser.add_argument('--history', type=int, default=0, help='Seed the history DB with this many rows')
+    parser.add_argument('--locations', type=int, default=0, help='Seed the location DB with this many rows')
+    args = parser.parse_args()
+
+    width, height = (int(x) for x in args.resolution.lower().split('x'))
+    shaper = LinkShaper(args.latency_ms / 1000, args.bandwidth_mbps * 1e6 / 8, args.drop_rate, args.seed)
+    device = FakeDevice(args.host, args.port, width, height,
+                        [f for f in args.features.split(',') if f],
+                        None if args.decoders is None else [d for d in args.decoders.split(',') if d],
+                        shaper, args.history, args.locations)
+    host, port = device.address
+    print(f"Listening on {host}:{port}", flush=True)
+    device.start()
+    try:
+        device.thread.join()
+    except KeyboardInterrupt:
+        device.stop()
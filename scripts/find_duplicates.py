@@ -1,36 +1,38 @@
 import argparse
 import os
-from pathlib import Path
+import hashlib
+import sqlite3
+import concurrent.futures
 from collections import defaultdict
+from PIL import Image, ImageOps
+import pillow_heif
 
-def find_duplicates(directories):
+from source_index import MetadataIndex, scan_sources
+from sync_cache import DEFAULT_CACHE_DIR
+
+# Register HEIF opener, once at import: doing it per image would rewrite Pillow's
+# format registry while hashing threads are opening files
+pillow_heif.register_heif_opener()
+
+# Bytes read from each end of a file for the partial hash
+EDGE_SIZE = 64 * 1024
+
+def find_duplicates(directories, recursive=False, index=None):
     # Dictionary to store mapping: stem -> List[(path, size)]
     # "stem" is the name to the left of the last dot
     duplicates = defaultdict(list)
-    
-    for dir_path in directories:
-        path = Path(dir_path)
-        if not path.is_dir():
-            print(f"Warning: {dir_path} is not a directory or does not exist. Skipping.")
-            continue
-            
-        for file in path.iterdir():
-            if file.is_file():
-                # Filter to only consider extensions supported by the sync operation
-                if not file.name.lower().endswith(('.jpg', '.jpeg', '.png', '.webp', '.heic')):
-                    continue
-
-                # stem is already part of Path, but as per user request 
-                # "to the left of the last dot", we'll be explicit
-                name = file.name
-                last_dot_index = name.rfind('.')
-                if last_dot_index == -1:
-                    stem = name
-                else:
-                    stem = name[:last_dot_index]
-                
-                size = file.stat().st_size
-                duplicates[stem].append((file.absolute(), size))
+
+    # Only names and sizes are needed, so photos in unchanged directories are not stat'ed again
+    for file in scan_sources(directories, index, recursive=recursive, verify_files=False):
+        # "to the left of the last dot", so "a.b.jpg" has stem "a.b"
+        name = os.path.basename(file.path)
+        last_dot_index = name.rfind('.')
+        if last_dot_index == -1:
+            stem = name
+        else:
+            stem = name[:last_dot_index]
+
+        duplicates[stem].append((file.path, file.st_size))
 
     # Filter for entries with more than one file
     results = {stem: files for stem, files in duplicates.items() if len(files) > 1}
@@ -54,12 +56,231 @@ def find_duplicates(directories):
             print(f"  {p} ({s} bytes)")
         print()
 
+class HashCache:
+    """Persistent partial/full/perceptual hashes, valid while a file's mtime and size are unchanged."""
+
+    COLUMNS = ('partial', 'full', 'dhash')
+
+    def __init__(self, cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(cache_dir, 'hashes.sqlite3'))
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS hashes (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                partial TEXT,
+                full TEXT,
+                dhash TEXT
+            )""")
+        self.rows = {row[0]: row[1:] for row in self.db.execute("SELECT * FROM hashes")}
+
+    def get(self, path, st, column):
+        row = self.rows.get(str(path))
+        if row and row[0] == st.st_mtime_ns and row[1] == st.st_size:
+            return row[2 + self.COLUMNS.index(column)]
+        return None
+
+    def put(self, path, st, column, value):
+        row = self.rows.get(str(path))
+        if not row or row[0] != st.st_mtime_ns or row[1] != st.st_size:
+            row = (st.st_mtime_ns, st.st_size, None, None, None)
+        row = list(row)
+        row[2 + self.COLUMNS.index(column)] = value
+        self.rows[str(path)] = tuple(row)
+        self.db.execute("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?)", (str(path), *row))
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+def partial_hash(path, size):
+    """Hash of the first and last EDGE_SIZE bytes; the whole file if it is smaller than both."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        h.update(f.read(EDGE_SIZE))
+        if size > 2 * EDGE_SIZE:
+            f.seek(-EDGE_SIZE, os.SEEK_END)
+        h.update(f.read(EDGE_SIZE))
+    return h.hexdigest()
+
+def full_hash(path):
+    h = hashlib.blake2b(digest_size=32)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def perceptual_hash(path):
+    """64-bit difference hash of the image as displayed, as 16 hex digits."""
+    with Image.open(path) as img:
+        img.draft('L', (64, 64))
+        img = ImageOps.exif_transpose(img).convert('L').resize((9, 8), Image.Resampling.LANCZOS)
+        pixels = img.tobytes()
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+def hash_stage(files, column, fn, cache, pool):
+    """
+    Compute `column` for every (path, stat) in files, using the cache where possible.
+    Returns {path: hash}; files that could not be read are left out.
+    """
+    results = {}
+    todo = []
+    for path, st in files:
+        cached = cache.get(path, st, column) if cache else None
+        if cached is not None:
+            results[path] = cached
+        else:
+            todo.append((path, st))
+
+    futures = {pool.submit(fn, path, st): (path, st) for path, st in todo}
+    for future in concurrent.futures.as_completed(futures):
+        path, st = futures[future]
+        try:
+            value = future.result()
+        except Exception as e:
+            print(f"Warning: could not read {path}: {e}")
+            continue
+        results[path] = value
+        if cache:
+            cache.put(path, st, column, value)
+    return results
+
+def group_colliding(values):
+    """Group keys of {key: value} by value, keeping only groups with more than one key."""
+    groups = defaultdict(list)
+    for key, value in values.items():
+        groups[value].append(key)
+    return [keys for keys in groups.values() if len(keys) > 1]
+
+def group_similar(dhashes, max_distance):
+    """
+    Group paths whose perceptual hashes differ in at most max_distance bits.
+    By pigeonhole, two such hashes agree exactly on at least one of max_distance + 1
+    bit segments, so only paths sharing a segment are compared.
+    """
+    paths = list(dhashes)
+    values = [int(dhashes[p], 16) for p in paths]
+    parent = list(range(len(paths)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    segments = max_distance + 1
+    bounds = [64 * i // segments for i in range(segments + 1)]
+    for seg in range(segments):
+        lo, hi = bounds[seg], bounds[seg + 1]
+        mask = (1 << (hi - lo)) - 1
+        buckets = defaultdict(list)
+        for i, value in enumerate(values):
+            buckets[(value >> lo) & mask].append(i)
+        for bucket in buckets.values():
+            for a in range(len(bucket)):
+                for b in range(a + 1, len(bucket)):
+                    i, j = bucket[a], bucket[b]
+                    if find(i) != find(j) and bin(values[i] ^ values[j]).count('1') <= max_distance:
+                        parent[find(i)] = find(j)
+
+    groups = defaultdict(list)
+    for i, path in enumerate(paths):
+        groups[find(i)].append(path)
+    return [g for g in groups.values() if len(g) > 1]
+
+def find_content_duplicates(directories, threads=8, cache_dir=DEFAULT_CACHE_DIR, use_cache=True, perceptual=False, max_distance=4, rescan=False):
+    """
+    Find byte-identical files in stages, hashing as little as possible:
+    group by size, then hash the first and last 64 KB of files that share a size,
+    then fully hash only the files that still collide.
+    With perceptual=True, also group visually similar images (e.g. the same shot as HEIC and JPEG).
+    """
+    cache = HashCache(cache_dir) if use_cache else None
+    try:
+        # The scan's SourceFiles carry st_size and st_mtime_ns, which is all the stages and the cache use
+        if use_cache:
+            with MetadataIndex(cache_dir) as index:
+                if rescan:
+                    index.invalidate()
+                files = {file.path: file for file in scan_sources(directories, index)}
+        else:
+            files = {file.path: file for file in scan_sources(directories)}
+        print(f"Scanned {len(files)} files.")
+
+        # Stage 1: size
+        by_size = defaultdict(list)
+        for path, st in files.items():
+            by_size[st.st_size].append(path)
+        candidates = [(p, files[p]) for paths in by_size.values() if len(paths) > 1 for p in paths]
+        print(f"Stage 1 (size): {len(candidates)} files share a size.")
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as pool:
+            # Stage 2: first + last 64 KB
+            partials = hash_stage(candidates, 'partial', lambda p, st: partial_hash(p, st.st_size), cache, pool)
+            keyed = {p: (files[p].st_size, h) for p, h in partials.items()}
+            candidates = [(p, files[p]) for group in group_colliding(keyed) for p in group]
+            print(f"Stage 2 (partial hash): {len(candidates)} files still collide.")
+
+            # Stage 3: full contents
+            fulls = hash_stage(candidates, 'full', lambda p, st: full_hash(p), cache, pool)
+            identical = group_colliding(fulls)
+            print(f"Stage 3 (full hash): {len(identical)} groups of identical files.")
+
+            similar = []
+            if perceptual:
+                dhashes = hash_stage(list(files.items()), 'dhash', lambda p, st: perceptual_hash(p), cache, pool)
+                # Byte-identical files are already reported above
+                duplicates_of = {p: tuple(sorted(g)) for g in identical for p in g}
+                similar = [g for g in group_similar(dhashes, max_distance)
+                           if len({duplicates_of.get(p, p) for p in g}) > 1]
+                print(f"Perceptual stage: {len(similar)} groups of similar images.")
+    finally:
+        if cache:
+            cache.close()
+
+    if not identical and not similar:
+        print("No duplicate files found.")
+        return
+
+    print()
+    for group in sorted(identical, key=sorted):
+        print(f"--- Group: {fulls[group[0]][:12]} [IDENTICAL] ---")
+        for p in sorted(group):
+            print(f"  {p} ({files[p].st_size} bytes)")
+        print()
+    for group in sorted(similar, key=sorted):
+        print(f"--- Group: {dhashes[group[0]]} [SIMILAR] ---")
+        for p in sorted(group):
+            print(f"  {p} ({files[p].st_size} bytes)")
+        print()
+
 def main():
     parser = argparse.ArgumentParser(description="Find duplicate filenames across directories (ignoring extensions) and compare sizes.")
     parser.add_argument("directories", nargs="+", help="One or more directories to scan.")
-    
+    parser.add_argument("-r", "--recursive", action="store_true", help="Also scan subdirectories (always on with --content).")
+    parser.add_argument("--content", action="store_true", help="Compare file contents instead of names: size, then partial hash, then full hash.")
+    parser.add_argument("--perceptual", action="store_true", help="With --content, also group visually similar images (e.g. HEIC and JPEG of the same shot).")
+    parser.add_argument("--max-distance", type=int, default=4, help="Max differing bits between perceptual hashes (default 4).")
+    parser.add_argument("--threads", type=int, default=8, help="Files to hash concurrently (default 8).")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help=f"Hash cache and metadata index location (default {DEFAULT_CACHE_DIR}).")
+    parser.add_argument("--rescan", action="store_true", help="List every directory again, not just the ones whose mtime changed.")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or update the hash cache or metadata index.")
+
     args = parser.parse_args()
-    find_duplicates(args.directories)
+    if args.content:
+        find_content_duplicates(args.directories, args.threads, args.cache_dir, not args.no_cache, args.perceptual, args.max_distance, args.rescan)
+    elif args.no_cache:
+        find_duplicates(args.directories, args.recursive)
+    else:
+        with MetadataIndex(args.cache_dir) as index:
+            if args.rescan:
+                index.invalidate()
+            find_duplicates(args.directories, args.recursive, index)
 
 if __name__ == "__main__":
     main()
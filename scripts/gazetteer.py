@@ -0,0 +1,182 @@
+import collections
+import glob
+import math
+import os
+import sqlite3
+
+from sync_cache import DEFAULT_CACHE_DIR
+
+# Where sync looks for a gazetteer when none is given: the first cities*.txt in here
+DEFAULT_GAZETTEER_DIR = os.path.join(DEFAULT_CACHE_DIR, 'gazetteer')
+
+# Positions are resolved and cached rounded to this many decimals (0.01 degrees is about 1 km),
+# so photos taken around the same spot share one lookup
+PLACE_KEY_DECIMALS = 2
+# Farthest a photo may be from the nearest place in the gazetteer and still be named after it
+MAX_DISTANCE_KM = 50
+GRID_DEGREES = 1.0
+EARTH_RADIUS_KM = 6371.0
+
+Place = collections.namedtuple('Place', 'latitude longitude name country_code admin1_code')
+
+
+def place_key(latitude, longitude):
+    """The rounded position a photo's place name is looked up (and cached) under."""
+    return f"{latitude:.{PLACE_KEY_DECIMALS}f},{longitude:.{PLACE_KEY_DECIMALS}f}"
+
+
+def default_gazetteer():
+    """The first cities*.txt in DEFAULT_GAZETTEER_DIR, or None."""
+    found = sorted(glob.glob(os.path.join(DEFAULT_GAZETTEER_DIR, 'cities*.txt')))
+    return found[0] if found else None
+
+
+def _distance_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class Gazetteer:
+    """
+    Offline reverse geocoder over a GeoNames cities file (cities500.txt, cities1000.txt,
+    cities5000.txt or cities15000.txt from download.geonames.org/export/dump). Names
+    a position after the nearest place within MAX_DISTANCE_KM, the way the app words
+    it: "City, State" in the US, "City, Country" elsewhere. State and country names
+    come from admin1CodesASCII.txt and countryInfo.txt next to the cities file, if
+    they are there; otherwise the codes are used.
+
+    The file is read on the first lookup, into a grid of GRID_DEGREES cells.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        st = os.stat(path)
+        # Place names cached for another file (or version of it) don't count
+        self.identity = f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}"
+        self.grid = None
+        self.admin1 = {}
+        self.countries = {}
+
+    def _load(self):
+        self.grid = collections.defaultdict(list)
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) < 11:
+                    continue
+                try:
+                    latitude, longitude = float(fields[4]), float(fields[5])
+                except ValueError:
+                    continue
+                place = Place(latitude, longitude, fields[1], fields[8], fields[10])
+                self.grid[self._cell(latitude, longitude)].append(place)
+
+        directory = os.path.dirname(self.path)
+        try:
+            with open(os.path.join(directory, 'admin1CodesASCII.txt'), encoding='utf-8') as f:
+                for line in f:
+                    fields = line.rstrip('\n').split('\t')
+                    if len(fields) >= 2:
+                        self.admin1[fields[0]] = fields[1]
+        except OSError:
+            pass
+        try:
+            with open(os.path.join(directory, 'countryInfo.txt'), encoding='utf-8') as f:
+                for line in f:
+                    fields = line.rstrip('\n').split('\t')
+                    if not line.startswith('#') and len(fields) >= 5:
+                        self.countries[fields[0]] = fields[4]
+        except OSError:
+            pass
+
+    @staticmethod
+    def _cell(latitude, longitude):
+        return math.floor(latitude / GRID_DEGREES), math.floor(longitude / GRID_DEGREES)
+
+    def nearest(self, latitude, longitude):
+        """The closest Place within MAX_DISTANCE_KM, or None."""
+        if self.grid is None:
+            self._load()
+        row, col = self._cell(latitude, longitude)
+        lat_cells = math.ceil(MAX_DISTANCE_KM / (111.2 * GRID_DEGREES))
+        # Cells narrow towards the poles, so more of them are needed to cover the distance
+        lon_km = 111.2 * GRID_DEGREES * max(math.cos(math.radians(min(abs(latitude) + GRID_DEGREES * lat_cells, 90))), 0.01)
+        lon_cells = min(math.ceil(MAX_DISTANCE_KM / lon_km), math.ceil(180 / GRID_DEGREES))
+        lon_count = round(360 / GRID_DEGREES)
+
+        best, best_km = None, MAX_DISTANCE_KM
+        for r in range(row - lat_cells, row + lat_cells + 1):
+            for c in range(col - lon_cells, col + lon_cells + 1):
+                # Wrap around the antimeridian
+                wrapped = (c + lon_count // 2) % lon_count - lon_count // 2
+                for place in self.grid.get((r, wrapped), ()):
+                    km = _distance_km(latitude, longitude, place.latitude, place.longitude)
+                    if km <= best_km:
+                        best, best_km = place, km
+        return best
+
+    def name(self, latitude, longitude):
+        """The place name for a position, or None if nothing in the gazetteer is near it."""
+        place = self.nearest(latitude, longitude)
+        if place is None:
+            return None
+        if place.country_code == 'US':
+            state = self.admin1.get(f"US.{place.admin1_code}", place.admin1_code)
+            return f"{place.name}, {state}" if state else place.name
+        return f"{place.name}, {self.countries.get(place.country_code, place.country_code)}"
+
+
+class ReverseGeocoder:
+    """
+    Batch place-name lookups through a Gazetteer, remembered by place_key in
+    places.sqlite3 in the cache directory (in memory if cache_dir is None). Positions
+    that resolve to nothing are remembered as well. A repeated place costs one SQLite
+    lookup, and the gazetteer is only read when some place is new.
+    """
+
+    def __init__(self, gazetteer_path, cache_dir=DEFAULT_CACHE_DIR):
+        self.gazetteer = Gazetteer(gazetteer_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.db = sqlite3.connect(os.path.join(cache_dir, 'places.sqlite3'))
+        else:
+            self.db = sqlite3.connect(':memory:')
+        self.db.execute("CREATE TABLE IF NOT EXISTS places (key TEXT PRIMARY KEY, location TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        row = self.db.execute("SELECT value FROM meta WHERE name = 'gazetteer'").fetchone()
+        if not row or row[0] != self.gazetteer.identity:
+            self.db.execute("DELETE FROM places")
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('gazetteer', ?)", (self.gazetteer.identity,))
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def resolve(self, positions):
+        """{place_key: name or None} for an iterable of (latitude, longitude)."""
+        keys = list(dict.fromkeys(place_key(latitude, longitude) for latitude, longitude in positions))
+        names = {}
+        # Stay under SQLite's bound-parameter limit
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            query = f"SELECT key, location FROM places WHERE key IN ({','.join('?' * len(chunk))})"
+            names.update(self.db.execute(query, chunk))
+
+        missing = [key for key in keys if key not in names]
+        if missing:
+            print(f"Looking up {len(missing)} new places in {os.path.basename(self.gazetteer.path)}...")
+            for key in missing:
+                # The rounded position, so the cached name doesn't depend on which photo came first
+                latitude, longitude = (float(x) for x in key.split(','))
+                names[key] = self.gazetteer.name(latitude, longitude)
+            self.db.executemany("INSERT OR REPLACE INTO places VALUES (?, ?)", [(key, names[key]) for key in missing])
+            self.db.commit()
+        return names
@@ -1,67 +1,269 @@
+import argparse
+import hashlib
+import io
+import json
 import os
-from PIL import Image
-
-def generate_icons(source_path, res_dir):
-    if not os.path.exists(source_path):
-        print(f"Error: Source image {source_path} not found.")
-        return
-
-    img = Image.open(source_path)
-    
-    # Legacy Mipmap Sizes
-    densities = {
-        'mipmap-mdpi': 48,
-        'mipmap-hdpi': 72,
-        'mipmap-xhdpi': 96,
-        'mipmap-xxhdpi': 144,
-        'mipmap-xxxhdpi': 192
-    }
-    
-    print("Generating legacy icons...")
-    for folder, size in densities.items():
-        out_dir = os.path.join(res_dir, folder)
-        os.makedirs(out_dir, exist_ok=True)
-        
-        # Resize
-        resized = img.resize((size, size), Image.Resampling.LANCZOS)
-        
-        # Save ic_launcher.png
-        resized.save(os.path.join(out_dir, 'ic_launcher.png'))
-        
-        # Save ic_launcher_round.png (For now just same image, could mask it)
-        resized.save(os.path.join(out_dir, 'ic_launcher_round.png'))
-        print(f"  Saved {folder} ({size}x{size})")
-
-    # Adaptive Icon Foreground
-    # xxxhdpi is 192px (legacy). Adaptive base is 108dp.
-    # 1dp = 4px at xxxhdpi. So 108dp = 432px.
-    # Safe zone is 72dp = 288px.
-    
-    print("Generating adaptive foreground...")
-    adaptive_size = 432
-    safe_zone = 288
-    
-    # Create transparent canvas
-    foreground = Image.new('RGBA', (adaptive_size, adaptive_size), (0, 0, 0, 0))
-    
-    # Resize source to fit in safe zone (slightly smaller to be safe, say 260px)
-    icon_size = 260
-    icon_resized = img.resize((icon_size, icon_size), Image.Resampling.LANCZOS)
-    
-    # Center it
-    offset = (adaptive_size - icon_size) // 2
-    foreground.paste(icon_resized, (offset, offset))
-    
-    # Save to drawable-xxxhdpi (or drawable)
-    # Ideally we should have densities for foreground too, but let's put high res in drawable-nodpi or drawable-xxxhdpi
-    # Let's put it in drawable-xxxhdpi for best quality scaling down
-    drawable_dir = os.path.join(res_dir, 'drawable-xxxhdpi')
-    os.makedirs(drawable_dir, exist_ok=True)
-    
-    foreground.save(os.path.join(drawable_dir, 'ic_launcher_foreground.png'))
-    print(f"  Saved adaptive foreground to {drawable_dir}")
+
+from PIL import Image, ImageDraw, ImageOps
+
+from sync_cache import DEFAULT_CACHE_DIR
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+
+# Legacy mipmap sizes
+DENSITIES = {
+    'mipmap-mdpi': 48,
+    'mipmap-hdpi': 72,
+    'mipmap-xhdpi': 96,
+    'mipmap-xxhdpi': 144,
+    'mipmap-xxxhdpi': 192,
+}
+
+# Adaptive icon foreground. xxxhdpi is 4px per dp: the 108dp canvas is 432px and its
+# 72dp safe zone 288px; the icon is kept a bit smaller than that.
+FOREGROUND_DIR = 'drawable-xxxhdpi'
+ADAPTIVE_SIZE = 432
+ADAPTIVE_ICON_SIZE = 260
+
+FORMATS = {'png': '.png', 'webp': '.webp'}
+
+# A size is resampled from the smallest image already made that is at least this many
+# times bigger (LANCZOS is sharp down to about 1.5x; chaining smaller steps blurs)
+CASCADE_MIN_RATIO = 1.5
+# The round icon's circle is drawn at this multiple of its size and scaled down, for a smooth edge
+MASK_SUPERSAMPLE = 4
+
+# Part of every output's key; bump it when a change here changes the output bytes
+PIPELINE_VERSION = 1
+MANIFEST_NAME = 'icons.json'
+
+
+def icon_outputs(res_dir, fmt):
+    """[(output path, variant, size)] for one res directory."""
+    ext = FORMATS[fmt]
+    outputs = []
+    for folder, size in DENSITIES.items():
+        outputs.append((os.path.join(res_dir, folder, 'ic_launcher' + ext), 'square', size))
+        outputs.append((os.path.join(res_dir, folder, 'ic_launcher_round' + ext), 'round', size))
+    outputs.append((os.path.join(res_dir, FOREGROUND_DIR, 'ic_launcher_foreground' + ext), 'foreground', ADAPTIVE_ICON_SIZE))
+    return outputs
+
+
+def output_key(source_hash, variant, size, fmt):
+    """Everything an output's bytes depend on. The output is current while its key is unchanged."""
+    return f"{source_hash}:{variant}:{size}:{fmt}:v{PIPELINE_VERSION}"
+
+
+def load_source(path):
+    """Decode the source once, upright and cropped to a centered square."""
+    with Image.open(path) as img:
+        img = ImageOps.exif_transpose(img)
+        img.load()
+    has_alpha = img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info
+    img = img.convert('RGBA' if has_alpha else 'RGB')
+    if img.width != img.height:
+        side = min(img.size)
+        print(f"Warning: {path} is {img.width}x{img.height}; using the centered {side}x{side} square.")
+        left, top = (img.width - side) // 2, (img.height - side) // 2
+        img = img.crop((left, top, left + side, top + side))
+    return img
+
+
+def downscale_chain(img, sizes):
+    """
+    {size: image} for every size, largest first. Each size is resampled from the
+    smallest image already made that is at least CASCADE_MIN_RATIO times bigger, so
+    the full-size source is only resampled for the first size or two.
+    """
+    levels = [img]
+    scaled = {}
+    for size in sorted(set(sizes), reverse=True):
+        candidates = [level for level in levels if level.width >= size * CASCADE_MIN_RATIO]
+        base = min(candidates, key=lambda level: level.width) if candidates else img
+        if base.width == size:
+            scaled[size] = base
+            continue
+        # reducing_gap box-filters a large source down first, which is much faster than LANCZOS over all of it
+        scaled[size] = base.resize((size, size), Image.Resampling.LANCZOS, reducing_gap=3.0 if base is img else None)
+        levels.append(scaled[size])
+    return scaled
+
+
+def circle_mask(size):
+    """Antialiased alpha mask of a circle filling a size x size square."""
+    big = size * MASK_SUPERSAMPLE
+    mask = Image.new('L', (big, big), 0)
+    ImageDraw.Draw(mask).ellipse((0, 0, big - 1, big - 1), fill=255)
+    return mask.resize((size, size), Image.Resampling.BOX)
+
+
+def render(scaled, variant, size):
+    img = scaled[size]
+    if variant == 'round':
+        round_img = img.convert('RGBA')
+        alpha = round_img.getchannel('A')
+        round_img.putalpha(Image.composite(alpha, Image.new('L', alpha.size, 0), circle_mask(size)))
+        return round_img
+    if variant == 'foreground':
+        foreground = Image.new('RGBA', (ADAPTIVE_SIZE, ADAPTIVE_SIZE), (0, 0, 0, 0))
+        offset = (ADAPTIVE_SIZE - size) // 2
+        foreground.paste(img, (offset, offset), img if img.mode == 'RGBA' else None)
+        return foreground
+    return img
+
+
+def encode(img, fmt):
+    """Smallest lossless encoding, with no metadata, so the same input always gives the same bytes."""
+    out = io.BytesIO()
+    if fmt == 'webp':
+        img.save(out, 'WEBP', lossless=True, quality=100, method=6, exact=False)
+    else:
+        img.save(out, 'PNG', optimize=True)
+    return out.getvalue()
+
+
+def write_if_changed(path, data):
+    """Write atomically, leaving the file (and its mtime) alone if it already holds data. True if written."""
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return True
+
+
+def file_hash(path):
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+class IconManifest:
+    """
+    Key and SHA-256 of every output written, by absolute path, kept in the cache
+    directory (Android doesn't allow stray files in res/). An output is skipped
+    while its key matches and the file still has the bytes that were written.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.path = os.path.join(cache_dir, MANIFEST_NAME)
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def is_current(self, path, key):
+        entry = self.entries.get(os.path.abspath(path))
+        return entry is not None and entry['key'] == key and file_hash(path) == entry['sha256']
+
+    def record(self, path, key, data):
+        self.entries[os.path.abspath(path)] = {'key': key, 'sha256': hashlib.sha256(data).hexdigest()}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        write_if_changed(self.path, json.dumps(self.entries, indent=1, sort_keys=True).encode('utf-8'))
+
+
+def remove_other_formats(path):
+    """An icon in another format would be a duplicate resource, so it goes."""
+    stem = os.path.splitext(path)[0]
+    for ext in FORMATS.values():
+        other = stem + ext
+        if other != path and os.path.exists(other):
+            os.remove(other)
+            print(f"  Removed {other}")
+
+
+def generate_icons(targets, fmt='png', manifest=None, force=False):
+    """
+    Generate the launcher icons for every (source path, res directory) in targets.
+
+    Each source is hashed, and if any of its outputs is out of date, decoded once and
+    scaled down through one chain of sizes. Each distinct output is encoded once and
+    the bytes copied to every res directory that uses the same source.
+    Returns the number of files written.
+    """
+    by_source = {}
+    for source_path, res_dir in targets:
+        by_source.setdefault(os.path.abspath(source_path), []).append(res_dir)
+
+    written = skipped = 0
+    for source_path, res_dirs in by_source.items():
+        if not os.path.exists(source_path):
+            print(f"Error: Source image {source_path} not found.")
+            continue
+        with open(source_path, 'rb') as f:
+            source_hash = hashlib.sha256(f.read()).hexdigest()
+
+        todo = []
+        for res_dir in res_dirs:
+            for path, variant, size in icon_outputs(res_dir, fmt):
+                key = output_key(source_hash, variant, size, fmt)
+                if not force and manifest and manifest.is_current(path, key):
+                    skipped += 1
+                else:
+                    todo.append((path, variant, size, key))
+        if not todo:
+            print(f"{source_path}: icons up to date.")
+            continue
+
+        print(f"Generating icons from {source_path}...")
+        scaled = downscale_chain(load_source(source_path), {size for _, _, size, _ in todo})
+        encoded = {}
+        for path, variant, size, key in todo:
+            if (variant, size) not in encoded:
+                encoded[variant, size] = encode(render(scaled, variant, size), fmt)
+            data = encoded[variant, size]
+            remove_other_formats(path)
+            if write_if_changed(path, data):
+                written += 1
+                print(f"  Saved {os.path.relpath(path)} ({len(data) / 1024:.1f} KB)")
+            if manifest:
+                manifest.record(path, key, data)
+
+    if manifest:
+        manifest.save()
+    print(f"{written} icon files written, {skipped} skipped (source unchanged).")
+    return written
+
+
+def parse_flavor(value):
+    name, sep, source = value.partition('=')
+    if not sep or not name or not source:
+        raise argparse.ArgumentTypeError(f"expected NAME=SOURCE, got {value!r}")
+    return name, source
+
 
 if __name__ == '__main__':
-    source = '/Users/mishkin/.gemini/antigravity/brain/c6b1455e-1f4e-4bd0-ad4f-c0b5621c2d72/app_icon_1764945859154.png'
-    res = '/Users/mishkin/src/SlideShowAi/app/src/main/res'
-    generate_icons(source, res)
+    parser = argparse.ArgumentParser(description="Generate the Android launcher icons from one source image.")
+    parser.add_argument('source', nargs='?', help="Source image for the main res directory (square, at least 432px)")
+    parser.add_argument('--res', action='append',
+                        help="res directory to write to; repeat for several (default: app/src/main/res)")
+    parser.add_argument('--flavor', action='append', type=parse_flavor, default=[], metavar='NAME=SOURCE',
+                        help="Also write icons from SOURCE to app/src/NAME/res; repeat for several flavors")
+    parser.add_argument('--format', choices=sorted(FORMATS), default='png',
+                        help="png, or lossless webp (default: png). Icons in the other format are removed")
+    parser.add_argument('--force', action='store_true', help="Regenerate even if the source is unchanged")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help=f"Where the record of generated icons is kept (default: {DEFAULT_CACHE_DIR})")
+    parser.add_argument('--no-cache', action='store_true', help="Don't read or write that record")
+    args = parser.parse_args()
+
+    if not args.source and not args.flavor:
+        parser.error("give a source image and/or --flavor NAME=SOURCE")
+    targets = []
+    if args.source:
+        targets += [(args.source, res) for res in args.res or [os.path.join(APP_DIR, 'src', 'main', 'res')]]
+    targets += [(source, os.path.join(APP_DIR, 'src', name, 'res')) for name, source in args.flavor]
+
+    manifest = None if args.no_cache else IconManifest(args.cache_dir)
+    generate_icons(targets, args.format, manifest, args.force)
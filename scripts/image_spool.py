@@ -0,0 +1,134 @@
+import io
+import mmap
+import multiprocessing
+import os
+import tempfile
+import time
+
+# Encoded photos up to this size stay in memory; larger ones are written to a file
+SPOOL_MAX_BYTES = 1024 * 1024
+# Spool files are gone within seconds unless a run was interrupted while handing them off
+STALE_SPOOL_SECONDS = 3600
+
+
+class SpooledImage(mmap.mmap):
+    """
+    Encoded output that lives in a temp file and is mapped read-only, so it can be
+    hashed, sliced, cached and passed to sendall() like bytes while its pages stay
+    file-backed (the kernel can drop them) instead of counting against the process.
+
+    Made in a worker process, it crosses to the parent as the file's path: the parent
+    maps the file and removes it. Made in the sync process itself, the file is
+    removed right away and disappears when the mapping is closed or collected.
+    """
+
+    path = None
+
+    @classmethod
+    def from_file(cls, f, path, handoff=False):
+        f.flush()
+        image = cls(f.fileno(), 0, access=mmap.ACCESS_READ)
+        f.close()
+        if handoff:
+            image.path = path
+        else:
+            _remove(path)
+        return image
+
+    def __reduce__(self):
+        if self.path is None:
+            return bytes, (self[:],)
+        return _open_handed_off, (self.path,)
+
+
+def _open_handed_off(path):
+    return SpooledImage.from_file(open(path, 'rb'), path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def spool_dir(cache_dir):
+    """Where to spool large encodings: under the cache dir, or the system temp dir without one."""
+    return os.path.join(cache_dir, 'spool') if cache_dir else None
+
+
+def remove_stale(path, max_age=STALE_SPOOL_SECONDS):
+    """
+    Remove spool files left behind by interrupted runs (Ctrl+C, a broken or killed worker),
+    which were handed off by a worker but never opened by the parent. Files younger than
+    max_age are kept, as another sync sharing the directory may be about to open them.
+    Returns how many were removed.
+    """
+    removed = 0
+    cutoff = time.time() - max_age
+    try:
+        entries = os.scandir(path or tempfile.gettempdir())
+    except OSError:
+        return 0
+    with entries:
+        for entry in entries:
+            try:
+                if entry.name.startswith('encoded-') and entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                continue
+    return removed
+
+
+class SpoolWriter:
+    """
+    File-like target for Image.save that keeps the output in memory until it grows past
+    max_size, then moves it to a temp file in directory (see spool_dir; on disk, unlike a
+    tmpfs /tmp, when under the cache dir). It has no fileno(), so Pillow encodes in small
+    chunks instead of writing straight to the file behind it.
+    """
+
+    def __init__(self, max_size=SPOOL_MAX_BYTES, directory=None):
+        self.max_size = max_size
+        self.directory = directory
+        self.buffer = io.BytesIO()
+        self.file = None
+        self.path = None
+
+    def write(self, data):
+        if self.file is None and self.buffer.tell() + len(data) > self.max_size:
+            self._rollover()
+        return (self.file or self.buffer).write(data)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return (self.file or self.buffer).seek(offset, whence)
+
+    def tell(self):
+        return (self.file or self.buffer).tell()
+
+    def flush(self):
+        pass
+
+    def _rollover(self):
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(prefix='encoded-', dir=self.directory)
+        self.file = os.fdopen(fd, 'w+b')
+        self.file.write(self.buffer.getbuffer())
+        self.file.seek(self.buffer.tell())
+        self.buffer = None
+
+    def discard(self):
+        """Drop whatever was written (e.g. before retrying a save)."""
+        if self.file:
+            self.file.close()
+            _remove(self.path)
+        self.__init__(self.max_size, self.directory)
+
+    def getvalue(self):
+        """The output as bytes, or as a SpooledImage once it outgrew memory."""
+        if self.file is None:
+            return self.buffer.getvalue()
+        # In a pool worker the parent takes the file over; see SpooledImage
+        return SpooledImage.from_file(self.file, self.path, handoff=multiprocessing.parent_process() is not None)
@@ -1,58 +1,255 @@
 import argparse
-import os
+import csv
 import io
-import socket
+import os
 import json
+import shlex
 import subprocess
 import sys
 import hashlib
-from PIL import Image, ImageOps
+import math
+from PIL import Image, ImageOps, ExifTags
 import pillow_heif
 import piexif
 import datetime
+import collections
+import functools
+import contextlib
+import concurrent.futures
+import multiprocessing
+import threading
+import queue
+import time
+import cProfile
+from device_connection import CONNECT_TIMEOUT, RECONNECT_RETRIES, SESSION_RETRIES, DeviceSessions, with_reconnect
+from source_index import IMAGE_EXTENSIONS, MetadataIndex, SourceFile, get_upload_filename, get_upload_stem, read_image_metadata, scan_sources
+from gazetteer import DEFAULT_GAZETTEER_DIR, ReverseGeocoder, default_gazetteer, place_key
+from sync_cache import ProcessingCache, DEFAULT_CACHE_DIR, resolution_key
+from sync_metrics import SyncMetrics
+from image_spool import SpoolWriter, SpooledImage, remove_stale, spool_dir
+from source_watcher import RESCAN, make_watcher, wait_for_changes
 
 # Register HEIF opener
 pillow_heif.register_heif_opener()
 
-def get_device_resolution(app_host, port):
-    print(f"Fetching device resolution from {app_host}:{port}...")
+# Output encodings for pushed photos: upload extension, Pillow format, save options,
+# and the entry the device must list in get_device_info's "decoders" to show them
+ENCODINGS = {
+    'jpeg': ('.jpg', 'JPEG', {'quality': 85}, 'jpeg'),
+    'jpeg-progressive': ('.jpg', 'JPEG', {'quality': 85, 'optimize': True, 'progressive': True}, 'jpeg'),
+    'webp': ('.webp', 'WEBP', {'quality': 80, 'method': 4}, 'webp'),
+    'heic': ('.heic', 'HEIF', {'quality': 75}, 'heif'),
+    'avif': ('.avif', 'AVIF', {'quality': 65}, 'avif'),
+}
+# What --format auto picks, best first. AVIF is left out: the app can't read its EXIF (date, location).
+AUTO_ENCODINGS = ('webp', 'jpeg-progressive')
+
+# Thumbnails (--thumbnails): longest side in pixels, and JPEG quality. They only stand in
+# for the photo until it is decoded on the device, so they are small and heavily compressed.
+THUMBNAIL_SIZE = 320
+THUMBNAIL_QUALITY = 50
+
+# Photos per put_metadata request; the app stores each request in one transaction
+METADATA_BATCH = 500
+
+# sync --watch: seconds without filesystem events before a batch of changes is pushed
+WATCH_DEBOUNCE = 2.0
+
+def make_encoder(name='jpeg', quality=None, subsampling=None, thumbnail=0):
+    """
+    Save settings for process_image, as a plain dict so it can be sent to worker processes.
+    subsampling ('4:4:4', '4:2:2' or '4:2:0') applies to JPEG, HEIC and AVIF.
+    thumbnail is the longest side of the JPEG thumbnail made along with each photo (0: none).
+    The 'key' tells cached encodings apart; it is '' for the original baseline JPEG at
+    quality 85, so caches from before encodings were selectable stay valid. Thumbnails
+    don't change the photo's bytes, so they are not part of it.
+    """
+    ext, fmt, params, _ = ENCODINGS[name]
+    params = dict(params)
+    if quality is not None:
+        params['quality'] = quality
+    if subsampling:
+        if fmt == 'HEIF':
+            params['chroma'] = int(subsampling.replace(':', ''))
+        elif fmt != 'WEBP':
+            params['subsampling'] = subsampling
+    key = ''
+    if name != 'jpeg' or params != ENCODINGS['jpeg'][2]:
+        key = f"{name}-q{params['quality']}" + (f"-{subsampling}" if subsampling else '')
+    return {'name': name, 'ext': ext, 'format': fmt, 'params': params, 'key': key, 'thumbnail': thumbnail}
+
+def resolve_encoder(info, encoding=None, prefix=''):
+    """
+    Turn the CLI's encoding request ({'name', 'quality', 'subsampling', 'thumbnail'}, name may
+    be 'auto') into an encoder, checked against the decoders and features the device reports.
+    Builds that predate the "decoders" field only get JPEG, and thumbnails need put_thumbnail.
+    Messages start with `prefix`, which tells devices apart in a fleet sync.
+    """
+    encoding = encoding or {}
+    name = encoding.get('name') or 'jpeg'
+    decoders = info.get("decoders", ["jpeg"])
+    if name == 'auto':
+        name = next((n for n in AUTO_ENCODINGS if ENCODINGS[n][3] in decoders), 'jpeg')
+    elif ENCODINGS[name][3] not in decoders:
+        print(f"{prefix}Warning: device does not list a {ENCODINGS[name][3]} decoder; sending JPEG instead.")
+        name = 'jpeg'
+    thumbnail = encoding.get('thumbnail') or 0
+    if thumbnail and "put_thumbnail" not in info.get("features", []):
+        print(f"{prefix}Warning: app does not accept thumbnails; sending photos only.")
+        thumbnail = 0
+    encoder = make_encoder(name, encoding.get('quality'), encoding.get('subsampling'), thumbnail)
+    if encoder['key']:
+        print(f"{prefix}Encoding: {encoder['key']}")
+    return encoder
+
+def encoded_key(res_key, encoder=None):
+    """Processing cache key for one resolution and encoding."""
+    return f"{res_key}:{encoder['key']}" if encoder and encoder['key'] else res_key
+
+def get_device_info(client):
+    """
+    Return the device's get_device_info response, or {} if it could not be fetched.
+    Asked once per session; later calls return the stored reply.
+    """
+    if client.info:
+        return client.info
+    print(f"Fetching device info from {client.key}...")
     try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.connect((app_host, port))
-            cmd = json.dumps({"cmd": "get_device_info"})
-            s.sendall(cmd.encode('utf-8') + b'\n')
-            
-            response_str = read_line(s)
-            if response_str:
-                response = json.loads(response_str)
-                if response.get("status") == "ok":
-                    width = response.get("width")
-                    height = response.get("height")
-                    print(f"Device Resolution: {width}x{height}")
-                    return width, height
-                else:
-                    print(f"Error getting info: {response.get('message')}")
+        response = client.request({"cmd": "get_device_info"})
+        if response.get("status") == "ok":
+            client.info = response
+            return response
+        print(f"Error getting info: {response.get('message')}")
     except Exception as e:
         print(f"Failed to get device info: {e}")
+    return {}
+
+def get_device_resolution(info):
+    width = info.get("width")
+    height = info.get("height")
+    if width and height:
+        print(f"Device Resolution: {width}x{height}")
+        return width, height
     return 1920, 1080 # Fallback
 
-def process_image(filepath, target_width, target_height):
+def cover_scale(img_w, img_h, target_width, target_height):
     """
-    Reads an image, handles orientation, resizes (aspect fill) and crops 
-    to exactly match target_width x target_height.
-    Returns (filename, bytes).
+    Scale factor that makes an img_w x img_h image cover the device screen,
+    matching the screen's long side to the image's long side.
     """
-    try:
-        filename = os.path.basename(filepath)
-        
-        img = Image.open(filepath)
-        
-        # 1. Handle EXIF Orientation
-        img = ImageOps.exif_transpose(img)
+    dev_max = max(target_width, target_height)
+    dev_min = min(target_width, target_height)
+    if img_w >= img_h:
+        return max(dev_max / img_w, dev_min / img_h)
+    return max(dev_min / img_w, dev_max / img_h)
+
+def _lap(timings, stage, start):
+    """Charge the time since start to timings[stage] (if timing) and return the new start."""
+    now = time.perf_counter()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + now - start
+    return now
+
+# Pixel budget for one decode (--max-megapixels). JPEGs over it decode at a reduced DCT
+# scale even with --decode exact; other formats can only be decoded whole, so only one
+# such image is held at a time across workers (see OVERSIZE_DECODE_LOCK).
+DEFAULT_MAX_PIXELS = 48_000_000
+# Output rows resampled per pass when resizing an over-budget image, which bounds the
+# intermediate buffer of the two-pass LANCZOS filter
+RESIZE_BAND_ROWS = 256
+# Set in process pool workers (init_encode_worker), shared by all of them
+OVERSIZE_DECODE_LOCK = None
+# Where encode_image spools large output (use_spool_dir); None is the system temp dir.
+# Pool workers are given the parent's by init_encode_worker.
+SPOOL_DIR = None
+
+def init_encode_worker(oversize_lock, spool_directory=None):
+    global OVERSIZE_DECODE_LOCK, SPOOL_DIR
+    OVERSIZE_DECODE_LOCK = oversize_lock
+    SPOOL_DIR = spool_directory
+
+def make_encode_pool(jobs):
+    """Process pool for process_image whose workers share the over-budget decode lock."""
+    return concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=init_encode_worker,
+                                                  initargs=(multiprocessing.Lock(), SPOOL_DIR))
+
+def use_spool_dir(cache_dir):
+    """Spool large encodings under cache_dir (None: the system temp dir), clearing out what interrupted runs left."""
+    global SPOOL_DIR
+    SPOOL_DIR = spool_dir(cache_dir)
+    removed = remove_stale(SPOOL_DIR)
+    if removed:
+        print(f"Removed {removed} stale spool files.")
+
+def resize_in_bands(img, size, band_rows=RESIZE_BAND_ROWS):
+    """
+    LANCZOS resize done band_rows output rows at a time. Pillow samples outside the
+    box when the filter needs to, so the result matches a single resize() (up to
+    rounding in the odd pixel).
+    """
+    if img.mode in ('1', 'P'):
+        return img.resize(size)  # nearest neighbour: no filter buffers to bound
+    out = Image.new(img.mode, size)
+    out.info = img.info.copy()
+    scale_y = img.height / size[1]
+    for top in range(0, size[1], band_rows):
+        bottom = min(top + band_rows, size[1])
+        band = img.resize((size[0], bottom - top), Image.Resampling.LANCZOS,
+                          box=(0, top * scale_y, img.width, bottom * scale_y))
+        out.paste(band, (0, top))
+        band.close()
+    return out
+
+def resize_for_device(filepath, target_width, target_height, decode_mode='fast', timings=None, max_pixels=DEFAULT_MAX_PIXELS):
+    """
+    Reads an image, handles orientation and resizes it (aspect fill) for the screen.
+    decode_mode 'fast' lets JPEGs decode at a reduced DCT scale and reduces other
+    formats in integer steps before the final LANCZOS pass; 'exact' always
+    resamples from full resolution.
+    max_pixels caps the decoded size (see DEFAULT_MAX_PIXELS); 0 means no cap.
+    If timings is a dict, seconds spent in open/decode/transpose/resize are added to it.
+    Returns (image, original EXIF bytes or None).
+    """
+    t = time.perf_counter()
+    src = Image.open(filepath)
+    
+    # Remember the full-resolution size so the output dimensions do not depend on
+    # how the pixels were decoded.
+    full_w, full_h = src.size
+    
+    # 0. Reduced-size decode
+    # EXIF rotation swaps both the image and the target, so the cover scale is the
+    # same before and after transposing. draft() picks the smallest 1/2, 1/4 or 1/8
+    # scale that still yields at least the requested size; for HEIC it picks an
+    # embedded thumbnail of at least that size, if there is one.
+    request = src.size
+    if decode_mode == 'fast':
+        scale = cover_scale(src.width, src.height, target_width, target_height)
+        if scale < 0.5:
+            request = (math.ceil(src.width * scale), math.ceil(src.height * scale))
+    if max_pixels and src.format == 'JPEG':
+        factor = 1
+        while factor < 8 and (src.width // factor) * (src.height // factor) > max_pixels:
+            factor *= 2
+        request = (min(request[0], src.width // factor), min(request[1], src.height // factor))
+    if request != src.size:
+        src.draft(src.mode, request)
+    t = _lap(timings, 'open', t)
+    
+    # Decoded pixels are the bulk of a worker's memory. Over the budget (formats without
+    # reduced decoding, or JPEGs too big even at 1/8), wait until no other worker holds such an image.
+    oversize = bool(max_pixels) and src.width * src.height > max_pixels
+    with OVERSIZE_DECODE_LOCK if oversize and OVERSIZE_DECODE_LOCK else contextlib.nullcontext():
+        # Reading the EXIF of a PNG can decode it, so this is done under the lock too
+        rotated = src.getexif().get(ExifTags.Base.Orientation) in (5, 6, 7, 8)
+        if rotated:
+            full_w, full_h = full_h, full_w
+        src.load()
+        t = _lap(timings, 'decode', t)
         
-        # 2. Determine Smart Target Dimensions
+        # 1. Determine Smart Target Dimensions
         # We need to map the image's orientation to the device's screen dimensions.
-        img_w, img_h = img.size
+        img_w, img_h = full_w, full_h
         
         # Determine if image is landscape or portrait
         is_img_landscape = img_w >= img_h
@@ -69,7 +266,7 @@ def process_image(filepath, target_width, target_height):
             final_w = dev_min
             final_h = dev_max
             
-        # 3. Aspect Fill Resize
+        # 2. Aspect Fill Resize
         # Calculate scale to cover
         scale_w = final_w / img_w
         scale_h = final_h / img_h
@@ -78,255 +275,1583 @@ def process_image(filepath, target_width, target_height):
         new_w = int(img_w * scale)
         new_h = int(img_h * scale)
         
-        img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
+        # Resize before applying the EXIF orientation, so only the small copy gets transposed
+        size = (new_h, new_w) if rotated else (new_w, new_h)
+        if decode_mode == 'fast':
+            # Box-reduce by an integer factor first; a gap of 3 is visually identical to a full LANCZOS pass.
+            img = src.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+        elif oversize:
+            img = resize_in_bands(src, size)
+        else:
+            img = src.resize(size, Image.Resampling.LANCZOS)
+        # Release the full-size pixels now rather than whenever the caller drops them
+        src.close()
+        del src
+    t = _lap(timings, 'resize', t)
+    
+    # 3. Handle EXIF Orientation (on the resized copy, in place)
+    ImageOps.exif_transpose(img, in_place=True)
+    t = _lap(timings, 'transpose', t)
+    
+    # 4. Center Crop (Skipped as per user request to keep full zoomed image)
+    # left = (new_w - final_w) / 2
+    # top = (new_h - final_h) / 2
+    # right = (new_w + final_w) / 2
+    # bottom = (new_h + final_h) / 2
+    # img = img.crop((left, top, right, bottom))
         
-        # 4. Center Crop (Skipped as per user request to keep full zoomed image)
-        # left = (new_w - final_w) / 2
-        # top = (new_h - final_h) / 2
-        # right = (new_w + final_w) / 2
-        # bottom = (new_h + final_h) / 2
-        # img = img.crop((left, top, right, bottom))
+    # 5. Handle EXIF
+    # We will try to preserve the original EXIF block exactly as is.
+    # This prevents piexif from potentially creating incompatible structures for Android.
+    # Drawback: Internal thumbnail/MakerNote might be stale, but Location should be readable.
+    
+    exif_bytes = img.info.get("exif")
+    return img, exif_bytes
+
+def encode_image(img, exif_bytes=None, encoder=None, timings=None):
+    """
+    Encode a resized image with encoder (see make_encoder); baseline JPEG if None.
+    Returns bytes, or a file-backed SpooledImage for output over SPOOL_MAX_BYTES.
+    """
+    t = time.perf_counter()
+    if encoder is None:
+        encoder = make_encoder()
+    if encoder['format'] in ('JPEG', 'WEBP') and img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    
+    # Save to memory, spilling to a temp file if it gets large
+    output = SpoolWriter(directory=SPOOL_DIR)
+    if exif_bytes:
+         try:
+            img.save(output, format=encoder['format'], exif=exif_bytes, **encoder['params'])
+         except Exception as e:
+            print(f"Warning: Failed to save with EXIF: {e}")
+            output.discard()
+            img.save(output, format=encoder['format'], **encoder['params'])
+    else:
+        img.save(output, format=encoder['format'], **encoder['params'])
+    _lap(timings, 'encode', t)
+    return output.getvalue()
+
+def make_thumbnail(img, size=THUMBNAIL_SIZE, timings=None):
+    """
+    Small JPEG of an image that is already resized and upright, at most size pixels on
+    its longest side. It has no EXIF: the app reads dates and places from the photo.
+    """
+    t = time.perf_counter()
+    scale = size / max(img.size)
+    if scale < 1:
+        # Box-reduce nearly all the way, then bilinear: plenty for a stand-in, at a fraction of the encode's cost
+        img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))),
+                         Image.Resampling.BILINEAR, reducing_gap=1.0)
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    output = io.BytesIO()
+    img.save(output, format='JPEG', quality=THUMBNAIL_QUALITY, subsampling='4:2:0')
+    _lap(timings, 'thumbnail', t)
+    return output.getvalue()
+
+def thumbnail_from_encoded(image_data, size=THUMBNAIL_SIZE):
+    """Thumbnail of a photo that was encoded earlier (e.g. from the cache), via a reduced JPEG decode where possible."""
+    with Image.open(io.BytesIO(image_data)) as img:
+        img.draft('RGB', (size, size))
+        return make_thumbnail(img, size)
+
+def process_image(filepath, target_width, target_height, decode_mode='fast', encoder=None, timings=None, max_pixels=DEFAULT_MAX_PIXELS):
+    """
+    Reads an image, resizes it for the screen (see resize_for_device) and encodes it.
+    encoder (see make_encoder) picks the output format; baseline JPEG if None. If it asks
+    for a thumbnail, that is made from the same resized, upright pixels.
+    Returns (filename, bytes or SpooledImage, thumbnail bytes or None).
+    """
+    try:
+        filename = os.path.basename(filepath)
+        img, exif_bytes = resize_for_device(filepath, target_width, target_height, decode_mode, timings, max_pixels)
+        image_data = encode_image(img, exif_bytes, encoder, timings)
+        thumbnail = make_thumbnail(img, encoder['thumbnail'], timings) if encoder and encoder.get('thumbnail') else None
+        img.close()
+        
+        # Generate Unique Stable Filename
+        unique_filename = get_upload_filename(filepath, (encoder or make_encoder())['ext'])
             
-        # 5. Handle EXIF
-        # We will try to preserve the original EXIF block exactly as is.
-        # This prevents piexif from potentially creating incompatible structures for Android.
-        # Drawback: Internal thumbnail/MakerNote might be stale, but Location should be readable.
+        return unique_filename, image_data, thumbnail
+
+    except Exception as e:
+        print(f"Error processing {filename}: {e}")
+        return None, None, None
+
+def cached_result(upload_filename, image_data, encoder=None):
+    """process_image's result for photo bytes that were encoded before, with a thumbnail made from them if one is wanted."""
+    thumbnail = thumbnail_from_encoded(image_data, encoder['thumbnail']) if encoder and encoder.get('thumbnail') else None
+    return upload_filename, image_data, thumbnail
+
+def process_image_timed(filepath, target_width, target_height, decode_mode='fast', encoder=None, max_pixels=DEFAULT_MAX_PIXELS):
+    """process_image for --metrics: returns ((filename, bytes, thumbnail), {stage: seconds}), also from worker processes."""
+    timings = {}
+    return process_image(filepath, target_width, target_height, decode_mode, encoder, timings, max_pixels), timings
+
+def iter_source_files(local_dirs, index=None):
+    """Yield the (absolute) path of every supported image under local_dirs; see scan_sources."""
+    for source in scan_sources(local_dirs, index):
+        yield source.path
+
+def process_pipeline(work, target_width, target_height, jobs=1, decode_mode='fast', encoder=None, metrics=None, max_pixels=DEFAULT_MAX_PIXELS):
+    """
+    Run process_image over work items of (filepath, stat, ready) where ready is
+    either None or an already-encoded (filename, bytes, thumbnail) result.
+    Yields (filepath, stat, (filename, bytes, thumbnail), fresh) in input order.
+    
+    With jobs > 1 images are encoded in a process pool. At most jobs * 2 items are
+    in flight at once, so encoded bytes never pile up ahead of the upload socket.
+    With metrics, per-file stage times are collected from the workers.
+    """
+    process = functools.partial(process_image_timed if metrics else process_image, max_pixels=max_pixels)
+    if jobs <= 1:
+        for filepath, st, ready in work:
+            if ready is not None:
+                yield filepath, st, ready, False
+            else:
+                result = process(filepath, target_width, target_height, decode_mode, encoder)
+                yield filepath, st, _record_timings(filepath, st, result, metrics), True
+        return
+    
+    window = jobs * 2
+    in_flight = collections.deque()
+    with make_encode_pool(jobs) as pool:
+        for filepath, st, ready in work:
+            if ready is not None:
+                in_flight.append((filepath, st, ready, None))
+            else:
+                in_flight.append((filepath, st, None, pool.submit(process, filepath, target_width, target_height, decode_mode, encoder)))
+            
+            while len(in_flight) >= window:
+                yield _pipeline_result(in_flight.popleft(), metrics)
         
-        exif_bytes = img.info.get("exif")
+        while in_flight:
+            yield _pipeline_result(in_flight.popleft(), metrics)
+
+def _pipeline_result(item, metrics=None):
+    filepath, st, ready, future = item
+    if future is None:
+        return filepath, st, ready, False
+    if metrics:
+        with metrics.stage('encode_wait'):
+            result = future.result()
+    else:
+        result = future.result()
+    return filepath, st, _record_timings(filepath, st, result, metrics), True
+
+def _record_timings(filepath, st, result, metrics):
+    if not metrics:
+        return result
+    result, timings = result
+    metrics.record_file(filepath, timings)
+    metrics.count('files_encoded')
+    metrics.count('source_bytes', st.st_size)
+    if result[1]:
+        metrics.count('encoded_bytes', len(result[1]))
+        if isinstance(result[1], SpooledImage):
+            metrics.count('files_spooled')
+    if result[2]:
+        metrics.count('thumbnail_bytes', len(result[2]))
+    return result
+
+def upload_thumbnail(s, upload_filename, thumbnail):
+    """Send a photo's thumbnail with put_thumbnail and wait for the ack. Returns True on success."""
+    s.send_json({"cmd": "put_thumbnail", "name": upload_filename, "size": len(thumbnail)}, thumbnail)
+    resp = s.read_json()
+    if resp is None:
+        raise ConnectionError("Connection closed")
+    if resp.get("status") != "ok":
+        print(f"    Thumbnail for {upload_filename} failed: {resp.get('message')}")
+        return False
+    return True
+
+def upload_file(s, upload_filename, image_data, quiet=False, metrics=None, thumbnail=None):
+    """
+    Stop-and-wait upload with receive_file. Understood by every app build.
+    A thumbnail (only for apps with put_thumbnail) is sent first, so it is there when the photo appears.
+    """
+    if thumbnail:
+        upload_thumbnail(s, upload_filename, thumbnail)
+    if not quiet:
+        print(f"Uploading {upload_filename} ({len(image_data)} bytes)...", end=' ', flush=True)
+    
+    # Send Command
+    cmd = json.dumps({
+        "cmd": "receive_file",
+        "name": upload_filename,
+        "size": len(image_data)
+    })
+    t = time.perf_counter()
+    s.sendall(cmd.encode('utf-8') + b'\n')
+    
+    # Wait for ready
+    resp = json.loads(s.read_line())
+    if metrics:
+        t = metrics_lap(metrics, 'ready_rtt', t)
+    if resp.get("status") != "ready":
+        print(f"\n    App not ready for {upload_filename}: {resp.get('message')}")
+        return False
         
-        # Save to BytesIO
-        output = io.BytesIO()
-        if exif_bytes:
-             try:
-                img.save(output, format="JPEG", quality=85, exif=exif_bytes)
-             except Exception as e:
-                print(f"Warning: Failed to save with EXIF: {e}")
-                img.save(output, format="JPEG", quality=85)
-        else:
-            img.save(output, format="JPEG", quality=85)
+    # Send Data
+    s.sendall(image_data)
+    if metrics:
+        t = metrics_lap(metrics, 'send', t)
+        metrics.count('sent_bytes', len(image_data))
+    
+    # Wait for Ack
+    resp = json.loads(s.read_line())
+    if metrics:
+        metrics_lap(metrics, 'ack_wait', t)
+    if resp.get("status") != "ok":
+         print(f"\n    Upload of {upload_filename} failed: {resp.get('message')}")
+         return False
+    if not quiet:
+        print("Success.")
+    return True
+
+def metrics_lap(metrics, stage, start):
+    now = time.perf_counter()
+    metrics.record(stage, now - start)
+    return now
+
+class PipelinedUploader:
+    """
+    Streams put_file frames (JSON header line immediately followed by the payload)
+    without waiting for a "ready" reply. Up to `window` files may be unacknowledged
+    at once; a reader thread collects the acks, which carry the file name.
+    The app handles commands on a connection in order, so acks arrive in send order.
+    """
+
+    def __init__(self, conn, window=16, quiet=False, metrics=None):
+        self.conn = conn
+        self.quiet = quiet
+        self.metrics = metrics
+        self.slots = threading.Semaphore(window)
+        self.expected = queue.Queue()
+        self.results = {}
+        self.reader = threading.Thread(target=self._read_acks, daemon=True)
+        self.reader.start()
+
+    def send(self, upload_filename, image_data, thumbnail=None):
+        if thumbnail:
+            self.send_thumbnail(upload_filename, thumbnail)
+        t = time.perf_counter()
+        self.slots.acquire()
+        if self.metrics:
+            t = metrics_lap(self.metrics, 'window_wait', t)
+        if not self.quiet:
+            print(f"Uploading {upload_filename} ({len(image_data)} bytes)...")
+        self.expected.put((upload_filename, t, False))
+        self.conn.send_json({
+            "cmd": "put_file",
+            "name": upload_filename,
+            "size": len(image_data)
+        }, image_data)
+        if self.metrics:
+            metrics_lap(self.metrics, 'send', t)
+            self.metrics.count('sent_bytes', len(image_data))
+
+    def send_thumbnail(self, upload_filename, thumbnail):
+        """Stream a put_thumbnail frame. Its ack takes a window slot but is not counted in the results."""
+        self.slots.acquire()
+        self.expected.put((upload_filename, time.perf_counter(), True))
+        self.conn.send_json({"cmd": "put_thumbnail", "name": upload_filename, "size": len(thumbnail)}, thumbnail)
+        if self.metrics:
+            self.metrics.count('sent_bytes', len(thumbnail))
+
+    def finish(self):
+        """Wait for all outstanding acks. Returns {name: True/False} for the photos."""
+        self.expected.put(None)
+        self.reader.join()
+        return self.results
+
+    def _read_acks(self):
+        while True:
+            item = self.expected.get()
+            if item is None:
+                return
+            name, sent_at, is_thumbnail = item
+            try:
+                response_str = self.conn.read_line()
+            except OSError:
+                response_str = None  # reset: same as closed
+            if self.metrics and not is_thumbnail:
+                # From starting the send to the device's ack, so it includes the device-side write
+                metrics_lap(self.metrics, 'ack_rtt', sent_at)
+            if not response_str:
+                print(f"    Connection closed before ack for {name}")
+                if not is_thumbnail:
+                    self.results[name] = False
+                self.slots.release()
+                continue
+            resp = json.loads(response_str)
+            name = resp.get("name", name)
+            if is_thumbnail:
+                if resp.get("status") != "ok":
+                    print(f"    Thumbnail for {name} failed: {resp.get('message')}")
+            elif resp.get("status") == "ok":
+                self.results[name] = True
+            else:
+                print(f"    Upload of {name} failed: {resp.get('message')}")
+                self.results[name] = False
+            self.slots.release()
+
+# Resumable uploads (put_chunk): chunk size, and the socket timeout that turns a
+# silently dropped Wi-Fi link into an error we can recover from
+CHUNK_SIZE = 1024 * 1024
+RESUMABLE_TIMEOUT = 60
+
+class ResumableUploader:
+    """
+    Uploads files in put_chunk pieces. The app appends chunks to a partial file and reports
+    how far it got, so after a dropped connection the upload resumes from that offset instead
+    of starting over. The app checks the SHA-1 of the whole file before making it visible.
+    """
+
+    def __init__(self, conn, chunk_size=CHUNK_SIZE, retries=RECONNECT_RETRIES, quiet=False, metrics=None):
+        self.conn = conn
+        self.metrics = metrics
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.quiet = quiet
+        self.results = {}
+
+    def send(self, upload_filename, image_data, thumbnail=None):
+        if thumbnail:
+            self.send_thumbnail(upload_filename, thumbnail)
+        if not self.quiet:
+            print(f"Uploading {upload_filename} ({len(image_data)} bytes)...")
+        sha1 = hashlib.sha1(image_data).hexdigest()
+        try:
+            ok = with_reconnect(self.conn, lambda: self._send_once(upload_filename, image_data, sha1),
+                                self.retries, f"upload of {upload_filename}")
+        except (OSError, ValueError) as e:
+            print(f"    Upload of {upload_filename} failed: {e}")
+            ok = False
+        self.results[upload_filename] = ok
+
+    def send_thumbnail(self, upload_filename, thumbnail):
+        """Thumbnails are small, so they go in one put_thumbnail, sent again in full after a drop."""
+        try:
+            with_reconnect(self.conn, lambda: upload_thumbnail(self.conn, upload_filename, thumbnail),
+                           self.retries, f"thumbnail for {upload_filename}")
+        except (OSError, ValueError) as e:
+            print(f"    Thumbnail for {upload_filename} failed: {e}")
+
+    def finish(self):
+        return self.results
+
+    def _reply(self):
+        resp = self.conn.read_json()
+        if resp is None:
+            raise ConnectionError("Connection closed")
+        return resp
+
+    def _send_once(self, upload_filename, image_data, sha1):
+        total = len(image_data)
+        self.conn.send_json({"cmd": "upload_status", "name": upload_filename, "size": total})
+        offset = self._reply().get("offset", 0)
+        if offset and not self.quiet:
+            print(f"    Resuming {upload_filename} at {offset} of {total} bytes")
+        
+        checksum_failures = 0
+        while True:
+            chunk = image_data[offset:offset + self.chunk_size]
+            t = time.perf_counter()
+            self.conn.send_json({
+                "cmd": "put_chunk",
+                "name": upload_filename,
+                "offset": offset,
+                "size": len(chunk),
+                "total": total,
+                "sha1": sha1
+            }, chunk)
+            resp = self._reply()
+            if self.metrics:
+                metrics_lap(self.metrics, 'chunk_rtt', t)
+                self.metrics.count('sent_bytes', len(chunk))
+            if resp.get("status") == "ok":
+                if resp.get("complete"):
+                    return True
+                offset = resp["offset"]
+                continue
             
-        # 6. Generate Unique Stable Filename
-        abs_path = os.path.abspath(filepath)
-        path_hash = hashlib.md5(abs_path.encode('utf-8')).hexdigest()[:8]
+            message = resp.get("message")
+            if message == "Checksum mismatch" and checksum_failures == 0:
+                # Corrupted in transit; the app dropped the partial, so send it all once more
+                checksum_failures += 1
+            elif message not in ("Offset mismatch", "Incomplete chunk"):
+                print(f"    Upload of {upload_filename} failed: {message}")
+                return False
+            offset = resp.get("offset", 0)
+
+def delete_files(s, names, batched=False, batch_size=500):
+    """
+    Delete files on the device. With batched=True (app advertises delete_files) names
+    are sent in chunks and each chunk is one DB transaction on the device; otherwise
+    falls back to one delete_file round trip per name.
+    Returns the number of files deleted.
+    """
+    deleted = 0
+    if not batched:
+        for name in names:
+            print(f"Deleting {name}...")
+            resp = s.request({"cmd": "delete_file", "name": name})
+            if resp is None:
+                raise ConnectionError("Connection closed by the app")
+            if resp.get("status") != "ok":
+                print(f"Failed to delete: {resp.get('message')}")
+            else:
+                deleted += 1
+        return deleted
+    
+    for i in range(0, len(names), batch_size):
+        chunk = names[i:i + batch_size]
+        print(f"Deleting {len(chunk)} files ({i + len(chunk)}/{len(names)})...")
+        resp = s.request({"cmd": "delete_files", "names": chunk})
+        if resp is None:
+            raise ConnectionError("Connection closed by the app")
+        if resp.get("status") != "ok":
+            print(f"Failed to delete batch: {resp.get('message')}")
+            continue
+        deleted += resp.get("deleted", 0)
+        for failure in resp.get("failed", []):
+            print(f"Failed to delete {failure.get('name')}: {failure.get('message')}")
+    return deleted
+
+def remote_listing_command(info, cache=None, device_key=None):
+    """list_changes when the app supports it and there is a cache to keep the mirror in, otherwise list_files."""
+    if cache and "list_changes" in info.get("features", []):
+        # Incremental: only what changed since the token we stored last time
+        return {"cmd": "list_changes", "since": cache.remote_token(device_key) or ""}
+    return {"cmd": "list_files"}
+
+def parse_remote_listing(response, cache=None, device_key=None, prefix=''):
+    """Returns (names, {name: sha1} or None) from a listing reply, or None on error."""
+    if not response:
+        print(f"{prefix}Failed to get response from app.")
+        return None
         
-        # Get stem (ignore extension)
-        base = os.path.basename(filepath)
-        last_dot = base.rfind('.')
-        stem = base[:last_dot] if last_dot != -1 else base
+    if response.get("status") != "ok":
+        print(f"{prefix}Error getting file list: {response.get('message')}")
+        return None
         
-        unique_filename = f"{stem}_{path_hash}.jpg"
-            
-        return unique_filename, output.getvalue()
+    remote_hashes = None
+    if "token" in response:
+        changed = len(response.get("files", [])) + len(response.get("deleted", []))
+        print(f"{prefix}{'Full listing' if response.get('full') else 'Delta'}: {changed} changes.")
+        remote_hashes = cache.apply_remote_changes(device_key, response)
+        remote_files = set(remote_hashes)
+    else:
+        remote_files = set(response.get("files", []))
+    return remote_files, remote_hashes
 
-    except Exception as e:
-        print(f"Error processing {filename}: {e}")
-        return None, None
+def fetch_remote_files(s, info, cache=None, device_key=None):
+    """
+    Ask the device what it holds.
+    Returns (names, {name: sha1} or None), or None on error.
+    """
+    print("Fetching headers...")
+    response = s.request(remote_listing_command(info, cache, device_key))
+    remote = parse_remote_listing(response, cache, device_key)
+    if remote:
+        print(f"App has {len(remote[0])} files.")
+    return remote
 
-def read_line(sock):
-    """Read a line ending with \n from the socket."""
-    buf = b""
-    while True:
-        c = sock.recv(1)
-        if not c:
-            break
-        if c == b'\n':
+def fetch_remote_thumbnails(s):
+    """Names of the photos the device has a thumbnail for."""
+    response = s.request({"cmd": "list_thumbnails"})
+    if not response or response.get("status") != "ok":
+        print(f"Error getting thumbnail list: {(response or {}).get('message')}")
+        return set()
+    return set(response.get("files", []))
+
+def fetch_remote_metadata(s):
+    """Names of the photos the device has metadata for."""
+    response = s.request({"cmd": "list_metadata"})
+    if not response or response.get("status") != "ok":
+        print(f"Error getting metadata list: {(response or {}).get('message')}")
+        return set()
+    return set(response.get("files", []))
+
+def source_file(filepath, st):
+    """A SourceFile for a path found outside scan_sources (e.g. by the watcher), header not read yet."""
+    return SourceFile(os.path.abspath(filepath), st.st_size, st.st_mtime_ns, None, None, None,
+                      get_upload_stem(filepath), None, None, None)
+
+def collect_metadata(sources, index=None, geocoder=None, threads=16):
+    """
+    {source path: metadata} for SourceFiles: date taken, GPS position and its place key,
+    displayed size and EXIF orientation, and the place name if the geocoder has one.
+    Headers the index knows are used as is; the rest are read in threads (no pixels are
+    decoded) and recorded in the index.
+    """
+    rows = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as pool:
+        for source, header in imap_bounded(pool, _read_header, sources, threads * 4):
+            if header is None:
+                continue
+            width, height, orientation, taken, latitude, longitude = header
+            if index and source.width is None:
+                index.record(source.path, source, *header)
+            row = {"width": width, "height": height, "orientation": orientation}
+            if taken:
+                row["taken"] = taken
+            if latitude is not None:
+                row.update(lat=round(latitude, 6), lon=round(longitude, 6), place=place_key(latitude, longitude))
+            rows[source.path] = row
+    if index:
+        index.commit()
+    if geocoder:
+        names = geocoder.resolve((row["lat"], row["lon"]) for row in rows.values() if "place" in row)
+        for row in rows.values():
+            if names.get(row.get("place")):
+                row["location"] = names[row["place"]]
+    return rows
+
+def push_metadata(s, metadata):
+    """
+    Send {upload name: metadata} to the app in put_metadata batches of METADATA_BATCH;
+    it stores each batch, with any place names as locations, in one transaction.
+    Returns how many photos were stored.
+    """
+    photos = [dict(row, name=name) for name, row in sorted(metadata.items())]
+    stored = 0
+    for i in range(0, len(photos), METADATA_BATCH):
+        response = s.request({"cmd": "put_metadata", "photos": photos[i:i + METADATA_BATCH]})
+        if not response or response.get("status") != "ok":
+            print(f"Error sending metadata: {(response or {}).get('message')}")
             break
-        buf += c
-    return buf.decode('utf-8')
+        stored += response.get("stored", 0)
+    return stored
+
+def send_metadata(s, sources, index=None, geocoder=None, retries=0):
+    """collect_metadata for {upload name: SourceFile} and push it; prints what was sent."""
+    if not sources:
+        return
+    rows = collect_metadata(sources.values(), index, geocoder)
+    metadata = {name: rows[source.path] for name, source in sources.items() if source.path in rows}
+    stored = with_reconnect(s, lambda: push_metadata(s, metadata), retries, "metadata")
+    located = sum(1 for row in metadata.values() if "location" in row)
+    print(f"Sent metadata for {stored} of {len(sources)} photos ({located} with a place name).")
+
+def make_uploader(s, info, window=16, resume=False, metrics=None, quiet=False):
+    """
+    Pick the upload path: resumable put_chunk if asked for, pipelined put_file if the app
+    supports it, else None for stop-and-wait receive_file.
+    Also returns how many times to reconnect on a dropped link (0 unless resumable).
+    """
+    features = info.get("features", [])
+    if resume:
+        if "put_chunk" in features:
+            s.settimeout(RESUMABLE_TIMEOUT)
+            return ResumableUploader(s, quiet=quiet, metrics=metrics), RECONNECT_RETRIES
+        print("App does not support resumable uploads; falling back to a single connection.")
+    if window > 1 and "put_file" in features:
+        return PipelinedUploader(s, window, quiet=quiet, metrics=metrics), 0
+    return None, 0
+
+def finish_uploads(s, uploader, retries=0):
+    """Wait for outstanding pipelined uploads, then have the app rebuild its photo list once."""
+    if not uploader:
+        return
+    results = uploader.finish()
+    print(f"Uploaded {sum(results.values())} of {len(results)} files.")
+    if results:
+        with_reconnect(s, lambda: s.request({"cmd": "refresh_photos"}), retries, "refresh")
 
-def sync_direct_push(app_host, port, local_dirs):
-    print(f"Connecting to Android App at {app_host}:{port}...")
+def sync_direct_push(client, local_dirs, cache=None, jobs=1, decode_mode='fast', window=16, resume=False, encoding=None,
+                     max_pixels=DEFAULT_MAX_PIXELS, index=None, metadata=False, geocoder=None, metrics=None):
+    """
+    Push every photo under local_dirs that the device lacks or has an old version of,
+    then delete the device's photos that are no longer there. With metadata (and an app
+    that takes it), each photo's date, position and place name follow in bulk.
+    """
+    print(f"Connecting to Android App at {client.key}...")
+    stage = metrics.stage if metrics else (lambda name: contextlib.nullcontext())
     
     # 0. Get Device Resolution
-    dev_w, dev_h = get_device_resolution(app_host, port)
+    info = get_device_info(client)
+    dev_w, dev_h = get_device_resolution(info)
+    encoder = resolve_encoder(info, encoding)
+    res_key = encoded_key(resolution_key(dev_w, dev_h), encoder)
+    
+    try:
+        s = client.conn  # the session's connection; no timeout for large transfers unless --timeout
+    except Exception as e:
+        print(f"Failed to connect: {e}")
+        return
     
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.settimeout(None) # Disable timeout for large transfers
+    uploader, retries = make_uploader(s, info, window, resume, metrics)
+
+    # 1. Get List of Files
+    with stage('list'):
+        remote = with_reconnect(s, lambda: fetch_remote_files(s, info, cache, client.key), retries, "listing")
+    if remote is None:
+        return
+    remote_files, remote_hashes = remote
+    # Photos already on the device get a thumbnail too if they have none yet
+    remote_thumbnails = with_reconnect(s, lambda: fetch_remote_thumbnails(s), retries, "thumbnail listing") if encoder['thumbnail'] else set()
+    metadata = metadata and "put_metadata" in info.get("features", [])
+    remote_metadata = with_reconnect(s, lambda: fetch_remote_metadata(s), retries, "metadata listing") if metadata else set()
+
+    # 2. Process Local Files
+    processed_files = set()
+    # Upload name -> SourceFile, for photos that need their metadata sent
+    metadata_sources = {}
+    
+    for local_dir in local_dirs:
+        if not os.path.isdir(local_dir):
+            print(f"Error: {local_dir} not found.")
+            return
+    
+    def pending_work():
+        """Yield files that need an upload decision beyond the manifest."""
+        # The scan's size and mtime stand in for os.stat(); with an index, most come from it
+        sources = scan_sources(local_dirs, index)
+        for st in metrics.timed_iter('walk', sources) if metrics else sources:
+            filepath = st.path
+            
+            # Unchanged since we last processed it? Then we know its name without decoding.
+            with stage('cache_lookup'):
+                entry = cache.lookup(filepath, res_key, st) if cache else None
+            if metadata:
+                name = entry["upload_name"] if entry else st.upload_stem + encoder['ext']
+                if name not in remote_metadata:
+                    metadata_sources[name] = st
+            if entry and entry["upload_name"] in remote_files and (not encoder['thumbnail'] or entry["upload_name"] in remote_thumbnails):
+                processed_files.add(entry["upload_name"])
+                print(f"Skipping {entry['upload_name']} (exists)")
+                if metrics:
+                    metrics.count('files_skipped')
+                continue
+            
+            image_data = cache.get_encoded(filepath, res_key, st) if entry else None
+            if image_data is not None:
+                yield filepath, st, cached_result(entry["upload_name"], image_data, encoder)
+            else:
+                yield filepath, st, None
+    
+    for filepath, st, (upload_filename, image_data, thumbnail), fresh in process_pipeline(pending_work(), dev_w, dev_h, jobs, decode_mode, encoder, metrics, max_pixels):
+        if not upload_filename:
+            continue
+        # A manifest miss for a path we have seen before means the source was edited
+        edited = fresh and remote_hashes is not None and cache.has_entry(filepath, res_key)
+        if cache and fresh:
+            with stage('cache_record'):
+                cache.record(filepath, res_key, upload_filename, image_data, st)
+            
+        processed_files.add(upload_filename)
+        
+        if upload_filename in remote_files:
+            if edited and remote_hashes.get(upload_filename) != hashlib.sha1(image_data).hexdigest():
+                print(f"Updating {upload_filename} (source changed)")
+            elif thumbnail and upload_filename not in remote_thumbnails:
+                print(f"Adding thumbnail for {upload_filename}")
+                if uploader:
+                    uploader.send_thumbnail(upload_filename, thumbnail)
+                else:
+                    upload_thumbnail(s, upload_filename, thumbnail)
+                continue
+            else:
+                print(f"Skipping {upload_filename} (exists)")
+                continue
+            
+        # Upload
+        if metrics:
+            metrics.count('files_uploaded')
+        if metadata and upload_filename not in metadata_sources:
+            # An edited source may have a new date or position too
+            metadata_sources[upload_filename] = st
+        if uploader:
+            uploader.send(upload_filename, image_data, thumbnail)
+        else:
+            upload_file(s, upload_filename, image_data, metrics=metrics, thumbnail=thumbnail)
+    
+    with stage('finish_uploads'):
+        finish_uploads(s, uploader, retries)
+    
+    if cache:
+        with stage('cache_commit'):
+            cache.commit()
+    
+    # After the photos: they matter more if the sync is cut short
+    if metadata:
+        with stage('metadata'):
+            send_metadata(s, {name: st for name, st in metadata_sources.items() if name in processed_files},
+                          index, geocoder, retries)
+
+    # 3. Delete Orphans
+    print("\nChecking for orphans...")
+    orphans = sorted(remote_files - processed_files)
+    if orphans:
+        batched = "delete_files" in info.get("features", [])
+        with stage('delete'):
+            deleted = with_reconnect(s, lambda: delete_files(s, orphans, batched), retries, "delete")
+        print(f"Deleted {deleted} of {len(orphans)} orphans.")
+                
+    print("Sync Complete.")
+
+def _watch_targets(changed, known):
+    """Split changed paths from a watcher into (photos to push, photos gone) and update known."""
+    to_push = set()
+    removed = set()
+    for path in changed:
+        if os.path.isdir(path):
+            # A new or moved-in directory: the watcher has no events for what was already in it
+            for filepath in iter_source_files([path]):
+                to_push.add(filepath)
+        elif os.path.isfile(path):
+            to_push.add(path)
+        else:
+            prefix = path + os.sep
+            removed |= {p for p in known if p == path or p.startswith(prefix)}
+    known |= to_push
+    known -= removed
+    return to_push, removed
+
+def sync_watch(client, local_dirs, cache=None, jobs=1, decode_mode='fast', window=16, resume=False, encoding=None,
+               max_pixels=DEFAULT_MAX_PIXELS, poll_interval=None, debounce=WATCH_DEBOUNCE, index=None, metadata=False, geocoder=None,
+               metrics=None):
+    """
+    Full sync once, then keep the device in step with local_dirs: filesystem events
+    (or polling, see make_watcher) are collected into batches, and each batch only
+    pushes the photos that were added or modified and deletes the ones removed,
+    over one connection kept open between batches.
+    """
+    for local_dir in local_dirs:
+        if not os.path.isdir(local_dir):
+            print(f"Error: {local_dir} not found.")
+            return
+    # Watcher events and scan_sources then both give absolute paths
+    local_dirs = [os.path.abspath(d) for d in local_dirs]
+    
+    # Watch first, so nothing that changes during the initial sync is missed
+    with make_watcher(local_dirs, IMAGE_EXTENSIONS, poll_interval) as watcher:
+        known = set(watcher.known)
+        sync_direct_push(client, local_dirs, cache=cache, jobs=jobs, decode_mode=decode_mode, window=window, resume=resume,
+                         encoding=encoding, max_pixels=max_pixels, index=index, metadata=metadata, geocoder=geocoder,
+                         metrics=metrics)
+        
+        info = get_device_info(client)
+        dev_w, dev_h = get_device_resolution(info)
+        encoder = resolve_encoder(info, encoding)
+        res_key = encoded_key(resolution_key(dev_w, dev_h), encoder)
+        metadata = metadata and "put_metadata" in info.get("features", [])
+        device_key = client.key
         try:
-            s.connect((app_host, port))
+            s = client.conn
         except Exception as e:
             print(f"Failed to connect: {e}")
             return
-
-        # 1. Get List of Files
-        print("Fetching headers...")
-        list_cmd = json.dumps({"cmd": "list_files"})
-        s.sendall(list_cmd.encode('utf-8') + b'\n')
+        # Kept open between batches; a dead link has to turn into an error we can reconnect from
+        s.settimeout(client.timeout or RESUMABLE_TIMEOUT)
+        
+        def check_connection():
+            # Idle for a while: the app or the network may have dropped the connection
+            if s.request({"cmd": "get_device_info"}) is None:
+                raise ConnectionError("Connection closed")
         
-        response_str = read_line(s)
-        if not response_str:
-            print("Failed to get response from app.")
+        remote = fetch_remote_files(s, info, cache, device_key)
+        if remote is None:
             return
+        remote_files, remote_hashes = remote
+        print(f"\nWatching {', '.join(local_dirs)} for changes (Ctrl+C to stop)...")
+        
+        while True:
+            changed = wait_for_changes(watcher, debounce)
+            if RESCAN in changed:
+                print("Missed some filesystem events; running a full sync.")
+                sync_direct_push(client, local_dirs, cache=cache, jobs=jobs, decode_mode=decode_mode, window=window,
+                                 resume=resume, encoding=encoding, max_pixels=max_pixels, index=index, metadata=metadata,
+                                 geocoder=geocoder, metrics=metrics)
+                known = set(iter_source_files(local_dirs, index))
+                with_reconnect(s, check_connection, RECONNECT_RETRIES, "reconnect")
+                remote = fetch_remote_files(s, info, cache, device_key)
+                if remote:
+                    remote_files, remote_hashes = remote
+                continue
             
-        response = json.loads(response_str)
-        if response.get("status") != "ok":
-            print(f"Error getting file list: {response.get('message')}")
-            return
+            to_push, removed = _watch_targets(changed, known)
+            print(f"\n{time.strftime('%H:%M:%S')} {len(to_push)} added or modified, {len(removed)} removed")
+            with_reconnect(s, check_connection, RECONNECT_RETRIES, "reconnect")
             
-        remote_files = set(response.get("files", []))
-        print(f"App has {len(remote_files)} files.")
+            def work():
+                for filepath in sorted(to_push):
+                    try:
+                        st = os.stat(filepath)
+                    except OSError as e:
+                        print(f"Error reading {filepath}: {e}")
+                        continue
+                    entry = cache.lookup(filepath, res_key, st) if cache else None
+                    if entry and entry["upload_name"] in remote_files:
+                        continue  # e.g. touched, or moved back unchanged
+                    image_data = cache.get_encoded(filepath, res_key, st) if entry else None
+                    yield filepath, st, cached_result(entry["upload_name"], image_data, encoder) if image_data is not None else None
+            
+            # As make_uploader would pick, for batches with nothing to upload
+            retries = RECONNECT_RETRIES if resume and "put_chunk" in info.get("features", []) else 0
+            pushed = {}
+            if to_push:
+                # Per batch, and only when there is something to push: a pipelined uploader runs a reader thread
+                uploader, retries = make_uploader(s, info, window, resume, metrics)
+                try:
+                    for filepath, st, (upload_filename, image_data, thumbnail), fresh in process_pipeline(work(), dev_w, dev_h, jobs, decode_mode, encoder, metrics, max_pixels):
+                        if not upload_filename:
+                            continue
+                        if cache and fresh:
+                            cache.record(filepath, res_key, upload_filename, image_data, st)
+                        if remote_hashes is not None:
+                            sha1 = hashlib.sha1(image_data).hexdigest()
+                            if remote_hashes.get(upload_filename) == sha1:
+                                print(f"Skipping {upload_filename} (unchanged)")
+                                continue
+                            remote_hashes[upload_filename] = sha1
+                        remote_files.add(upload_filename)
+                        pushed[upload_filename] = source_file(filepath, st)
+                        if metrics:
+                            metrics.count('files_uploaded')
+                        if uploader:
+                            uploader.send(upload_filename, image_data, thumbnail)
+                        else:
+                            upload_file(s, upload_filename, image_data, metrics=metrics, thumbnail=thumbnail)
+                finally:
+                    finish_uploads(s, uploader, retries)
+                if cache:
+                    cache.commit()
+                if metadata:
+                    send_metadata(s, pushed, index, geocoder, retries)
+            
+            names = sorted({get_upload_filename(p, encoder['ext']) for p in removed} & remote_files)
+            if names:
+                batched = "delete_files" in info.get("features", [])
+                deleted = with_reconnect(s, lambda: delete_files(s, names, batched), retries, "delete")
+                print(f"Deleted {deleted} of {len(names)} files.")
+                remote_files -= set(names)
+
+# Rough JPEG size for a photo filling the screen, used by plans when nothing better is known
+ESTIMATED_BYTES_PER_PIXEL = 0.2
 
-        # 2. Process Local Files
-        processed_files = set()
+def plan_sync(client, local_dirs, plan_path, cache=None, encoding=None, index=None, metadata=False):
+    """
+    Work out what sync would upload and delete without decoding or uploading anything.
+    Upload names depend only on source paths, so the diff needs just the directory scan
+    and the device's file list. Byte totals come from the processing cache when the file
+    was encoded before, otherwise from the average encoded size (or a per-pixel model).
+    With metadata, the plan also lists the photos the device lacks metadata for.
+    """
+    print(f"Connecting to Android App at {client.key}...")
+    info = get_device_info(client)
+    dev_w, dev_h = get_device_resolution(info)
+    encoder = resolve_encoder(info, encoding)
+    res_key = encoded_key(resolution_key(dev_w, dev_h), encoder)
+    device_key = client.key
+    
+    for local_dir in local_dirs:
+        if not os.path.isdir(local_dir):
+            print(f"Error: {local_dir} not found.")
+            return
+    
+    try:
+        remote = fetch_remote_files(client, info, cache, device_key)
+    except Exception as e:
+        print(f"Failed to connect: {e}")
+        return
+    if remote is None:
+        return
+    remote_files, remote_hashes = remote
+    remote_sizes = cache.remote_sizes(device_key) if cache and remote_hashes is not None else {}
+    metadata = metadata and "put_metadata" in info.get("features", [])
+    remote_metadata = fetch_remote_metadata(client) if metadata else set()
+    
+    default_estimate = (cache.average_encoded_size(res_key) if cache else None) \
+        or int(max(dev_w, dev_h) * min(dev_w, dev_h) * ESTIMATED_BYTES_PER_PIXEL)
+    
+    uploads = []
+    missing_metadata = []
+    local_files = set()
+    unchanged = 0
+    for st in scan_sources(local_dirs, index):
+        filepath = st.path
+        entry = cache.lookup(filepath, res_key, st) if cache else None
+        upload_filename = entry["upload_name"] if entry else st.upload_stem + encoder['ext']
+        local_files.add(upload_filename)
+        if metadata and upload_filename in remote_files and upload_filename not in remote_metadata:
+            # Uploads get theirs when they are applied
+            missing_metadata.append({"path": filepath, "name": upload_filename})
         
-        for local_dir in local_dirs:
-            if not os.path.isdir(local_dir):
-                print(f"Error: {local_dir} not found.")
-                return
-                
-            print(f"Scanning {local_dir}...")
-            for root, dirs, files in os.walk(local_dir):
-                for file in files:
-                    filepath = os.path.join(root, file)
-                    
-                    # Basic extension check to skip non-images early
-                    if not file.lower().endswith(('.jpg', '.jpeg', '.png', '.webp', '.heic')):
-                         continue
-                    
-                    # Process with Smart Resize
-                    upload_filename, image_data = process_image(filepath, dev_w, dev_h)
-                    if not upload_filename:
-                        continue
-                        
-                    processed_files.add(upload_filename)
-                    
-                    if upload_filename in remote_files:
-                        print(f"Skipping {upload_filename} (exists)")
-                        continue
-                        
-                    # Upload
-                    print(f"Uploading {upload_filename} ({len(image_data)} bytes)...", end=' ', flush=True)
-                    
-                    # Send Command
-                    cmd = json.dumps({
-                        "cmd": "receive_file",
-                        "name": upload_filename,
-                        "size": len(image_data)
-                    })
-                    s.sendall(cmd.encode('utf-8') + b'\n')
-                    
-                    # Wait for ready
-                    resp = json.loads(read_line(s))
-                    if resp.get("status") != "ready":
-                        print(f"\n    App not ready: {resp.get('message')}")
-                        continue
-                        
-                    # Send Data
-                    s.sendall(image_data)
-                    
-                    # Wait for Ack
-                    resp = json.loads(read_line(s))
-                    if resp.get("status") != "ok":
-                         print(f"\n    Upload failed: {resp.get('message')}")
-                    else:
-                         print("Success.")
-
-        # 3. Delete Orphans
-        print("\nChecking for orphans...")
-        for remote_file in remote_files:
-            if remote_file not in processed_files:
-                print(f"Deleting {remote_file}...")
-                cmd = json.dumps({
-                    "cmd": "delete_file",
-                    "name": remote_file
-                })
-                s.sendall(cmd.encode('utf-8') + b'\n')
-                
-                resp = json.loads(read_line(s))
-                if resp.get("status") != "ok":
-                    print(f"Failed to delete: {resp.get('message')}")
-                    
-        print("Sync Complete.")
+        if upload_filename not in remote_files:
+            reason = "new"
+        elif not entry and remote_hashes is not None and cache.has_entry(filepath, res_key):
+            reason = "changed"
+        else:
+            unchanged += 1
+            continue
+        
+        estimate = entry["encoded_size"] if entry else (cache.last_encoded_size(filepath, res_key) if cache else None)
+        uploads.append({
+            "path": filepath,
+            "name": upload_filename,
+            "reason": reason,
+            "estimated_bytes": estimate or default_estimate,
+        })
+    
+    deletes = [{"name": name, "bytes": remote_sizes.get(name)} for name in sorted(remote_files - local_files)]
+    
+    plan = {
+        "version": 1,
+        "device": device_key,
+        "created": datetime.datetime.now().isoformat(timespec='seconds'),
+        "resolution": [dev_w, dev_h],
+        "encoder": encoder,
+        "local_dirs": [os.path.abspath(d) for d in local_dirs],
+        "unchanged": unchanged,
+        "upload_bytes": sum(u["estimated_bytes"] for u in uploads),
+        "delete_bytes": sum(d["bytes"] or 0 for d in deletes),
+        "uploads": uploads,
+        "deletes": deletes,
+    }
+    if metadata:
+        # Only for photos not uploaded; apply sends metadata for every upload as well
+        uploading = {u["path"] for u in uploads}
+        plan["metadata"] = [m for m in missing_metadata if m["path"] not in uploading]
+    
+    print("\nSync Plan")
+    print("-" * 30)
+    print(f"Unchanged:  {unchanged}")
+    print(f"Upload:     {len(uploads)} (~{plan['upload_bytes'] / 1e6:.1f} MB, {sum(u['reason'] == 'changed' for u in uploads)} changed)")
+    print(f"Delete:     {len(deletes)}" + (f" ({plan['delete_bytes'] / 1e6:.1f} MB)" if remote_sizes else ""))
+    if metadata:
+        print(f"Metadata:   {len(uploads) + len(plan['metadata'])} photos")
+    for d in deletes[:20]:
+        print(f"  - {d['name']}")
+    if len(deletes) > 20:
+        print(f"  ... and {len(deletes) - 20} more")
+    
+    if plan_path:
+        with open(plan_path, 'w') as f:
+            json.dump(plan, f, indent=2)
+        print(f"Wrote plan to {plan_path}")
+    return plan
 
-def show_db(app_host, port, db_name):
-    print(f"Connecting to Android App at {app_host}:{port}...")
+def apply_sync_plan(client, plan_path, cache=None, jobs=1, decode_mode='fast', window=16, resume=False, max_pixels=DEFAULT_MAX_PIXELS,
+                    index=None, metadata=False, geocoder=None, metrics=None):
+    """
+    Execute exactly the uploads and deletes in a plan written by plan_sync, then send
+    metadata for the uploads and the photos the plan lists (if it was made with metadata).
+    """
+    stage = metrics.stage if metrics else (lambda name: contextlib.nullcontext())
+    with open(plan_path) as f:
+        plan = json.load(f)
+    
+    if plan.get("device") != client.key:
+        print(f"Warning: plan was made for {plan.get('device')}, applying to {client.key}.")
+    
+    print(f"Connecting to Android App at {client.key}...")
+    info = get_device_info(client)
+    dev_w, dev_h = plan["resolution"]
+    encoder = plan.get("encoder")  # plans from before selectable encodings are baseline JPEG
+    if encoder and encoder.get('thumbnail') and "put_thumbnail" not in info.get("features", []):
+        print("Warning: app does not accept thumbnails; sending photos only.")
+        encoder = dict(encoder, thumbnail=0)
+    res_key = encoded_key(resolution_key(dev_w, dev_h), encoder)
+    
     try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.connect((app_host, port))
-            
-            cmd = json.dumps({"cmd": "get_db", "db": db_name})
-            s.sendall(cmd.encode('utf-8') + b'\n')
-            
-            response_str = read_line(s)
-            if response_str:
-                response = json.loads(response_str)
-                if response.get("status") == "ok":
-                    data = response.get("data")
-                    if db_name == "history":
-                         # Print Table Header
-                        print(f"{'File Name':<40} | {'Last Shown (Local Time)':<30}")
-                        print("-" * 75)
-                        for item in data:
-                            filename = item.get("fileName")
-                            ts = item.get("lastShown")
-                            if ts and isinstance(ts, (int, float)):
-                                dt = datetime.datetime.fromtimestamp(ts / 1000.0) # Local time by default
-                                ts_str = dt.strftime("%Y-%m-%d %H:%M:%S")
-                            else:
-                                ts_str = str(ts)
-                            print(f"{filename:<40} | {ts_str:<30}")
+        s = client.conn
+    except Exception as e:
+        print(f"Failed to connect: {e}")
+        return
+    
+    planned_names = {u["path"]: u["name"] for u in plan["uploads"]}
+    
+    def planned_work():
+        for upload in plan["uploads"]:
+            filepath = upload["path"]
+            try:
+                st = os.stat(filepath)
+            except OSError as e:
+                print(f"Error reading {filepath}: {e}")
+                continue
+            entry = cache.lookup(filepath, res_key, st) if cache else None
+            image_data = cache.get_encoded(filepath, res_key, st) if entry else None
+            yield filepath, st, cached_result(entry["upload_name"], image_data, encoder) if image_data is not None else None
+    
+    # Plans made without metadata (or before it existed) don't send any
+    metadata = metadata and "metadata" in plan and "put_metadata" in info.get("features", [])
+    metadata_sources = {}
+    
+    uploader, retries = make_uploader(s, info, window, resume, metrics)
+    print(f"Uploading {len(plan['uploads'])} files...")
+    for filepath, st, (upload_filename, image_data, thumbnail), fresh in process_pipeline(planned_work(), dev_w, dev_h, jobs, decode_mode, encoder, metrics, max_pixels):
+        if not upload_filename:
+            continue
+        if upload_filename != planned_names[filepath]:
+            print(f"Warning: {filepath} now maps to {upload_filename}, plan said {planned_names[filepath]}")
+        if cache and fresh:
+            with stage('cache_record'):
+                cache.record(filepath, res_key, upload_filename, image_data, st)
+        if metadata:
+            metadata_sources[upload_filename] = source_file(filepath, st)
+        if metrics:
+            metrics.count('files_uploaded')
+        if uploader:
+            uploader.send(upload_filename, image_data, thumbnail)
+        else:
+            upload_file(s, upload_filename, image_data, metrics=metrics, thumbnail=thumbnail)
+    
+    with stage('finish_uploads'):
+        finish_uploads(s, uploader, retries)
+    if cache:
+        with stage('cache_commit'):
+            cache.commit()
+    
+    if metadata:
+        for m in plan["metadata"]:
+            try:
+                metadata_sources[m["name"]] = source_file(m["path"], os.stat(m["path"]))
+            except OSError as e:
+                print(f"Error reading {m['path']}: {e}")
+        with stage('metadata'):
+            send_metadata(s, metadata_sources, index, geocoder, retries)
+    
+    names = [d["name"] for d in plan["deletes"]]
+    if names:
+        print(f"\nDeleting {len(names)} files...")
+        batched = "delete_files" in info.get("features", [])
+        with stage('delete'):
+            deleted = with_reconnect(s, lambda: delete_files(s, names, batched), retries, "delete")
+        print(f"Deleted {deleted} of {len(names)} files.")
+    
+    print("Sync Complete.")
+
+def parse_hosts(spec, default_port):
+    """
+    Hosts for sync: a comma-separated list of host[:port], or @FILE for an inventory
+    file with one host[:port] per line (blank lines and # comments are ignored).
+    """
+    if spec.startswith('@'):
+        with open(spec[1:]) as f:
+            entries = [line.split('#', 1)[0].strip() for line in f]
+    else:
+        entries = spec.split(',')
+    
+    hosts = []
+    for entry in entries:
+        entry = entry.strip()
+        if not entry:
+            continue
+        host, sep, port = entry.rpartition(':')
+        hosts.append((host, int(port)) if sep else (entry, default_port))
+    return hosts
+
+class FleetDevice:
+    """One device in a fan-out sync, with its own connection and upload thread."""
+
+    def __init__(self, host, port, info, window, encoder, resume=False, metrics=None):
+        self.host = host
+        self.port = port
+        self.key = f"{host}:{port}"
+        self.info = info
+        self.window = window
+        self.encoder = encoder
+        # Resumable uploads, and reconnecting on a dropped link, only where the app has put_chunk
+        self.resume = resume and "put_chunk" in info.get("features", [])
+        self.retries = RECONNECT_RETRIES if self.resume else 0
+        self.metrics = metrics
+        self.res_key = encoded_key(resolution_key(info["width"], info["height"]), encoder)
+        self.conn = None
+        self.remote_files = set()
+        self.remote_hashes = None
+        self.remote_thumbnails = set()
+        self.processed_files = set()
+        # Names queued for upload this sync
+        self.pushed = set()
+        # Bounded, so a slow link applies back-pressure instead of buffering encoded bytes
+        self.queue = queue.Queue(maxsize=max(window, 4))
+        self.sender = threading.Thread(target=self._send_loop, daemon=True)
+        self.uploaded = 0
+        self.failed = 0
+        # Set when the sender gave up on the device (e.g. the connection dropped)
+        self.error = None
+
+    def _send_loop(self):
+        uploader, _ = make_uploader(self.conn, self.info, self.window, self.resume, self.metrics, quiet=True)
+        finished = False
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    finished = True
+                    break
+                upload_filename, image_data, thumbnail = item
+                if image_data is None:
+                    # Backfill for a photo already on the device
+                    print(f"[{self.key}] Adding thumbnail for {upload_filename}")
+                    if uploader:
+                        uploader.send_thumbnail(upload_filename, thumbnail)
                     else:
-                        print(json.dumps(data, indent=2))
+                        upload_thumbnail(self.conn, upload_filename, thumbnail)
+                    continue
+                print(f"[{self.key}] Uploading {upload_filename} ({len(image_data)} bytes)")
+                if self.metrics:
+                    self.metrics.count('files_uploaded')
+                if uploader:
+                    uploader.send(upload_filename, image_data, thumbnail)
+                elif upload_file(self.conn, upload_filename, image_data, quiet=True, metrics=self.metrics, thumbnail=thumbnail):
+                    self.uploaded += 1
                 else:
-                    print(f"Error: {response.get('message')}")
+                    self.failed += 1
+            if uploader:
+                results = uploader.finish()
+                self.uploaded = sum(results.values())
+                self.failed = len(results) - self.uploaded
+                if results:
+                    with_reconnect(self.conn, lambda: self.conn.request({"cmd": "refresh_photos"}), self.retries, "refresh")
+        except Exception as e:
+            print(f"[{self.key}] Upload failed, dropping device: {e}")
+            self.error = e
+            self.failed += 1
+            # Keep emptying the queue, so the scan never blocks on it
+            while not finished:
+                item = self.queue.get()
+                if item is None:
+                    finished = True
+                elif item[1] is not None:
+                    self.failed += 1
+
+def sync_fleet(sessions, hosts, local_dirs, cache=None, jobs=1, decode_mode='fast', window=16, resume=False, encoding=None,
+               max_pixels=DEFAULT_MAX_PIXELS, index=None, metadata=False, geocoder=None, metrics=None):
+    """
+    Sync the same photos to many devices. Devices are grouped by normalized resolution
+    and output encoding, each photo is encoded once per group, and the bytes are pushed
+    to every device in the group by per-device sender threads. Each device is talked to
+    over its session connection from `sessions`. Photo metadata is likewise read once
+    and sent to every device that takes it. With resume, devices that support put_chunk
+    upload resumably and reconnect after a drop, as in sync_direct_push.
+    """
+    stage = metrics.stage if metrics else (lambda name: contextlib.nullcontext())
+    for local_dir in local_dirs:
+        if not os.path.isdir(local_dir):
+            print(f"Error: {local_dir} not found.")
+            return
+    
+    # 0. Query every device concurrently
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(hosts)) as pool:
+        infos = list(pool.map(lambda hp: get_device_info(sessions.get(*hp)), hosts))
+    
+    devices = []
+    for (host, port), info in zip(hosts, infos):
+        if not info.get("width") or not info.get("height"):
+            print(f"Skipping {host}:{port} (no device info)")
+            continue
+        prefix = f"[{host}:{port}] "
+        device = FleetDevice(host, port, info, window, resolve_encoder(info, encoding, prefix), resume, metrics)
+        if resume and not device.resume:
+            print(f"{prefix}App does not support resumable uploads; falling back to a single connection.")
+        devices.append(device)
+    if not devices:
+        return
+    
+    groups = collections.defaultdict(list)
+    group_encoders = {}
+    for device in devices:
+        groups[device.res_key].append(device)
+        # A group makes thumbnails if any member takes them; members that don't just aren't sent them
+        if device.res_key not in group_encoders or device.encoder['thumbnail'] > group_encoders[device.res_key]['thumbnail']:
+            group_encoders[device.res_key] = device.encoder
+    for res_key, members in sorted(groups.items()):
+        print(f"Resolution {res_key}: {', '.join(d.key for d in members)}")
+    
+    # 1. Connect and list files concurrently; the cache is only touched from this thread
+    def connect_and_list(device, command):
+        conn = device.conn = sessions.get(device.host, device.port).conn
+        if device.resume:
+            conn.settimeout(RESUMABLE_TIMEOUT)
+        listing = with_reconnect(conn, lambda: conn.request(command), device.retries, "listing")
+        if listing and device.encoder['thumbnail']:
+            # Photos already on the device get a thumbnail too if they have none yet
+            device.remote_thumbnails = with_reconnect(conn, lambda: fetch_remote_thumbnails(conn), device.retries,
+                                                      "thumbnail listing")
+        return listing
+    
+    with stage('list'), concurrent.futures.ThreadPoolExecutor(max_workers=len(devices)) as pool:
+        futures = [(device, pool.submit(connect_and_list, device, remote_listing_command(device.info, cache, device.key)))
+                   for device in devices]
+    for device, future in futures:
+        try:
+            remote = parse_remote_listing(future.result(), cache, device.key, f"[{device.key}] ")
+        except Exception as e:
+            print(f"[{device.key}] Failed to connect: {e}")
+            remote = None
+        if remote is None:
+            groups[device.res_key].remove(device)
+            sessions.get(device.host, device.port).close()
+            continue
+        device.remote_files, device.remote_hashes = remote
+        print(f"[{device.key}] App has {len(device.remote_files)} files.")
+        device.sender.start()
+    
+    active = [d for members in groups.values() for d in members]
+    if not active:
+        return
+    
+    # 2. Scan once; encode each photo once per resolution that some device still needs
+    def encode(filepath, res_key, entry, st):
+        data = cache.get_encoded(filepath, res_key, st) if entry else None
+        future = concurrent.futures.Future()
+        if data is not None:
+            future.set_result((cached_result(entry["upload_name"], data, group_encoders[res_key]), False))
+        else:
+            dev_w, dev_h = (int(x) for x in res_key.split(':')[0].split('x'))
+            process = process_image_timed if metrics else process_image
+            args = (filepath, dev_w, dev_h, decode_mode, group_encoders[res_key])
+            kwargs = {"max_pixels": max_pixels}
+            if pool:
+                def resolve(f):
+                    # e.g. BrokenProcessPool: handed on, so dispatch reports it instead of waiting forever
+                    if f.exception() is not None:
+                        future.set_exception(f.exception())
+                    else:
+                        future.set_result((f.result(), True))
+                pool.submit(process, *args, **kwargs).add_done_callback(resolve)
             else:
-                print("No response from app.")
+                future.set_result((process(*args, **kwargs), True))
+        return future
+    
+    def dispatch(item):
+        filepath, st, res_key, new, maybe_changed, thumbnail_only, future = item
+        try:
+            with stage('encode_wait'):
+                result, fresh = future.result()
+        except Exception as e:
+            print(f"Error processing {filepath}: {e}")
+            return
+        upload_filename, image_data, thumbnail = _record_timings(filepath, st, result, metrics) if fresh else result
+        if not upload_filename:
+            return
+        if cache and fresh:
+            cache.record(filepath, res_key, upload_filename, image_data, st)
+        targets = list(new)
+        thumbnail_only = list(thumbnail_only)
+        if maybe_changed:
+            sha1 = hashlib.sha1(image_data).hexdigest()
+            targets += [d for d in maybe_changed if d.remote_hashes.get(upload_filename) != sha1]
+            thumbnail_only += [d for d in maybe_changed if d not in targets]
+        if thumbnail:
+            for device in thumbnail_only:
+                if not device.error and device.encoder['thumbnail'] and upload_filename not in device.remote_thumbnails:
+                    device.queue.put((upload_filename, None, thumbnail))
+        for device in targets:
+            if device.error:
+                # Its sender gave up: stop encoding for it too
+                if device in groups[device.res_key]:
+                    groups[device.res_key].remove(device)
+                continue
+            device.pushed.add(upload_filename)
+            device.queue.put((upload_filename, image_data, thumbnail if device.encoder['thumbnail'] else None))
+    
+    metadata_devices = [d for d in active if metadata and "put_metadata" in d.info.get("features", [])]
+    scanned = []
+    pool = make_encode_pool(jobs) if jobs > 1 else None
+    in_flight = collections.deque()
+    try:
+        sources = scan_sources(local_dirs, index)
+        for st in metrics.timed_iter('walk', sources) if metrics else sources:
+            filepath = st.path
+            if metadata_devices:
+                scanned.append(st)
+            for res_key, members in groups.items():
+                if not members:
+                    continue
+                entry = cache.lookup(filepath, res_key, st) if cache else None
+                upload_filename = entry["upload_name"] if entry else st.upload_stem + group_encoders[res_key]['ext']
+                edited = cache and not entry and cache.has_entry(filepath, res_key)
+                
+                new = []
+                maybe_changed = []
+                thumbnail_only = []
+                for device in members:
+                    device.processed_files.add(upload_filename)
+                    if upload_filename not in device.remote_files:
+                        new.append(device)
+                    elif edited and device.remote_hashes is not None:
+                        maybe_changed.append(device)
+                    elif device.encoder['thumbnail'] and upload_filename not in device.remote_thumbnails:
+                        thumbnail_only.append(device)
+                if not new and not maybe_changed and not thumbnail_only:
+                    if metrics:
+                        metrics.count('files_skipped')
+                    continue
+                
+                in_flight.append((filepath, st, res_key, new, maybe_changed, thumbnail_only, encode(filepath, res_key, entry, st)))
+                while len(in_flight) >= max(jobs * 2, 2):
+                    dispatch(in_flight.popleft())
+        
+        while in_flight:
+            dispatch(in_flight.popleft())
+    finally:
+        if pool:
+            pool.shutdown()
+        if cache:
+            cache.commit()
+        with stage('finish_uploads'):
+            for device in active:
+                device.queue.put(None)
+            for device in active:
+                device.sender.join()
+    
+    # Devices whose sender failed stopped getting photos, so their orphans can't be told apart
+    failed_devices = [d for d in active if d.error]
+    active = [d for d in active if not d.error]
+    metadata_devices = [d for d in metadata_devices if not d.error]
+    
+    # 3. Metadata for the photos each device lacks it for (or was just sent a new version of)
+    if metadata_devices:
+        with stage('metadata'), concurrent.futures.ThreadPoolExecutor(max_workers=len(metadata_devices)) as list_pool:
+            listed = list(list_pool.map(
+                lambda d: with_reconnect(d.conn, lambda: fetch_remote_metadata(d.conn), d.retries, "metadata listing"),
+                metadata_devices))
+        wanted = {}
+        for device, remote_metadata in zip(metadata_devices, listed):
+            ext = group_encoders[device.res_key]['ext']
+            wanted[device] = {name: st for name, st in ((st.upload_stem + ext, st) for st in scanned)
+                              if name in device.processed_files and (name not in remote_metadata or name in device.pushed)}
+        needed = {st.path: st for sources in wanted.values() for st in sources.values()}
+        rows = collect_metadata(needed.values(), index, geocoder)
+        
+        def send(device):
+            rows_for_device = {name: rows[st.path] for name, st in wanted[device].items() if st.path in rows}
+            return with_reconnect(device.conn, lambda: push_metadata(device.conn, rows_for_device), device.retries, "metadata")
+        
+        with stage('metadata'), concurrent.futures.ThreadPoolExecutor(max_workers=len(metadata_devices)) as send_pool:
+            for device, stored in zip(metadata_devices, send_pool.map(send, metadata_devices)):
+                print(f"[{device.key}] Sent metadata for {stored} photos.")
+    
+    # 4. Delete orphans on every device concurrently
+    def delete_orphans(device):
+        orphans = sorted(device.remote_files - device.processed_files)
+        if orphans:
+            print(f"[{device.key}] Deleting {len(orphans)} orphans...")
+            batched = "delete_files" in device.info.get("features", [])
+            return with_reconnect(device.conn, lambda: delete_files(device.conn, orphans, batched), device.retries, "delete")
+        return 0
+    
+    deleted = []
+    if active:
+        with stage('delete'), concurrent.futures.ThreadPoolExecutor(max_workers=len(active)) as delete_pool:
+            deleted = list(delete_pool.map(delete_orphans, active))
+    
+    print("\nFleet Sync Summary")
+    print("-" * 30)
+    for device, n_deleted in zip(active, deleted):
+        print(f"{device.key:<25} {device.res_key:>10}  uploaded {device.uploaded}, failed {device.failed}, deleted {n_deleted}")
+    for device in failed_devices:
+        print(f"{device.key:<25} {device.res_key:>10}  uploaded {device.uploaded}, failed {device.failed}, dropped ({device.error})")
+    print("Sync Complete.")
+
+def _legacy_db_rows(data, db_name, filters):
+    """Apply get_db query filters client-side, for app builds that only return whole tables."""
+    name = filters.get("name", "").lower()
+    location = filters.get("location", "").lower()
+    rows = [row for row in data
+            if name in row.get("fileName", "").lower()
+            and location in str(row.get("location", "")).lower()
+            and ("shown_before" not in filters or (row.get("lastShown") or 0) < filters["shown_before"])
+            and ("shown_after" not in filters or (row.get("lastShown") or 0) >= filters["shown_after"])]
+    sort_key = {"lastShown": "lastShown", "location": "location"}.get(filters.get("sort"), "fileName")
+    # Missing values sort first, as NULLs do in the app's query; never compared with present ones
+    rows.sort(key=lambda row: (row.get(sort_key) is not None, row.get(sort_key) if row.get(sort_key) is not None else "",
+                               row.get("fileName", "")), reverse=filters.get("order") == "desc")
+    return rows[:filters["limit"]] if "limit" in filters else rows
+
+def iter_db_rows(s, info, db_name, filters=None):
+    """
+    Yield the rows of a device table one at a time. Apps with db_query stream them as
+    NDJSON, filtered and sorted on the device; older builds send the whole table in one
+    line and the filters are applied here.
+    """
+    filters = filters or {}
+    if "db_query" not in info.get("features", []):
+        response = s.request({"cmd": "get_db", "db": db_name})
+        if not response:
+            raise ConnectionError("No response from app.")
+        if response.get("status") != "ok":
+            raise RuntimeError(response.get("message"))
+        yield from _legacy_db_rows(response.get("data") or [], db_name, filters)
+        return
+    
+    s.send_json(dict(filters, cmd="get_db", db=db_name, stream=True))
+    header = s.read_json()
+    if not header:
+        raise ConnectionError("No response from app.")
+    if header.get("status") != "ok":
+        raise RuntimeError(header.get("message"))
+    while True:
+        row = s.read_json()
+        if row is None:
+            raise ConnectionError("Connection closed before the end of the table")
+        if row.get("end"):
+            return
+        yield row
+
+def format_timestamp(ts):
+    if ts and isinstance(ts, (int, float)):
+        return datetime.datetime.fromtimestamp(ts / 1000.0).strftime("%Y-%m-%d %H:%M:%S") # Local time by default
+    return str(ts)
+
+def show_db(client, db_name, filters=None, output_path=None, output_format=None):
+    """
+    Print a device table, or export it to output_path as csv, json or ndjson (by default
+    chosen from the file extension). Rows are written as they arrive.
+    """
+    print(f"Connecting to Android App at {client.key}...")
+    info = get_device_info(client)
+    columns = ["fileName", "lastShown"] if db_name == "history" else ["fileName", "location"]
+    if output_path and not output_format:
+        ext = os.path.splitext(output_path)[1].lower().lstrip('.')
+        output_format = ext if ext in ('csv', 'json', 'ndjson') else 'csv'
+    
+    count = 0
+    try:
+        rows = iter_db_rows(client.conn, info, db_name, filters)
+        if output_path:
+            with open(output_path, 'w', newline='') as f:
+                if output_format == 'csv':
+                    writer = csv.writer(f)
+                    writer.writerow(columns + (["lastShownLocal"] if db_name == "history" else []))
+                elif output_format == 'json':
+                    f.write("[")
+                for row in rows:
+                    if output_format == 'csv':
+                        values = [row.get(c) for c in columns]
+                        writer.writerow(values + ([format_timestamp(row.get("lastShown"))] if db_name == "history" else []))
+                    elif output_format == 'json':
+                        f.write((",\n  " if count else "\n  ") + json.dumps(row))
+                    else:
+                        f.write(json.dumps(row) + "\n")
+                    count += 1
+                if output_format == 'json':
+                    f.write("\n]\n")
+            print(f"Wrote {count} rows to {output_path}")
+            return
+        
+        if db_name == "history":
+             # Print Table Header
+            print(f"{'File Name':<40} | {'Last Shown (Local Time)':<30}")
+            print("-" * 75)
+        else:
+            print(f"{'File Name':<40} | {'Location':<40}")
+            print("-" * 85)
+        for row in rows:
+            value = format_timestamp(row.get("lastShown")) if db_name == "history" else row.get("location")
+            print(f"{row.get('fileName'):<40} | {value}")
+            count += 1
+        print(f"\n{count} rows.")
+    except RuntimeError as e:
+        print(f"Error: {e}")
     except Exception as e:
         print(f"Connection failed: {e}")
+        # Whatever is left of the stream would be read as the next command's reply
+        client.close()
 
-def clear_db(app_host, port, db_name):
-    print(f"Connecting to Android App at {app_host}:{port}...")
+def parse_date_ms(value):
+    """YYYY-MM-DD or an ISO date-time (local time) as epoch milliseconds."""
+    return int(datetime.datetime.fromisoformat(value).timestamp() * 1000)
+
+def simple_command(client, command):
+    """Send a command that answers with a status and a message, and print the outcome."""
+    print(f"Connecting to Android App at {client.key}...")
     try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.connect((app_host, port))
-            
-            cmd = json.dumps({"cmd": "clear_db", "db": db_name})
-            s.sendall(cmd.encode('utf-8') + b'\n')
-            
-            response_str = read_line(s)
-            if response_str:
-                response = json.loads(response_str)
-                if response.get("status") == "ok":
-                    print(f"Success: {response.get('message')}")
-                else:
-                    print(f"Error: {response.get('message')}")
-            else:
-                print("No response from app.")
+        response = client.request(command)
+        if response.get("status") == "ok":
+            print(f"Success: {response.get('message')}")
+        else:
+            print(f"Error: {response.get('message')}")
     except Exception as e:
         print(f"Connection failed: {e}")
 
-def analyze_orientation(local_dirs):
+def clear_db(client, db_name):
+    simple_command(client, {"cmd": "clear_db", "db": db_name})
+
+def show_device_info(client):
+    info = get_device_info(client)
+    if info:
+        print(json.dumps({k: v for k, v in info.items() if k != "status"}, indent=2))
+
+def delete_photos(client, names):
+    """Delete named photos (as listed on the device) in one batch where the app supports it."""
+    print(f"Connecting to Android App at {client.key}...")
+    info = get_device_info(client)
+    try:
+        deleted = delete_files(client, names, "delete_files" in info.get("features", []))
+        print(f"Deleted {deleted} of {len(names)} files.")
+    except Exception as e:
+        print(f"Connection failed: {e}")
+
+def imap_bounded(executor, fn, items, window):
+    """
+    Like executor.map, but consumes `items` lazily with at most `window` calls in
+    flight, and yields results as they complete rather than in input order.
+    """
+    pending = set()
+    for item in items:
+        pending.add(executor.submit(fn, item))
+        if len(pending) >= window:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    for future in concurrent.futures.as_completed(pending):
+        yield future.result()
+
+def _read_header(source):
+    """Worker for analyze_orientation and collect_metadata: returns (source, read_image_metadata() tuple or None)."""
+    if source.width is not None:
+        return source, (source.width, source.height, source.orientation, source.taken, source.latitude, source.longitude)
+    try:
+        return source, read_image_metadata(source.path)
+    except Exception:
+        return source, None
+
+def analyze_orientation(local_dirs, threads=16, index=None, by_dir=False, json_path=None, verify_files=False):
     print("Analyzing photo orientation...")
     total = 0
     landscape = 0
     portrait = 0
     skipped = 0
+    per_dir = collections.defaultdict(lambda: {"landscape": 0, "portrait": 0, "skipped": 0})
     
+    existing_dirs = []
     for local_dir in local_dirs:
         if not os.path.isdir(local_dir):
             print(f"Warning: {local_dir} not found.")
             continue
+        existing_dirs.append(local_dir)
+    
+    # Only headers are read, so this is I/O bound: threads overlap the open latency of network shares.
+    # The scan already has the header of every file the index knows unchanged.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as pool:
+        sources = scan_sources(existing_dirs, index, threads, verify_files=verify_files)
+        for source, header in imap_bounded(pool, _read_header, sources, threads * 4):
+            counts = per_dir[os.path.dirname(source.path)]
+            if header is None:
+                skipped += 1
+                counts["skipped"] += 1
+                continue
+            width, height = header[:2]
+            if index and source.width is None:
+                index.record(source.path, source, *header)
             
-        for root, dirs, files in os.walk(local_dir):
-            for file in files:
-                filepath = os.path.join(root, file)
-                
-                # Basic extension check (optional but speeds things up)
-                if not file.lower().endswith(('.jpg', '.jpeg', '.png', '.webp', '.heic')):
-                    continue
-
-                try:
-                    img = Image.open(filepath)
-                    img = ImageOps.exif_transpose(img)
-                    width, height = img.size
-                    
-                    total += 1
-                    if width >= height:
-                        landscape += 1
-                    else:
-                        portrait += 1
-                except Exception:
-                    skipped += 1
+            total += 1
+            if width >= height:
+                landscape += 1
+                counts["landscape"] += 1
+            else:
+                portrait += 1
+                counts["portrait"] += 1
+    if index:
+        index.commit()
                     
     print("\nOrientation Report")
     print("-" * 30)
@@ -334,58 +1859,203 @@ def analyze_orientation(local_dirs):
     print(f"Landscape:    {landscape} ({landscape/total*100:.1f}%)" if total else "Landscape:    0")
     print(f"Portrait:     {portrait} ({portrait/total*100:.1f}%)" if total else "Portrait:     0")
     print(f"Skipped/Error: {skipped}")
+    
+    if by_dir:
+        print(f"\n{'Directory':<60} | {'Landscape':>9} | {'Portrait':>8} | {'Skipped':>7}")
+        print("-" * 95)
+        for directory in sorted(per_dir):
+            counts = per_dir[directory]
+            print(f"{directory:<60} | {counts['landscape']:>9} | {counts['portrait']:>8} | {counts['skipped']:>7}")
+    
+    if json_path:
+        report = {
+            "total": total,
+            "landscape": landscape,
+            "portrait": portrait,
+            "skipped": skipped,
+            "directories": {d: per_dir[d] for d in sorted(per_dir)},
+        }
+        with open(json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {json_path}")
 
-def delete_all_photos(app_host, port):
-    print(f"Connecting to Android App at {app_host}:{port}...")
+def benchmark_encodings(local_dirs, target_width, target_height, names=None, limit=50, quality=None, subsampling=None, decode_mode='fast'):
+    """
+    Encode a sample of photos in every output format and report bytes per image and
+    encode time. Each photo is decoded and resized once; only the encode is timed.
+    """
+    names = names or list(ENCODINGS)
+    encoders = []
+    for name in names:
+        encoder = make_encoder(name, quality, subsampling)
+        try:
+            encode_image(Image.new('RGB', (16, 16)), None, encoder)
+        except Exception as e:
+            print(f"Skipping {name}: {e}")
+            continue
+        encoders.append(encoder)
+    
+    totals = {e['name']: [0, 0.0] for e in encoders}  # name -> [bytes, seconds]
+    count = 0
+    for filepath in iter_source_files(local_dirs):
+        if count >= limit:
+            break
+        try:
+            img, exif_bytes = resize_for_device(filepath, target_width, target_height, decode_mode)
+            img.load()
+        except Exception as e:
+            print(f"Error processing {os.path.basename(filepath)}: {e}")
+            continue
+        count += 1
+        for encoder in encoders:
+            start = time.perf_counter()
+            data = encode_image(img, exif_bytes, encoder)
+            totals[encoder['name']][1] += time.perf_counter() - start
+            totals[encoder['name']][0] += len(data)
+    
+    if not count:
+        print("No images found.")
+        return
+    
+    baseline = totals.get('jpeg', [0])[0]
+    print(f"\nEncoding Benchmark ({count} images at {target_width}x{target_height})")
+    print("-" * 64)
+    print(f"{'Format':<18} | {'KB/image':>9} | {'vs jpeg':>8} | {'ms/image':>9} | {'MB total':>9}")
+    print("-" * 64)
+    for name, (total_bytes, seconds) in totals.items():
+        ratio = f"{total_bytes / baseline:7.0%}" if baseline else "-"
+        print(f"{name:<18} | {total_bytes / count / 1024:>9.1f} | {ratio:>8} | {seconds / count * 1000:>9.1f} | {total_bytes / 1e6:>9.2f}")
+    print("-" * 64)
+
+def delete_all_photos(client):
+    simple_command(client, {"cmd": "delete_all_files"})
+
+def run_script(parser, path, sessions):
+    """
+    Run manage_app commands from a file ('-': stdin), one command line per line, all
+    sharing `sessions`, so every command for a device goes over one connection.
+    Blank lines and # comments are skipped. A line that fails is reported and the
+    script carries on; its device connection is dropped and reopened on next use.
+    """
+    f = sys.stdin if path == '-' else open(path)
     try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.connect((app_host, port))
-            
-            cmd = json.dumps({"cmd": "delete_all_files"})
-            s.sendall(cmd.encode('utf-8') + b'\n')
-            
-            response_str = read_line(s)
-            if response_str:
-                response = json.loads(response_str)
-                if response.get("status") == "ok":
-                    print(f"Success: {response.get('message')}")
-                else:
-                    print(f"Error: {response.get('message')}")
-            else:
-                print("No response from app.")
-    except Exception as e:
-        print(f"Connection failed: {e}")
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            print(f"\n[{lineno}] {line}", flush=True)
+            try:
+                args = parser.parse_args(shlex.split(line))
+                if args.command in (None, 'run'):
+                    raise ValueError("expected a command other than run")
+                run_command(parser, args, sessions, batch=True)
+            except SystemExit:
+                pass  # argparse or the command already said why
+            except Exception as e:
+                print(f"Error on line {lineno}: {e}")
+                sessions.close()
+    finally:
+        if f is not sys.stdin:
+            f.close()
 
-if __name__ == '__main__':
+def build_parser():
     parser = argparse.ArgumentParser(description='SlideShowAi Management Tool')
+    parser.add_argument('--timeout', type=float, help='Seconds to wait on any send or reply before giving up on the connection (default: wait forever)')
+    parser.add_argument('--connect-timeout', type=float, default=CONNECT_TIMEOUT, help=f'Seconds to wait for a connection (default {CONNECT_TIMEOUT})')
+    parser.add_argument('--retries', type=int, default=SESSION_RETRIES, help=f'Times a command is retried over a new connection after the old one dropped; only commands safe to repeat (default {SESSION_RETRIES})')
     subparsers = parser.add_subparsers(dest='command', help='Command to run')
     
     # Sync Command
     sync_parser = subparsers.add_parser('sync', help='Sync photos to the app')
-    sync_parser.add_argument('app_host', help='Android App Hostname/IP')
-    sync_parser.add_argument('local_dirs', nargs='+', help='Local directories containing photos')
+    sync_parser.add_argument('app_host', help='Android App Hostname/IP. Several as host1,host2:port or @inventory.txt (one per line) sync all of them, encoding once per resolution')
+    sync_parser.add_argument('local_dirs', nargs='*', help='Local directories containing photos')
     sync_parser.add_argument('--port', type=int, default=4000, help='App TCP Port (default 4000)')
+    sync_parser.add_argument('--plan', metavar='PLAN_JSON', help='Only work out what would be uploaded/deleted and write it to PLAN_JSON')
+    sync_parser.add_argument('--apply', metavar='PLAN_JSON', help='Execute a plan written by --plan (no local_dirs needed)')
+    sync_parser.add_argument('--watch', action='store_true', help='After syncing, keep running and push added, modified and removed photos as they change')
+    sync_parser.add_argument('--poll', type=float, metavar='SECONDS', help='With --watch, find changes by rescanning every SECONDS instead of inotify (automatic on network mounts)')
+    sync_parser.add_argument('--debounce', type=float, default=WATCH_DEBOUNCE, help=f'With --watch, seconds without changes before a batch is pushed (default {WATCH_DEBOUNCE:g})')
+    sync_parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help=f'Processing cache location (default {DEFAULT_CACHE_DIR})')
+    sync_parser.add_argument('--jobs', '-j', type=int, default=1, help='Encode images in N worker processes (default 1)')
+    sync_parser.add_argument('--decode', choices=['fast', 'exact'], default='fast', help='fast: reduced-size JPEG decode before resizing; exact: always resample from full resolution (default fast)')
+    sync_parser.add_argument('--max-megapixels', type=float, default=DEFAULT_MAX_PIXELS / 1e6, help=f'Decode budget per image: bigger JPEGs decode at a reduced scale, other bigger formats are processed one at a time (default {DEFAULT_MAX_PIXELS / 1e6:g}, 0 = no limit)')
+    sync_parser.add_argument('--resume', action='store_true', help='Upload in checksummed chunks that resume after a dropped connection, reconnecting with backoff')
+    sync_parser.add_argument('--window', type=int, default=16, help='Max unacknowledged uploads when the app supports pipelining; 1 forces stop-and-wait (default 16)')
+    sync_parser.add_argument('--format', choices=['auto'] + list(ENCODINGS), default='jpeg', help="Output encoding; 'auto' picks the smallest one the device can decode (default jpeg)")
+    sync_parser.add_argument('--quality', type=int, help='Encoder quality, 1-100 (default depends on --format)')
+    sync_parser.add_argument('--subsampling', choices=['4:4:4', '4:2:2', '4:2:0'], help='Chroma subsampling for JPEG, HEIC and AVIF')
+    sync_parser.add_argument('--thumbnails', action='store_true', help='Also send a small JPEG thumbnail of every photo, which the app shows while the photo decodes (added to photos already on the device too)')
+    sync_parser.add_argument('--thumbnail-size', type=int, default=THUMBNAIL_SIZE, help=f'Longest side of thumbnails in pixels (default {THUMBNAIL_SIZE})')
+    sync_parser.add_argument('--no-metadata', action='store_true', help="Don't send the photos' date, GPS position and place name to the app (sent by default when it supports it)")
+    sync_parser.add_argument('--gazetteer', metavar='CITIES_TXT', help=f'GeoNames cities file (e.g. cities1000.txt) to name places offline (default: the first cities*.txt in {DEFAULT_GAZETTEER_DIR})')
+    sync_parser.add_argument('--metrics', action='store_true', help='Time every stage (walk, decode, resize, encode, network) and print a summary with the slowest files')
+    sync_parser.add_argument('--metrics-jsonl', metavar='PATH', help='With --metrics, append one JSON line per processed file plus a summary line to PATH')
+    sync_parser.add_argument('--profile', metavar='PSTATS', help='Write a cProfile dump of the sync (main process only) to PSTATS')
+    sync_parser.add_argument('--no-cache', action='store_true', help='Ignore the processing cache and metadata index and re-encode everything')
+    sync_parser.add_argument('--rescan', action='store_true', help='List every directory again, not just the ones whose mtime changed')
+    sync_parser.add_argument('--jpeg-cache-mb', type=int, default=0, help='Also keep up to this many MB of encoded JPEGs (default 0 = off)')
     
     # Show DB Command
     show_parser = subparsers.add_parser('show-db', help='Show database contents')
     show_parser.add_argument('app_host', help='Android App Hostname/IP')
     show_parser.add_argument('--port', type=int, default=4000, help='App TCP Port (default 4000)')
     show_parser.add_argument('--db', required=True, choices=['location', 'history'], help='Database to show')
+    show_parser.add_argument('--name', help='Only file names containing this text')
+    show_parser.add_argument('--location', help='Only locations containing this text (location db)')
+    show_parser.add_argument('--before', type=parse_date_ms, help='Only photos last shown before this date, e.g. 2024-01-31 (history db)')
+    show_parser.add_argument('--after', type=parse_date_ms, help='Only photos last shown on or after this date (history db)')
+    show_parser.add_argument('--sort', choices=['fileName', 'lastShown', 'location'], help='Sort column (default fileName)')
+    show_parser.add_argument('--desc', action='store_true', help='Sort descending')
+    show_parser.add_argument('--limit', type=int, help='Stop after this many rows')
+    show_parser.add_argument('--output', '-o', help='Export rows to this file instead of printing them')
+    show_parser.add_argument('--format', choices=['csv', 'json', 'ndjson'], help='Export format (default from the --output extension, else csv)')
     
     # Clear DB Command
     clear_parser = subparsers.add_parser('clear-db', help='Clear database contents')
     clear_parser.add_argument('app_host', help='Android App Hostname/IP')
     clear_parser.add_argument('--port', type=int, default=4000, help='App TCP Port (default 4000)')
     clear_parser.add_argument('--db', required=True, choices=['location', 'history'], help='Database to clear')
+    clear_parser.add_argument('--yes', action='store_true', help='Do not ask for confirmation (required in scripts)')
 
     # Report Orientation Command
     report_parser = subparsers.add_parser('report-orientation', help='Report count of landscape/portrait photos')
     report_parser.add_argument('local_dirs', nargs='+', help='Local directories containing photos')
+    report_parser.add_argument('--threads', type=int, default=16, help='Files to read concurrently (default 16)')
+    report_parser.add_argument('--by-dir', action='store_true', help='Also break the counts down per directory')
+    report_parser.add_argument('--json', dest='json_path', help='Write the report as JSON to this file')
+    report_parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help=f'Metadata index location (default {DEFAULT_CACHE_DIR})')
+    report_parser.add_argument('--no-index', action='store_true', help='Do not read or update the metadata index')
+    report_parser.add_argument('--rescan', action='store_true', help='List and stat every directory, not just the ones whose mtime changed')
+    
+    # Encoding Benchmark Command
+    bench_parser = subparsers.add_parser('bench-encode', help='Compare output formats by size and encode time on sample photos')
+    bench_parser.add_argument('local_dirs', nargs='+', help='Local directories containing photos')
+    bench_parser.add_argument('--resolution', default='1920x1080', help='Target screen size WxH (default 1920x1080)')
+    bench_parser.add_argument('--formats', nargs='+', choices=list(ENCODINGS), help='Formats to compare (default all)')
+    bench_parser.add_argument('--limit', type=int, default=50, help='Number of photos to sample (default 50)')
+    bench_parser.add_argument('--quality', type=int, help='Encoder quality, 1-100 (default depends on format)')
+    bench_parser.add_argument('--subsampling', choices=['4:4:4', '4:2:2', '4:2:0'], help='Chroma subsampling for JPEG, HEIC and AVIF')
     
     # Delete All Command
     delete_all_parser = subparsers.add_parser('delete-all', help='Delete ALL photos and data from app')
     delete_all_parser.add_argument('app_host', help='Android App Hostname/IP')
     delete_all_parser.add_argument('--port', type=int, default=4000, help='App TCP Port (default 4000)')
+    delete_all_parser.add_argument('--yes', action='store_true', help='Do not ask for confirmation (required in scripts)')
+
+    # Info Command
+    info_parser = subparsers.add_parser('info', help="Show the app's device info (resolution, features, decoders)")
+    info_parser.add_argument('app_host', help='Android App Hostname/IP')
+    info_parser.add_argument('--port', type=int, default=4000, help='App TCP Port (default 4000)')
+
+    # Delete Command
+    delete_parser = subparsers.add_parser('delete', help='Delete photos from the app by name')
+    delete_parser.add_argument('app_host', help='Android App Hostname/IP')
+    delete_parser.add_argument('names', nargs='+', help='File names as stored on the device')
+    delete_parser.add_argument('--port', type=int, default=4000, help='App TCP Port (default 4000)')
+
+    # Run Command
+    run_parser = subparsers.add_parser('run', help='Run commands from a file or stdin over one connection per device')
+    run_parser.add_argument('script', nargs='?', default='-', help="File with one command per line, e.g. 'show-db 192.168.1.20 --db history' (default: stdin)")
 
     # Install APK Command
     install_parser = subparsers.add_parser('install-apk', help='Install and start release APK via ADB')
@@ -393,29 +2063,110 @@ if __name__ == '__main__':
     install_parser.add_argument('--adb-port', type=int, default=5555, help='ADB Port (default: 5555)')
     install_parser.add_argument('--apk-path', default='../app/build/outputs/apk/release/app-release.apk', help='Path to APK (default: ../app/build/outputs/apk/release/app-release.apk)')
 
-    args = parser.parse_args()
-    
+    return parser
+
+def confirmed(args, batch, prompt):
+    if args.yes:
+        return True
+    if batch:
+        print(f"Not confirmed: add --yes to run {args.command} from a script.")
+        return False
+    return input(prompt).lower() == 'yes'
+
+def run_command(parser, args, sessions, batch=False):
+    """Run one parsed command line, talking to devices over `sessions`."""
     if args.command == 'sync':
-        sync_direct_push(args.app_host, args.port, args.local_dirs)
+        if not args.apply and not args.local_dirs:
+            parser.error('sync: local_dirs is required unless --apply is given')
+        hosts = parse_hosts(args.app_host, args.port)
+        if len(hosts) > 1 and (args.plan or args.apply or args.watch):
+            parser.error('sync: --plan, --apply and --watch take a single device')
+        if args.watch and (args.plan or args.apply):
+            parser.error('sync: --watch cannot be combined with --plan or --apply')
+        
+        use_spool_dir(None if args.no_cache else args.cache_dir)
+        cache = None if args.no_cache else ProcessingCache(args.cache_dir, args.jpeg_cache_mb * 1024 * 1024)
+        index = None if args.no_cache else MetadataIndex(args.cache_dir)
+        if index and args.rescan:
+            index.invalidate()
+        encoding = {"name": args.format, "quality": args.quality, "subsampling": args.subsampling,
+                    "thumbnail": args.thumbnail_size if args.thumbnails else 0}
+        metadata = not args.no_metadata
+        gazetteer_path = (args.gazetteer or default_gazetteer()) if metadata else None
+        if args.gazetteer and not os.path.isfile(args.gazetteer):
+            parser.error(f'sync: gazetteer {args.gazetteer} not found')
+        geocoder = ReverseGeocoder(gazetteer_path, None if args.no_cache else args.cache_dir) if gazetteer_path else None
+        metrics = SyncMetrics(jsonl_path=args.metrics_jsonl) if args.metrics else None
+        profiler = cProfile.Profile() if args.profile else None
+        if profiler:
+            profiler.enable()
+        # Options shared by every way of pushing photos, always passed by keyword
+        push = dict(cache=cache, jobs=args.jobs, decode_mode=args.decode, window=args.window, resume=args.resume,
+                    max_pixels=int(args.max_megapixels * 1e6), index=index, metadata=metadata, geocoder=geocoder,
+                    metrics=metrics)
+        client = sessions.get(*hosts[0])
+        try:
+            if args.plan:
+                plan_sync(client, args.local_dirs, args.plan, cache=cache, encoding=encoding, index=index, metadata=metadata)
+            elif args.apply:
+                apply_sync_plan(client, args.apply, **push)
+            elif args.watch:
+                sync_watch(client, args.local_dirs, encoding=encoding, poll_interval=args.poll, debounce=args.debounce, **push)
+            elif len(hosts) > 1:
+                sync_fleet(sessions, hosts, args.local_dirs, encoding=encoding, **push)
+            else:
+                sync_direct_push(client, args.local_dirs, encoding=encoding, **push)
+        except KeyboardInterrupt:
+            if not args.watch:
+                raise
+            print("\nStopped watching.")
+        finally:
+            if cache:
+                cache.close()
+            if index:
+                index.close()
+            if geocoder:
+                geocoder.close()
+            if profiler:
+                profiler.disable()
+                profiler.dump_stats(args.profile)
+                print(f"Wrote profile to {args.profile} (view with: python3 -m pstats {args.profile})")
+            if metrics:
+                metrics.print_summary()
+                metrics.close()
     elif args.command == 'show-db':
-        show_db(args.app_host, args.port, args.db)
+        filters = {"name": args.name, "location": args.location, "shown_before": args.before, "shown_after": args.after,
+                   "sort": args.sort, "order": "desc" if args.desc else None, "limit": args.limit}
+        show_db(sessions.get(args.app_host, args.port), args.db, {k: v for k, v in filters.items() if v is not None}, args.output, args.format)
     elif args.command == 'clear-db':
-        # Confirm action
-        confirm = input(f"Are you sure you want to CLEAR the {args.db} database? (yes/no): ")
-        if confirm.lower() == 'yes':
-             clear_db(args.app_host, args.port, args.db)
+        if confirmed(args, batch, f"Are you sure you want to CLEAR the {args.db} database? (yes/no): "):
+            clear_db(sessions.get(args.app_host, args.port), args.db)
         else:
             print("Aborted.")
     elif args.command == 'report-orientation':
-        analyze_orientation(args.local_dirs)
+        if args.no_index:
+            analyze_orientation(args.local_dirs, args.threads, None, args.by_dir, args.json_path)
+        else:
+            with MetadataIndex(args.cache_dir) as index:
+                if args.rescan:
+                    index.invalidate()
+                analyze_orientation(args.local_dirs, args.threads, index, args.by_dir, args.json_path, args.rescan)
+    elif args.command == 'bench-encode':
+        width, height = (int(x) for x in args.resolution.lower().split('x'))
+        benchmark_encodings(args.local_dirs, width, height, args.formats, args.limit, args.quality, args.subsampling)
     elif args.command == 'delete-all':
         # Confirm action
         print("WARNING: This will delete ALL photos and database entries from the Android app.")
-        confirm = input("Are you absolutely sure? (yes/no): ")
-        if confirm.lower() == 'yes':
-             delete_all_photos(args.app_host, args.port)
+        if confirmed(args, batch, "Are you absolutely sure? (yes/no): "):
+            delete_all_photos(sessions.get(args.app_host, args.port))
         else:
             print("Aborted.")
+    elif args.command == 'info':
+        show_device_info(sessions.get(args.app_host, args.port))
+    elif args.command == 'delete':
+        delete_photos(sessions.get(args.app_host, args.port), args.names)
+    elif args.command == 'run':
+        run_script(parser, args.script, sessions)
     elif args.command == 'install-apk':
         adb_path = os.path.expanduser('~/Library/Android/sdk/platform-tools/adb')
         if not os.path.exists(adb_path):
@@ -454,3 +2205,9 @@ if __name__ == '__main__':
              print("Error: 'adb' not found. Please verify Android SDK installation.")
     else:
         parser.print_help()
+
+if __name__ == '__main__':
+    parser = build_parser()
+    args = parser.parse_args()
+    with DeviceSessions(args.timeout, args.connect_timeout, args.retries) as sessions:
+        run_command(parser, args, sessions)
@@ -0,0 +1,317 @@
+import collections
+import concurrent.futures
+import hashlib
+import os
+import sqlite3
+import time
+
+from PIL import Image, ExifTags
+
+from sync_cache import DEFAULT_CACHE_DIR
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.heic')
+
+# Directories listed at once by scan_sources; listing is mostly waiting on the disk or NAS
+SCAN_THREADS = 16
+# A directory modified this recently could change again within the same mtime tick,
+# so its mtime isn't trusted and it is listed again on the next scan
+RACY_WINDOW_NS = 2 * 10**9
+
+# One photo found by scan_sources. Has st_size and st_mtime_ns, so it can stand in
+# for os.stat() results. width/height/orientation are None until a header was read;
+# taken (ISO date-time) and latitude/longitude are then None if the EXIF has none.
+SourceFile = collections.namedtuple('SourceFile', 'path st_size st_mtime_ns width height orientation upload_stem '
+                                                  'taken latitude longitude')
+
+
+def get_upload_stem(filepath):
+    """
+    The stable name a file is stored under on the device, without the extension.
+    Depends only on the source path, so it can be computed without decoding.
+    """
+    return _upload_stem(os.path.abspath(filepath), os.path.basename(filepath))
+
+
+def _upload_stem(abs_path, base):
+    path_hash = hashlib.md5(abs_path.encode('utf-8')).hexdigest()[:8]
+
+    # Get stem (ignore extension)
+    last_dot = base.rfind('.')
+    stem = base[:last_dot] if last_dot != -1 else base
+
+    return f"{stem}_{path_hash}"
+
+
+def get_upload_filename(filepath, ext='.jpg'):
+    """Derive the stable name a file is stored under on the device (see get_upload_stem)."""
+    return get_upload_stem(filepath) + ext
+
+
+def read_image_header(filepath):
+    """
+    Return (width, height, orientation) for an image without decoding its pixels.
+    width/height are as displayed, i.e. already swapped for EXIF rotations.
+    """
+    return read_image_metadata(filepath)[:3]
+
+
+def read_image_metadata(filepath):
+    """
+    read_image_header plus the EXIF date taken (ISO 'YYYY-MM-DDTHH:MM:SS') and GPS
+    position in degrees: (width, height, orientation, taken, latitude, longitude).
+    The last three are None when the photo doesn't have them.
+    """
+    with Image.open(filepath) as img:
+        width, height = img.size
+        # Image.open only parses headers; use the raw EXIF block rather than getexif(),
+        # which loads the whole image for some formats (e.g. PNG).
+        exif_bytes = img.info.get("exif")
+    exif = Image.Exif()
+    if exif_bytes:
+        exif.load(exif_bytes)
+    orientation = exif.get(ExifTags.Base.Orientation, 1)
+    if orientation in (5, 6, 7, 8):
+        width, height = height, width
+    return (width, height, orientation, _exif_date_taken(exif)) + _exif_position(exif)
+
+
+def _exif_date_taken(exif):
+    value = exif.get_ifd(ExifTags.IFD.Exif).get(ExifTags.Base.DateTimeOriginal) or exif.get(ExifTags.Base.DateTime)
+    if not isinstance(value, str):
+        return None
+    # "YYYY:MM:DD HH:MM:SS", sometimes with trailing NULs or without the time
+    date, _, clock = value.strip('\x00 ').partition(' ')
+    parts = date.split(':')
+    if len(parts) != 3 or not all(p.isdigit() for p in parts) or parts[0] == '0000':
+        return None
+    return '-'.join(parts) + ('T' + clock if clock else '')
+
+
+def _exif_position(exif):
+    gps = exif.get_ifd(ExifTags.IFD.GPSInfo)
+    try:
+        latitude = _degrees(gps[ExifTags.GPS.GPSLatitude], gps.get(ExifTags.GPS.GPSLatitudeRef), 'S')
+        longitude = _degrees(gps[ExifTags.GPS.GPSLongitude], gps.get(ExifTags.GPS.GPSLongitudeRef), 'W')
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        return None, None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180) or (latitude == 0 and longitude == 0):
+        return None, None  # unset fields some cameras fill with zeros
+    return latitude, longitude
+
+
+def _degrees(dms, ref, negative_ref):
+    degrees, minutes, seconds = (float(x) for x in dms)
+    value = degrees + minutes / 60 + seconds / 3600
+    if isinstance(ref, bytes):
+        ref = ref.decode('ascii', 'replace')
+    return -value if (ref or '').strip('\x00 ').upper() == negative_ref else value
+
+
+class MetadataIndex:
+    """
+    Persistent index of the photo trees: every directory with its mtime, and every
+    photo with its size, mtime, upload name and (once read) displayed dimensions,
+    EXIF orientation, date taken and GPS position. Filled in by scan_sources; per-file
+    data is valid while the file's mtime and size are unchanged.
+    """
+
+    VERSION = 3
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(cache_dir, 'metadata.sqlite3'))
+        if self.db.execute("PRAGMA user_version").fetchone()[0] < self.VERSION:
+            # Older versions lack columns (v1: scan data, v2: date and position); rebuilt on the next scan
+            self.db.execute("DROP TABLE IF EXISTS files")
+            self.db.execute(f"PRAGMA user_version = {self.VERSION}")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                dir TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                width INTEGER,
+                height INTEGER,
+                orientation INTEGER,
+                upload_stem TEXT NOT NULL,
+                taken TEXT,
+                latitude REAL,
+                longitude REAL
+            )""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS files_dir ON files (dir)")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS dirs (
+                path TEXT PRIMARY KEY,
+                parent TEXT,
+                mtime_ns INTEGER NOT NULL
+            )""")
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def load_tree(self):
+        """
+        Snapshot of the index as ({dir: (parent, mtime_ns)}, {dir: {path: SourceFile}}),
+        read once per scan so the scan itself never waits on SQLite.
+        """
+        dirs = {path: (parent, mtime_ns) for path, parent, mtime_ns in self.db.execute("SELECT * FROM dirs")}
+        files = collections.defaultdict(dict)
+        for path, directory, size, mtime_ns, width, height, orientation, stem, taken, lat, lon in self.db.execute("SELECT * FROM files"):
+            files[directory][path] = SourceFile(path, size, mtime_ns, width, height, orientation, stem, taken, lat, lon)
+        return dirs, files
+
+    def store_dir(self, path, parent, mtime_ns, files, removed=()):
+        """Record a freshly listed directory: its mtime, its photos, and the photos that are gone."""
+        self.db.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)", (path, parent, mtime_ns))
+        self.db.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in removed])
+        self.db.executemany(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(f.path, path, f.st_size, f.st_mtime_ns, f.width, f.height, f.orientation, f.upload_stem,
+              f.taken, f.latitude, f.longitude) for f in files])
+
+    def invalidate(self):
+        """Distrust every directory mtime, so the next scan lists and stats everything again."""
+        self.db.execute("UPDATE dirs SET mtime_ns = 0")
+
+    def remove_dir(self, path):
+        """Forget a directory that no longer exists, with everything below it."""
+        pattern = path.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + os.sep + '%'
+        for table, column in (("files", "dir"), ("dirs", "path")):
+            self.db.execute(f"DELETE FROM {table} WHERE {column} = ? OR {column} LIKE ? ESCAPE '\\'", (path, pattern))
+
+    def record(self, path, st, width, height, orientation, taken=None, latitude=None, longitude=None):
+        """Store the header of a photo (see read_image_metadata), adding it if the scan has not seen it yet."""
+        path = os.path.abspath(path)
+        self.db.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, os.path.dirname(path), st.st_size, st.st_mtime_ns, width, height, orientation, get_upload_stem(path),
+             taken, latitude, longitude))
+
+    def commit(self):
+        self.db.commit()
+
+
+def _list_dir(path, known_mtime_ns, known_files, extensions):
+    """
+    Scanner worker: (mtime_ns, [(path, name, size, mtime_ns)], [subdir]) for a directory,
+    or None if it is gone. If its mtime is still known_mtime_ns, it is not listed again
+    and subdirs is None: the known_files paths are stat'ed instead (an edit in place
+    doesn't change the directory's mtime), or files is None if known_files is None.
+    Like os.walk, symlinks to directories are not followed.
+    """
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+        if mtime_ns == known_mtime_ns:
+            if known_files is None:
+                return mtime_ns, None, None
+            try:
+                files = []
+                for filepath in known_files:
+                    st = os.stat(filepath)
+                    files.append((filepath, os.path.basename(filepath), st.st_size, st.st_mtime_ns))
+                return mtime_ns, files, None
+            except OSError:
+                pass  # removed within the same mtime tick; list the directory after all
+        files = []
+        subdirs = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            subdirs.append(entry.path)
+                    elif entry.name.lower().endswith(extensions):
+                        st = entry.stat()
+                        files.append((entry.path, entry.name, st.st_size, st.st_mtime_ns))
+                except OSError:
+                    continue
+        return mtime_ns, files, subdirs
+    except OSError:
+        return None
+
+
+def scan_sources(local_dirs, index=None, threads=SCAN_THREADS, recursive=True, extensions=IMAGE_EXTENSIONS,
+                 verify_files=True):
+    """
+    Yield a SourceFile (absolute path) for every photo under local_dirs, listing
+    directories in parallel with os.scandir. Files are yielded a directory at a
+    time, as listings complete.
+
+    With an index, a directory whose mtime is unchanged since the last scan is not
+    listed again: its photos come from the index, and headers read before are kept
+    while they match. With verify_files they are stat'ed, so size and mtime are
+    current even after an edit in place; without, the scan costs one stat() per
+    directory and callers that only need names get the index's view.
+    index.invalidate() makes the next scan list every directory again.
+    """
+    known_dirs, known_files = index.load_tree() if index else ({}, {})
+    children = collections.defaultdict(set)
+    for path, (parent, _) in known_dirs.items():
+        children[parent].add(path)
+
+    def known_mtime(path):
+        return known_dirs[path][1] if path in known_dirs else None
+
+    def known_paths(path):
+        return list(known_files.get(path, ())) if verify_files else None
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as pool:
+        pending = {}
+        for local_dir in local_dirs:
+            root = os.path.abspath(local_dir)
+            if not os.path.isdir(root):
+                print(f"Warning: {local_dir} not found.")
+                continue
+            print(f"Scanning {local_dir}...")
+            pending[pool.submit(_list_dir, root, known_mtime(root), known_paths(root), extensions)] = (root, None)
+
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                path, parent = pending.pop(future)
+                listing = future.result()
+                if listing is None:
+                    if index:
+                        index.remove_dir(path)
+                    continue
+
+                mtime_ns, files, subdirs = listing
+                old = known_files.get(path, {})
+                # Unchanged and not verified: the photos as the index has them
+                found = [] if files is not None else list(old.values())
+                changed = False
+                for filepath, name, size, file_mtime_ns in files or ():
+                    entry = old.get(filepath)
+                    if not entry or entry.st_size != size or entry.st_mtime_ns != file_mtime_ns:
+                        # Paths below an abspath'd root are already absolute and normalized
+                        entry = SourceFile(filepath, size, file_mtime_ns, None, None, None,
+                                           entry.upload_stem if entry else _upload_stem(filepath, name),
+                                           None, None, None)
+                        changed = True
+                    found.append(entry)
+                if subdirs is None:
+                    # Not listed again: only files edited in place can have changed
+                    subdirs = children[path]
+                    if index and changed:
+                        index.store_dir(path, parent, mtime_ns, found)
+                elif index:
+                    racy = time.time_ns() - mtime_ns < RACY_WINDOW_NS
+                    index.store_dir(path, parent, 0 if racy else mtime_ns, found, old.keys() - {f.path for f in found})
+                    for gone in children[path] - set(subdirs):
+                        index.remove_dir(gone)
+
+                if recursive:
+                    for subdir in subdirs:
+                        pending[pool.submit(_list_dir, subdir, known_mtime(subdir), known_paths(subdir),
+                                            extensions)] = (subdir, path)
+                yield from found
+    if index:
+        index.commit()
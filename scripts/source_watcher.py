@@ -0,0 +1,243 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+# In a set of changed paths: events were lost, everything has to be compared again
+RESCAN = None
+
+DEFAULT_POLL_INTERVAL = 30.0
+# inotify does not see changes made by other machines on these
+NETWORK_FILESYSTEMS = {'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'afs', '9p', 'fuse.sshfs', 'fuse.rclone'}
+
+# <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, name length
+
+
+def is_network_mount(path):
+    """True if path is on a filesystem listed in NETWORK_FILESYSTEMS (Linux only; False elsewhere)."""
+    path = os.path.realpath(path)
+    best, fstype = '', None
+    try:
+        with open('/proc/mounts') as f:
+            for line in f:
+                fields = line.split()
+                mount_point = fields[1].replace('\\040', ' ')
+                if (path == mount_point or path.startswith(mount_point.rstrip('/') + '/')) and len(mount_point) >= len(best):
+                    best, fstype = mount_point, fields[2]
+    except OSError:
+        return False
+    return fstype in NETWORK_FILESYSTEMS
+
+
+class InotifyWatcher:
+    """
+    Reports changed photo files and directories under a set of trees via Linux inotify.
+    Files count as changed once they are closed after writing or moved in, so
+    half-copied photos are never reported. Every directory needs its own watch.
+    Only files ending in one of `extensions` are reported; `known` holds those
+    present when watching started.
+    """
+
+    def __init__(self, local_dirs, extensions):
+        self.extensions = extensions
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.paths = {}  # wd -> directory
+        self.wds = {}  # directory -> wd
+        self.known = set()
+        try:
+            for local_dir in local_dirs:
+                self.known |= self.add_tree(local_dir)
+        except Exception:
+            # e.g. out of watches: make_watcher falls back to polling, so don't leak the fd
+            self.close()
+            raise
+
+    def close(self):
+        os.close(self.fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_tree(self, top):
+        """Watch top and every directory below it. Returns the photos found there."""
+        found = set()
+        for root, dirs, files in os.walk(top):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(root), WATCH_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, f"Cannot watch {root}: {os.strerror(errno)} (see fs.inotify.max_user_watches)")
+            self.paths[wd] = root
+            self.wds[root] = wd
+            found.update(os.path.join(root, name) for name in files if name.lower().endswith(self.extensions))
+        return found
+
+    def _remove_tree(self, top):
+        prefix = top + os.sep
+        for path in [p for p in self.wds if p == top or p.startswith(prefix)]:
+            wd = self.wds.pop(path)
+            self.paths.pop(wd, None)
+            self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout=None):
+        """Wait up to timeout seconds (None: forever) for events. Returns the set of changed paths."""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return set()
+        data = os.read(self.fd, 64 * 1024)
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+            offset += EVENT_HEADER.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                changed.add(RESCAN)
+                continue
+            if mask & IN_IGNORED:
+                self.wds.pop(self.paths.pop(wd, None), None)
+                continue
+            directory = self.paths.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # Files may land in it before the watch exists; the caller rescans the directory
+                    try:
+                        self.add_tree(path)
+                    except OSError as e:
+                        print(f"Warning: {e}")
+                elif mask & (IN_MOVED_FROM | IN_DELETE):
+                    self._remove_tree(path)
+                changed.add(path)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE) and path.lower().endswith(self.extensions):
+                changed.add(path)
+        return changed
+
+
+class PollingWatcher:
+    """
+    Finds changes by re-listing the trees every `interval` seconds and comparing
+    (mtime, size), for network mounts and systems without inotify. A new or changed
+    file is only reported once it looked the same on two polls in a row, so files
+    still being copied are left alone.
+    """
+
+    def __init__(self, local_dirs, extensions, interval=DEFAULT_POLL_INTERVAL):
+        self.local_dirs = local_dirs
+        self.extensions = extensions
+        self.interval = interval
+        self.snapshot = self._scan()
+        self.pending = {}  # path -> signature seen on the last poll, not yet reported
+        self.known = set(self.snapshot)
+        self.next_poll = time.monotonic() + interval
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _scan(self):
+        snapshot = {}
+        stack = list(self.local_dirs)
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.name.lower().endswith(self.extensions):
+                            st = entry.stat()
+                            snapshot[entry.path] = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                continue
+        return snapshot
+
+    def read(self, timeout=None):
+        """Wait up to timeout seconds (None: until a poll finds something). Returns the set of changed paths."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.next_poll - time.monotonic()
+            if deadline is not None and time.monotonic() + max(wait, 0) > deadline:
+                time.sleep(max(0.0, deadline - time.monotonic()))
+                return set()
+            if wait > 0:
+                time.sleep(wait)
+            self.next_poll = time.monotonic() + self.interval
+
+            current = self._scan()
+            changed = set(self.snapshot) - set(current)
+            for path, signature in current.items():
+                if self.snapshot.get(path) == signature:
+                    self.pending.pop(path, None)
+                elif self.pending.get(path) == signature:
+                    changed.add(path)
+                    del self.pending[path]
+                else:
+                    self.pending[path] = signature
+                    current[path] = self.snapshot.get(path)  # compare with the old state next time
+            self.snapshot = {path: sig for path, sig in current.items() if sig is not None}
+            self.pending = {path: sig for path, sig in self.pending.items() if path in current}
+            if changed:
+                return changed
+
+
+def make_watcher(local_dirs, extensions, poll_interval=None):
+    """inotify where it can see every change, polling on network mounts, other systems or when asked to."""
+    if poll_interval is None and sys.platform.startswith('linux'):
+        network = [d for d in local_dirs if is_network_mount(d)]
+        if not network:
+            try:
+                return InotifyWatcher(local_dirs, extensions)
+            except OSError as e:
+                print(f"Cannot use inotify ({e}); polling instead.")
+        else:
+            print(f"{', '.join(network)} on a network mount; polling for changes.")
+    return PollingWatcher(local_dirs, extensions, poll_interval or DEFAULT_POLL_INTERVAL)
+
+
+def wait_for_changes(watcher, debounce=2.0, max_delay=30.0):
+    """
+    Block until something changes, then keep collecting until nothing has changed for
+    `debounce` seconds (or `max_delay` passed), so a burst like a camera import is
+    handled as one batch. Returns the set of changed paths (may contain RESCAN).
+    """
+    changed = set()
+    while not changed:
+        changed = watcher.read(None)
+    deadline = time.monotonic() + max_delay
+    quiet_at = time.monotonic() + debounce
+    while True:
+        remaining = min(quiet_at, deadline) - time.monotonic()
+        if remaining <= 0:
+            return changed
+        more = watcher.read(remaining)
+        if more:
+            # Events that aren't changes (like a file being created, before it is written) don't count
+            changed |= more
+            quiet_at = time.monotonic() + debounce
@@ -0,0 +1,204 @@
+import os
+import sqlite3
+import hashlib
+import time
+
+DEFAULT_CACHE_DIR = os.path.expanduser('~/.cache/slideshowai')
+
+
+def resolution_key(target_width, target_height):
+    """process_image only cares about the (max, min) pair, so 1920x1200 and 1200x1920 share entries."""
+    return f"{max(target_width, target_height)}x{min(target_width, target_height)}"
+
+
+class ProcessingCache:
+    """
+    Persistent record of what sync has already processed.
+
+    The manifest maps (absolute path, resolution) to the mtime/size the file had
+    when it was processed, plus the upload filename and a hash of the encoded
+    bytes. A hit means the source is unchanged, so sync can make its decision
+    without decoding anything.
+
+    Optionally, encoded photos (in whatever encoding the resolution key names) are
+    kept on disk as well, bounded by max_bytes and evicted least-recently-used first.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=0):
+        self.cache_dir = cache_dir
+        self.blob_dir = os.path.join(cache_dir, 'jpeg')
+        self.max_bytes = max_bytes
+        os.makedirs(self.blob_dir, exist_ok=True)
+
+        self.db = sqlite3.connect(os.path.join(cache_dir, 'manifest.sqlite3'))
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS manifest (
+                path TEXT NOT NULL,
+                resolution TEXT NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                upload_name TEXT NOT NULL,
+                encoded_size INTEGER NOT NULL,
+                encoded_sha1 TEXT NOT NULL,
+                PRIMARY KEY (path, resolution)
+            )""")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                blob_key TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )""")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS remote_files (
+                device TEXT NOT NULL,
+                name TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                sha1 TEXT NOT NULL,
+                PRIMARY KEY (device, name)
+            )""")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS remote_tokens (
+                device TEXT PRIMARY KEY,
+                token TEXT NOT NULL
+            )""")
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- Manifest ---
+
+    def lookup(self, filepath, resolution, st=None):
+        """Return the manifest row as a dict if the file is unchanged, else None."""
+        abs_path = os.path.abspath(filepath)
+        if st is None:
+            st = os.stat(abs_path)
+        row = self.db.execute(
+            "SELECT mtime_ns, size, upload_name, encoded_size, encoded_sha1 FROM manifest "
+            "WHERE path = ? AND resolution = ?", (abs_path, resolution)).fetchone()
+        if row is None or row[0] != st.st_mtime_ns or row[1] != st.st_size:
+            return None
+        return {"upload_name": row[2], "encoded_size": row[3], "encoded_sha1": row[4]}
+
+    def has_entry(self, filepath, resolution):
+        """True if the file was processed before, whether or not it has changed since."""
+        row = self.db.execute(
+            "SELECT 1 FROM manifest WHERE path = ? AND resolution = ?",
+            (os.path.abspath(filepath), resolution)).fetchone()
+        return row is not None
+
+    def last_encoded_size(self, filepath, resolution):
+        """Encoded size from the last time this file was processed, even if it has changed since."""
+        row = self.db.execute(
+            "SELECT encoded_size FROM manifest WHERE path = ? AND resolution = ?",
+            (os.path.abspath(filepath), resolution)).fetchone()
+        return row[0] if row else None
+
+    def average_encoded_size(self, resolution):
+        row = self.db.execute("SELECT AVG(encoded_size) FROM manifest WHERE resolution = ?", (resolution,)).fetchone()
+        return int(row[0]) if row[0] else None
+
+    def record(self, filepath, resolution, upload_name, image_data, st=None):
+        abs_path = os.path.abspath(filepath)
+        if st is None:
+            st = os.stat(abs_path)
+        sha1 = hashlib.sha1(image_data).hexdigest()
+        self.db.execute(
+            "INSERT OR REPLACE INTO manifest VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (abs_path, resolution, st.st_mtime_ns, st.st_size, upload_name, len(image_data), sha1))
+        if self.max_bytes > 0:
+            self._put_blob(self._blob_key(abs_path, resolution, st), image_data)
+
+    def commit(self):
+        self.db.commit()
+
+    # --- Mirror of each device's file manifest (see list_changes) ---
+
+    def remote_token(self, device):
+        row = self.db.execute("SELECT token FROM remote_tokens WHERE device = ?", (device,)).fetchone()
+        return row[0] if row else None
+
+    def apply_remote_changes(self, device, response):
+        """
+        Apply a list_changes response to the stored mirror for device.
+        Returns the full {name: sha1} mapping of what the device now holds.
+        """
+        if response.get("full"):
+            self.db.execute("DELETE FROM remote_files WHERE device = ?", (device,))
+        self.db.executemany(
+            "DELETE FROM remote_files WHERE device = ? AND name = ?",
+            [(device, name) for name in response.get("deleted", [])])
+        self.db.executemany(
+            "INSERT OR REPLACE INTO remote_files VALUES (?, ?, ?, ?)",
+            [(device, f["name"], f["size"], f["sha1"]) for f in response.get("files", [])])
+        self.db.execute("INSERT OR REPLACE INTO remote_tokens VALUES (?, ?)", (device, response["token"]))
+        self.db.commit()
+        return dict(self.db.execute("SELECT name, sha1 FROM remote_files WHERE device = ?", (device,)))
+
+    def remote_sizes(self, device):
+        return dict(self.db.execute("SELECT name, size FROM remote_files WHERE device = ?", (device,)))
+
+    # --- Encoded photo cache ---
+
+    def _blob_key(self, abs_path, resolution, st):
+        raw = f"{abs_path}|{resolution}|{st.st_mtime_ns}|{st.st_size}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _blob_path(self, blob_key, ext='.bin'):
+        # Neutral extension: a blob may be JPEG, WebP, HEIC or AVIF. '.jpg' is how older versions stored them.
+        return os.path.join(self.blob_dir, blob_key[:2], blob_key + ext)
+
+    def get_encoded(self, filepath, resolution, st=None):
+        """Return cached encoded bytes for an unchanged file, or None."""
+        if self.max_bytes <= 0:
+            return None
+        abs_path = os.path.abspath(filepath)
+        if st is None:
+            st = os.stat(abs_path)
+        blob_key = self._blob_key(abs_path, resolution, st)
+        path = self._blob_path(blob_key)
+        try:
+            if not os.path.exists(path) and os.path.exists(self._blob_path(blob_key, '.jpg')):
+                os.replace(self._blob_path(blob_key, '.jpg'), path)
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            self.db.execute("DELETE FROM blobs WHERE blob_key = ?", (blob_key,))
+            return None
+        self.db.execute("UPDATE blobs SET last_used = ? WHERE blob_key = ?", (time.time(), blob_key))
+        return data
+
+    def _put_blob(self, blob_key, data):
+        if len(data) > self.max_bytes:
+            return
+        path = self._blob_path(blob_key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.db.execute("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?)", (blob_key, len(data), time.time()))
+        self._evict()
+
+    def _evict(self):
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for blob_key, size in self.db.execute(
+                "SELECT blob_key, size FROM blobs ORDER BY last_used ASC").fetchall():
+            for ext in ('.bin', '.jpg'):
+                try:
+                    os.remove(self._blob_path(blob_key, ext))
+                except OSError:
+                    pass
+            self.db.execute("DELETE FROM blobs WHERE blob_key = ?", (blob_key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
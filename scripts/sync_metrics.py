@@ -0,0 +1,142 @@
+import array
+import contextlib
+import heapq
+import json
+import math
+import threading
+import time
+
+
+class SyncMetrics:
+    """
+    Lightweight per-stage timing for sync. Each sample costs two perf_counter() calls and
+    an array append, so it is cheap enough to leave on for every run.
+
+    Stages are free-form names ('walk', 'decode', 'resize', 'encode', 'ack', ...).
+    Per-file stage times can come from worker processes (see record_file).
+    Optionally streams one JSON line per file to jsonl_path.
+    Safe to record into from several threads (upload ack readers, fleet senders).
+    """
+
+    def __init__(self, slowest=10, jsonl_path=None):
+        self.samples = {}  # stage -> array of seconds
+        self.counters = {}  # name -> int (bytes in/out, files, ...)
+        self.slowest_n = slowest
+        self.slowest = []  # min-heap of (seconds, path, stages)
+        self.started = time.perf_counter()
+        self.jsonl = open(jsonl_path, 'a') if jsonl_path else None
+        self.lock = threading.Lock()
+
+    def close(self):
+        if self.jsonl:
+            self.jsonl.write(json.dumps(dict(self.as_dict(), type="summary")) + '\n')
+            self.jsonl.close()
+            self.jsonl = None
+
+    # --- Recording ---
+
+    def record(self, stage, seconds):
+        with self.lock:
+            samples = self.samples.get(stage)
+            if samples is None:
+                samples = self.samples[stage] = array.array('d')
+            samples.append(seconds)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def timed_iter(self, name, iterable):
+        """Yield from iterable, charging the time spent producing each item to stage `name`."""
+        it = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                self.record(name, time.perf_counter() - start)
+                return
+            self.record(name, time.perf_counter() - start)
+            yield item
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def record_file(self, path, stages):
+        """Record the {stage: seconds} measured while processing one file."""
+        for stage, seconds in stages.items():
+            self.record(stage, seconds)
+        total = sum(stages.values())
+        entry = (total, path, stages)
+        if len(self.slowest) < self.slowest_n:
+            heapq.heappush(self.slowest, entry)
+        elif total > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+        if self.jsonl:
+            self.jsonl.write(json.dumps({"type": "file", "path": path, "seconds": round(total, 6),
+                                         "stages": {k: round(v, 6) for k, v in stages.items()}}) + '\n')
+
+    # --- Reporting ---
+
+    @staticmethod
+    def _percentile(sorted_samples, fraction):
+        if not sorted_samples:
+            return 0.0
+        return sorted_samples[min(len(sorted_samples) - 1, int(fraction * len(sorted_samples)))]
+
+    @staticmethod
+    def _histogram(samples):
+        """Counts per power-of-two millisecond bucket, keyed by the bucket's upper bound ('<1ms', '<2ms', ...)."""
+        buckets = {}
+        for seconds in samples:
+            bound = 2 ** max(0, math.ceil(math.log2(max(seconds * 1000, 1e-9))))
+            buckets[bound] = buckets.get(bound, 0) + 1
+        return {f"<{bound}ms": buckets[bound] for bound in sorted(buckets)}
+
+    def stage_stats(self):
+        stats = {}
+        for stage, samples in self.samples.items():
+            ordered = sorted(samples)
+            stats[stage] = {
+                "count": len(ordered),
+                "total_s": round(sum(ordered), 6),
+                "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+                "p50_ms": round(self._percentile(ordered, 0.5) * 1000, 3),
+                "p95_ms": round(self._percentile(ordered, 0.95) * 1000, 3),
+                "max_ms": round(ordered[-1] * 1000, 3),
+                "histogram": self._histogram(ordered),
+            }
+        return stats
+
+    def as_dict(self):
+        return {
+            "elapsed_s": round(time.perf_counter() - self.started, 3),
+            "counters": dict(self.counters),
+            "stages": self.stage_stats(),
+            "slowest": [{"path": path, "seconds": round(total, 6), "stages": stages}
+                        for total, path, stages in sorted(self.slowest, reverse=True)],
+        }
+
+    def print_summary(self):
+        elapsed = time.perf_counter() - self.started
+        print(f"\nSync Metrics ({elapsed:.2f}s wall)")
+        print("-" * 78)
+        print(f"{'Stage':<16} | {'Count':>7} | {'Total s':>8} | {'Mean ms':>8} | {'p50 ms':>8} | {'p95 ms':>8} | {'Max ms':>8}")
+        print("-" * 78)
+        for stage, s in self.stage_stats().items():
+            print(f"{stage:<16} | {s['count']:>7} | {s['total_s']:>8.2f} | {s['mean_ms']:>8.2f} | "
+                  f"{s['p50_ms']:>8.2f} | {s['p95_ms']:>8.2f} | {s['max_ms']:>8.2f}")
+        print("-" * 78)
+        for name, value in sorted(self.counters.items()):
+            shown = f"{value / 1e6:.2f} MB" if name.endswith('bytes') else str(value)
+            print(f"{name:<24} {shown}")
+        if self.slowest:
+            print(f"\nSlowest {len(self.slowest)} files:")
+            for total, path, stages in sorted(self.slowest, reverse=True):
+                detail = ", ".join(f"{k} {v * 1000:.0f}ms" for k, v in stages.items())
+                print(f"  {total * 1000:8.1f}ms  {path}  ({detail})")
@@ -0,0 +1,93 @@
+"""
+End-to-end checks of sync_direct_push against the in-process FakeDevice.
+Run from scripts/: python3 -m pytest test_sync.py
+"""
+import os
+
+import pytest
+from PIL import Image
+
+import manage_app
+from device_connection import DeviceClient
+from fake_device import FakeDevice, LinkShaper
+from source_index import MetadataIndex
+from sync_cache import ProcessingCache
+
+# Old enough that the metadata index trusts the directory mtime (see RACY_WINDOW_NS)
+PAST = 1_600_000_000
+
+
+def make_photo(path, seed, size=(640, 480)):
+    Image.effect_noise(size, 64 + seed).convert('RGB').save(path, quality=95)
+    os.utime(path, (PAST + seed, PAST + seed))
+
+
+@pytest.fixture
+def photos(tmp_path):
+    src = tmp_path / 'photos'
+    src.mkdir()
+    for i in range(3):
+        make_photo(src / f'p{i}.jpg', i)
+    os.utime(src, (PAST, PAST))
+    return src
+
+
+@pytest.fixture
+def state(tmp_path):
+    cache = ProcessingCache(str(tmp_path / 'cache'))
+    index = MetadataIndex(str(tmp_path / 'cache'))
+    yield cache, index
+    cache.close()
+    index.close()
+
+
+def sync(device, src, state, **options):
+    cache, index = state
+    with DeviceClient(*device.address) as client:
+        manage_app.sync_direct_push(client, [str(src)], cache=cache, index=index, **options)
+
+
+def device_files(device):
+    return {name: entry[1] for name, entry in device.manifest.items() if not entry[3]}
+
+
+def test_resync_without_changes_sends_nothing(photos, state):
+    with FakeDevice() as device:
+        sync(device, photos, state)
+        assert len(device_files(device)) == 3
+        received = device.stats["files_received"]
+
+        sync(device, photos, state)
+        assert device.stats["files_received"] == received
+        assert device.stats["files_deleted"] == 0
+
+
+def test_photo_edited_in_place_is_pushed_again(photos, state):
+    with FakeDevice() as device:
+        sync(device, photos, state)
+        before = device_files(device)
+
+        # Same name, new pixels; writing an existing file leaves the directory's mtime alone
+        make_photo(photos / 'p1.jpg', 10)
+        os.utime(photos / 'p1.jpg', (PAST + 100, PAST + 100))
+        os.utime(photos, (PAST, PAST))
+        sync(device, photos, state)
+
+        after = device_files(device)
+        assert after.keys() == before.keys()
+        changed = [name for name in after if after[name] != before[name]]
+        assert len(changed) == 1 and changed[0].startswith('p1_')
+        assert device.stats["files_deleted"] == 0
+
+
+def test_resume_finishes_over_a_dropping_link(photos, state):
+    # Noise encodes to a few MB at the device's resolution, so uploads span several chunks and drops
+    for i in range(3):
+        make_photo(photos / f'p{i}.jpg', i, size=(1920, 1200))
+    shaper = LinkShaper(drop_rate=0.5, seed=1)
+    with FakeDevice(shaper=shaper) as device:
+        sync(device, photos, state, resume=True)
+
+        assert device.stats["drops"] > 0
+        assert len(device_files(device)) == 3
+        assert not device.partials